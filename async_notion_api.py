@@ -0,0 +1,363 @@
+import asyncio
+import os
+import threading
+from itertools import chain
+
+from notion_client.errors import APIResponseError
+
+from chunker import REQUEST_BYTES, paginate_blocks
+from notion_api import (
+    NotionAPIBase, now_title, page_result, appended_result, error_result,
+    is_schema_error, is_missing_page_error
+)
+from period_pages import group_by_period
+from attachments import attachment_block, upload_parts
+from transport import create_async_notion_client, create_async_transport
+
+# 同時に送信中にしておくページ作成の数（NOTION_CONCURRENCY）
+DEFAULT_CONCURRENCY = 4
+
+
+class AsyncNotionAPI(NotionAPIBase):
+    """notion_client.AsyncClient を使う NotionAPI（メソッドはすべてコルーチン）
+
+    送信内容の組み立てとデータベース構造の扱いは NotionAPI と共通。
+    同時に送信するページ作成は concurrency 件までに抑える（レート制限は別途クライアント側）。
+    """
+
+    def __init__(self, schema_cache=None, concurrency=DEFAULT_CONCURRENCY, transport=None, client=None,
+                 **target):
+        super().__init__(schema_cache, **target)
+        self.client = client or create_async_notion_client(self.api_key, transport=transport)
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._schema_lock = asyncio.Lock()
+        self._period_lock = asyncio.Lock()
+        # 送信中のページ作成の数（ループのスレッドからのみ更新する）
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+
+    async def create_page(self, title, content, attachments=None):
+        """Notionデータベースに新しいページを作成（追記モードなら期間ページに追記）"""
+        if self.storage_mode != 'page':
+            return await self.append_clips([(title or now_title(), content)], attachments)
+        try:
+            page_name_date = title or now_title()
+            attachment_blocks = await self._upload_attachments(attachments)
+
+            def build():
+                properties, blocks = self._page_content(page_name_date, content)
+                return properties, chain(blocks, attachment_blocks)
+
+            return page_result(await self._create_with_schema_retry(build))
+
+        except Exception as e:
+            return error_result(e)
+
+    async def create_batch_page(self, clips):
+        """複数のクリップを1ページにまとめて作成（NotionAPI.create_batch_page と同じ形式）"""
+        if self.storage_mode != 'page':
+            return await self.append_clips(clips)
+        try:
+            return page_result(await self._create_with_schema_retry(lambda: self._batch_content(clips)))
+
+        except Exception as e:
+            return error_result(e)
+
+    async def create_pages(self, clips):
+        """(タイトル, 本文) のリストをそれぞれページにする（最大 concurrency 件を同時に送信）"""
+        if self.storage_mode != 'page':
+            # 追記モードでは順番を保って1回で追記する
+            result = await self.append_clips(clips)
+            return [result] * len(clips)
+        return await asyncio.gather(*(self.create_page(title, content) for title, content in clips))
+
+    async def append_clips(self, clips, attachments=None):
+        """クリップを期間ページに追記（NotionAPI.append_clips と同じ）"""
+        try:
+            await self._ensure_schema()
+            attachment_blocks = await self._upload_attachments(attachments)
+            result = None
+            groups = group_by_period(self.storage_mode, clips)
+            for index, (period, group) in enumerate(groups):
+                extra = attachment_blocks if index == len(groups) - 1 else []
+                result = await self._append_to_period(period, group, extra)
+            return result
+        except Exception as e:
+            return error_result(e)
+
+    async def touch_page(self, page_id, title):
+        """既存ページのタイトル（時刻）を更新"""
+        if self.storage_mode != 'page':
+            return {"success": False, "error": "追記モードでは期間ページの時刻は更新しません", "retryable": False}
+        try:
+            await self._ensure_schema()
+            await self.client.pages.update(page_id=page_id, properties=self._title_properties(title))
+            return {"success": True, "page_id": page_id}
+        except Exception as e:
+            return error_result(e)
+
+    async def test_connection(self):
+        """Notion接続をテスト"""
+        try:
+            database = await self.client.databases.retrieve(database_id=self.database_id)
+            self._store_schema(database)
+            return {
+                "success": True,
+                "database_name": database.get("title", [{}])[0].get("plain_text", "Unknown")
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def stats(self):
+        """同時送信数の統計情報を取得"""
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+        }
+
+    def for_target(self, **target):
+        """同じクライアントで別の保存先に送る AsyncNotionAPI（NotionAPI.for_target と同じ）"""
+        notion_api = AsyncNotionAPI(self.schema_cache, concurrency=self.concurrency, client=self.client, **target)
+        notion_api.period_pages = self.period_pages
+        # 同時送信数の上限は保存先の数によらず全体で concurrency 件
+        notion_api._semaphore = self._semaphore
+        return notion_api
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _create_page_with_blocks(self, properties, blocks):
+        """ページを作成し、入りきらない本文ブロックを追加で書き込む（失敗したらアーカイブ）
+
+        同時に実行するのは concurrency 件まで。
+        """
+        async with self._semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                request, batches = self._first_request(properties, blocks)
+                response = await self.client.pages.create(**request)
+
+                try:
+                    for batch in batches:
+                        await self.client.blocks.children.append(block_id=response["id"], children=batch)
+                except Exception:
+                    try:
+                        await self.client.pages.update(page_id=response["id"], archived=True)
+                    except Exception as e:
+                        print(f"✗ 書き込み途中のページをアーカイブできませんでした: {e}")
+                    raise
+
+                self.completed += 1
+                return response
+            finally:
+                self.in_flight -= 1
+
+    async def _append_to_period(self, period, clips, extra_blocks=()):
+        # 追記は順番を保つため1件ずつ（並行送信しても期間ページは1つだけ作られる）
+        async with self._period_lock:
+            entry = self.period_pages.get(self.database_id, period) or await self._find_period_page(period)
+            if entry is not None:
+                try:
+                    await self._append_blocks(entry["page_id"], chain(self._batch_blocks(clips), extra_blocks))
+                    return appended_result(entry, period)
+                except APIResponseError as e:
+                    if not is_missing_page_error(e):
+                        raise
+                    print(f"⚠️  {period} のページが見つからないため作り直します")
+                    self.period_pages.invalidate(self.database_id, period)
+
+            response = await self._create_with_schema_retry(
+                lambda: (self._period_properties(period), chain(self._batch_blocks(clips), extra_blocks))
+            )
+            entry = {"page_id": response["id"], "url": response["url"]}
+            self.period_pages.put(self.database_id, period, entry["page_id"], entry["url"])
+            return appended_result(entry, period)
+
+    async def _upload_attachments(self, attachments):
+        """添付ファイルをアップロードし、表示するブロックのリストを返す（NotionAPI と同じ）"""
+        return [
+            attachment_block(attachment, await self._upload_file(attachment))
+            for attachment in attachments or ()
+        ]
+
+    async def _upload_file(self, attachment):
+        parts = upload_parts(os.path.getsize(attachment["path"]))
+        upload = await self.client.file_uploads.create(**self._upload_request(attachment, parts))
+        with open(attachment["path"], 'rb') as file:
+            for number, (start, length) in enumerate(parts, 1):
+                await self.client.file_uploads.send(
+                    file_upload_id=upload["id"],
+                    **self._send_fields(attachment, file, start, length, number, parts)
+                )
+        if len(parts) > 1:
+            await self.client.file_uploads.complete(file_upload_id=upload["id"])
+        return upload["id"]
+
+    async def _find_period_page(self, period):
+        response = await self.client.databases.query(database_id=self.database_id, **self._period_query(period))
+        pages = response.get("results", [])
+        if not pages:
+            return None
+        entry = {"page_id": pages[0]["id"], "url": pages[0].get("url")}
+        self.period_pages.put(self.database_id, period, entry["page_id"], entry["url"])
+        return entry
+
+    async def _append_blocks(self, page_id, blocks):
+        """ブロックを追記し、途中で失敗したら書き込んだ分を削除して例外を送出する"""
+        appended = []
+        try:
+            for batch in paginate_blocks(blocks, REQUEST_BYTES):
+                if not batch:
+                    continue
+                response = await self.client.blocks.children.append(block_id=page_id, children=batch)
+                appended.extend(block["id"] for block in response.get("results", []) if "id" in block)
+        except Exception:
+            for block_id in appended:
+                try:
+                    await self.client.blocks.delete(block_id=block_id)
+                except Exception as e:
+                    print(f"✗ 書き込み途中のブロックを削除できませんでした: {e}")
+                    break
+            raise
+
+    async def _create_with_schema_retry(self, build):
+        """build() の (プロパティ, 本文ブロック) でページを作成し、構造の不一致なら1回だけやり直す"""
+        await self._ensure_schema()
+        previous = (self.title_property, self.memo_property_name)
+        try:
+            return await self._create_page_with_blocks(*build())
+        except APIResponseError as e:
+            if not is_schema_error(e):
+                raise
+            async with self._schema_lock:
+                # 同時に送信していた他のページがすでに取り直していれば、それを使う
+                if (self.title_property, self.memo_property_name) == previous:
+                    print("データベースの構造が変わったため取り直します")
+                    self.schema_cache.invalidate(self.database_id)
+                    await self._load_schema(refresh=True)
+            if (self.title_property, self.memo_property_name) == previous:
+                raise
+            return await self._create_page_with_blocks(*build())
+
+    async def _ensure_schema(self):
+        """プロパティ名を確定させる（同時に呼ばれても databases.retrieve は1回）"""
+        if self.title_property is not None:
+            return
+        async with self._schema_lock:
+            if self.title_property is None:
+                await self._load_schema()
+
+    async def _load_schema(self, refresh=False):
+        """ディスクキャッシュ → databases.retrieve の順にデータベース構造を読み込む"""
+        schema = None if refresh else self._cached_schema()
+        if schema is None:
+            database = await self.client.databases.retrieve(database_id=self.database_id)
+            schema = self._store_schema(database)
+        self._apply_schema(schema)
+
+
+class AsyncNotionEngine:
+    """専用スレッドのイベントループで AsyncNotionAPI を動かし、同期コードから使えるようにする
+
+    submit_* は concurrent.futures.Future をすぐに返すので、rumps のコールバックから
+    呼んでも UI スレッドを止めない。create_page などは結果を待つ版で、NotionAPI と
+    同じように CaptureQueue のワーカーや BatchUploader から使える。
+    """
+
+    def __init__(self, schema_cache=None, concurrency=DEFAULT_CONCURRENCY, parent=None, **target):
+        self.concurrency = concurrency
+        if parent is not None:
+            # 振り分け先は親のイベントループ・クライアントを使い、閉じるのは親に任せる
+            self._loop = parent._loop
+            self._thread = parent._thread
+            self._owner = False
+
+            async def create_target():
+                return parent.api.for_target(**target)
+
+            self.api = self._call(create_target())
+            return
+
+        self._owner = True
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="NotionEventLoop", daemon=True)
+        self._thread.start()
+
+        # 接続とセマフォはループに結び付くため、ループ上で作成する
+        async def create():
+            transport = create_async_transport(max_connections=concurrency)
+            return AsyncNotionAPI(schema_cache, concurrency=concurrency, transport=transport, **target)
+
+        try:
+            self.api = self._call(create())
+        except Exception:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            raise
+
+    @property
+    def client(self):
+        return self.api.client
+
+    @property
+    def database_id(self):
+        return self.api.database_id
+
+    @property
+    def api_key(self):
+        return self.api.api_key
+
+    @property
+    def storage_mode(self):
+        return self.api.storage_mode
+
+    def for_target(self, **target):
+        """同じループ・クライアントで別の保存先に送るエンジン（振り分けルール用）"""
+        return AsyncNotionEngine(concurrency=self.concurrency, parent=self, **target)
+
+    def submit(self, coroutine):
+        """コルーチンをループに投入し、Future を返す"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit_page(self, title, content, attachments=None):
+        return self.submit(self.api.create_page(title, content, attachments))
+
+    def create_page(self, title, content, attachments=None):
+        return self._call(self.api.create_page(title, content, attachments))
+
+    def create_batch_page(self, clips):
+        return self._call(self.api.create_batch_page(clips))
+
+    def create_pages(self, clips):
+        """複数のクリップを並行してそれぞれページ作成（結果はクリップごとのリスト）"""
+        return self._call(self.api.create_pages(clips))
+
+    def touch_page(self, page_id, title):
+        return self._call(self.api.touch_page(page_id, title))
+
+    def test_connection(self):
+        return self._call(self.api.test_connection())
+
+    def stats(self):
+        return self.api.stats()
+
+    def close(self, timeout=10):
+        """接続を閉じてループを止める（振り分け先のエンジンは何もしない）"""
+        if not self._owner or not self._loop.is_running():
+            return
+        try:
+            self._call(self.api.aclose(), timeout)
+        except Exception as e:
+            print(f"✗ 非同期クライアントの終了に失敗しました: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    def _call(self, coroutine, timeout=None):
+        return self.submit(coroutine).result(timeout)
@@ -0,0 +1,419 @@
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+
+from blocks import load_format_config
+
+# 画像を書き出しておくディレクトリ（送信に成功したら消す）
+ATTACHMENT_DIR = Path.home() / '.clip_to_notion' / 'attachments'
+
+# 画像の長辺の上限（ピクセル、これより大きければ縮小する）
+DEFAULT_IMAGE_MAX_DIMENSION = 2560
+
+# 写真などを JPEG にするときの品質
+DEFAULT_IMAGE_QUALITY = 85
+
+# 画像の圧縮を行うワーカーの数
+DEFAULT_ATTACHMENT_WORKERS = 2
+
+# Notion のファイルアップロード: 1回で送れる大きさの上限と、分割して送る場合の1回分の大きさ
+SINGLE_PART_LIMIT = 20 * 1024 * 1024
+PART_SIZE = 10 * 1024 * 1024
+
+# ペーストボードの種類（UTI）
+PASTEBOARD_FILE_URL = 'public.file-url'
+PASTEBOARD_HTML = 'public.html'
+PASTEBOARD_IMAGES = (('public.png', 'image/png'), ('public.jpeg', 'image/jpeg'), ('public.tiff', 'image/tiff'))
+
+# 画像ブロックとして表示する種類（それ以外はファイルブロック）
+IMAGE_CONTENT_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/tiff', 'image/heic')
+
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/tiff': '.tiff', 'image/gif': '.gif'}
+
+
+def load_attachment_config():
+    """環境変数から画像・HTML・ファイルの取り込みの設定を読み込み"""
+    return {
+        # auto: クリップボードが画像などを読める場合（macOS・CLIPBOARD_BACKEND=memory）に有効 / off: テキストのみ
+        "mode": os.environ.get('CLIP_RICH', 'auto').strip().lower(),
+        "max_dimension": int(os.environ.get('CLIP_IMAGE_MAX_DIMENSION', DEFAULT_IMAGE_MAX_DIMENSION)),
+        "quality": int(os.environ.get('CLIP_IMAGE_QUALITY', DEFAULT_IMAGE_QUALITY)),
+        "workers": max(1, int(os.environ.get('CLIP_ATTACHMENT_WORKERS', DEFAULT_ATTACHMENT_WORKERS))),
+    }
+
+
+class RichContents:
+    """ペーストボードから読んだテキスト以外の内容"""
+
+    __slots__ = ('html', 'images', 'files')
+
+    def __init__(self, html=None, images=(), files=()):
+        self.html = html
+        # (バイト列, Content-Type) のリスト
+        self.images = list(images)
+        # コピーしたファイルのパスのリスト
+        self.files = list(files)
+
+    def has_attachments(self):
+        return bool(self.images or self.files)
+
+    def __bool__(self):
+        return bool(self.html or self.images or self.files)
+
+
+class AppKitPasteboard:
+    """macOS のペーストボード（NSPasteboard）から画像・HTML・ファイルを読む"""
+
+    def __init__(self, pasteboard=None):
+        if pasteboard is None:
+            from AppKit import NSPasteboard
+            pasteboard = NSPasteboard.generalPasteboard()
+        self._pasteboard = pasteboard
+
+    def read(self):
+        pasteboard = self._pasteboard
+        types = set(pasteboard.types() or [])
+        contents = RichContents()
+
+        if PASTEBOARD_FILE_URL in types:
+            # Finder でコピーしたファイル（アイコンの画像も入っているので、画像より優先する）
+            from Foundation import NSURL
+            for item in pasteboard.pasteboardItems() or []:
+                url = item.stringForType_(PASTEBOARD_FILE_URL)
+                path = NSURL.URLWithString_(url).path() if url else None
+                if path and os.path.isfile(path):
+                    contents.files.append(path)
+        else:
+            for pasteboard_type, content_type in PASTEBOARD_IMAGES:
+                if pasteboard_type in types:
+                    data = pasteboard.dataForType_(pasteboard_type)
+                    if data is not None:
+                        contents.images.append((bytes(data), content_type))
+                    break
+
+        if PASTEBOARD_HTML in types:
+            contents.html = pasteboard.stringForType_(PASTEBOARD_HTML)
+        return contents
+
+
+class _MarkdownConverter(HTMLParser):
+    """コピーした HTML を Markdown にする（blocks.py で書式付きのブロックになる範囲のみ）"""
+
+    BLOCK_TAGS = ('p', 'div', 'section', 'article', 'table', 'tr', 'ul', 'ol')
+    HEADINGS = {'h1': '# ', 'h2': '## ', 'h3': '### ', 'h4': '### ', 'h5': '### ', 'h6': '### '}
+    SKIP_TAGS = ('script', 'style', 'head', 'title')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._line = []
+        # 見出し・リストの記号（本文がなければ行ごと出さない）
+        self._prefix = ""
+        self._links = []
+        self._lists = []
+        self._skip = 0
+        self._pre = False
+        self._quote = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag in self.HEADINGS:
+            self._break()
+            self._prefix = self.HEADINGS[tag]
+        elif tag in self.BLOCK_TAGS:
+            self._break()
+            if tag in ('ul', 'ol'):
+                self._lists.append([tag, 0])
+        elif tag == 'li':
+            self._break()
+            depth = max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == 'ol':
+                self._lists[-1][1] += 1
+                self._prefix = "  " * depth + f"{self._lists[-1][1]}. "
+            else:
+                self._prefix = "  " * depth + "- "
+        elif tag == 'br':
+            self._break()
+        elif tag == 'blockquote':
+            self._break()
+            self._quote += 1
+        elif tag == 'pre':
+            self._break()
+            self.lines.append("```")
+            self._pre = True
+        elif tag in ('strong', 'b'):
+            self._line.append("**")
+        elif tag == 'code' and not self._pre:
+            self._line.append("`")
+        elif tag == 'a':
+            self._links.append(dict(attrs).get('href'))
+            self._line.append("[")
+        elif tag == 'hr':
+            self._break()
+            self.lines.append("---")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.HEADINGS or tag in self.BLOCK_TAGS or tag == 'li':
+            self._break()
+            if tag in ('ul', 'ol') and self._lists:
+                self._lists.pop()
+        elif tag == 'blockquote':
+            self._break()
+            self._quote = max(0, self._quote - 1)
+        elif tag == 'pre':
+            self._break()
+            self.lines.append("```")
+            self._pre = False
+        elif tag in ('strong', 'b'):
+            self._line.append("**")
+        elif tag == 'code' and not self._pre:
+            self._line.append("`")
+        elif tag == 'a' and self._links:
+            href = self._links.pop()
+            self._line.append(f"]({href})" if href and href.startswith(('http://', 'https://')) else "]")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._pre:
+            self._line.append(data)
+            return
+        self._line.append(re.sub(r'\s+', ' ', data))
+
+    def _break(self):
+        text = "".join(self._line)
+        prefix, self._prefix = self._prefix, ""
+        self._line = []
+        if self._pre:
+            self.lines.extend(text.split("\n"))
+            return
+        text = text.strip()
+        if text.strip('*`[]'):
+            self.lines.append("> " * self._quote + prefix + text)
+
+    def markdown(self):
+        self._break()
+        return "\n".join(self.lines).strip()
+
+
+def html_to_markdown(html):
+    """コピーした HTML を Markdown にする（見出し・リスト・リンク・太字・コード・引用）"""
+    converter = _MarkdownConverter()
+    converter.feed(html)
+    converter.close()
+    return converter.markdown()
+
+
+def prepare_image(data, content_type, max_dimension=DEFAULT_IMAGE_MAX_DIMENSION, quality=DEFAULT_IMAGE_QUALITY):
+    """画像を縮小・圧縮して (バイト列, Content-Type) を返す
+
+    Pillow があれば長辺を max_dimension までに縮小し、透過のない画像は JPEG にする。
+    なければ macOS の NSBitmapImageRep で TIFF（スクリーンショット）を PNG にするだけ。
+    どちらもなければそのまま返す。小さくならなかった場合も元の画像を使う。
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return _convert_with_appkit(data, content_type)
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            resized = max(image.size) > max_dimension
+            if resized:
+                image.thumbnail((max_dimension, max_dimension))
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA', 'P') or content_type == 'image/png' and not resized:
+                image.save(output, format='PNG', optimize=True)
+                converted_type = 'image/png'
+            else:
+                image.convert('RGB').save(output, format='JPEG', quality=quality, optimize=True)
+                converted_type = 'image/jpeg'
+    except Exception as e:
+        print(f"⚠️  画像を圧縮できませんでした（そのまま保存します）: {e}")
+        return data, content_type
+
+    converted = output.getvalue()
+    if not resized and len(converted) >= len(data) and content_type != 'image/tiff':
+        return data, content_type
+    return converted, converted_type
+
+
+def _convert_with_appkit(data, content_type):
+    if content_type != 'image/tiff':
+        return data, content_type
+    try:
+        from AppKit import NSBitmapImageRep, NSBitmapImageFileTypePNG
+    except ImportError:
+        return data, content_type
+    image = NSBitmapImageRep.imageRepWithData_(data)
+    if image is None:
+        return data, content_type
+    converted = image.representationUsingType_properties_(NSBitmapImageFileTypePNG, None)
+    return (bytes(converted), 'image/png') if converted is not None else (data, content_type)
+
+
+def spool_image(data, content_type, directory=None):
+    """画像を書き出して添付ファイルの dict を返す（内容のハッシュをファイル名にする）"""
+    directory = Path(directory) if directory else ATTACHMENT_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    name = hashlib.blake2b(data, digest_size=12).hexdigest() + IMAGE_EXTENSIONS.get(content_type, '')
+    path = directory / name
+    if not path.exists():
+        temporary = path.with_name(name + '.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.chmod(temporary, 0o600)
+        os.replace(temporary, path)
+    return {"path": str(path), "filename": name, "content_type": content_type, "temporary": True}
+
+
+def file_attachment(path):
+    """コピーしたファイルの添付ファイルの dict（ファイルはコピーせず、その場から送る）"""
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return {"path": str(path), "filename": os.path.basename(path), "content_type": content_type, "temporary": False}
+
+
+def discard_attachments(attachments):
+    """送信が終わった添付ファイルのうち、書き出した画像を消す"""
+    for attachment in attachments or ():
+        if attachment.get("temporary"):
+            try:
+                os.remove(attachment["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️  添付ファイルを削除できませんでした: {e}")
+
+
+class AttachmentProcessor:
+    """画像の縮小・圧縮と HTML の変換をワーカーで行い、終わったら送信キューに積む
+
+    ホットキーのスレッドはペーストボードの内容を渡すだけで、圧縮を待たない。
+    """
+
+    def __init__(self, enqueue, max_dimension=DEFAULT_IMAGE_MAX_DIMENSION, quality=DEFAULT_IMAGE_QUALITY,
+                 workers=DEFAULT_ATTACHMENT_WORKERS, directory=None):
+        self.enqueue = enqueue
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Attachment")
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def submit(self, contents, text, title, **options):
+        """ペーストボードの内容を処理して送信キューに積む（Future を返す）
+
+        options（コピー元のアプリなど）はそのまま enqueue に渡す。
+        """
+        return self._executor.submit(self._process, contents, text, title, options)
+
+    def _process(self, contents, text, title, options):
+        try:
+            attachments = []
+            for data, content_type in contents.images:
+                converted, converted_type = prepare_image(data, content_type, self.max_dimension, self.quality)
+                attachments.append(spool_image(converted, converted_type, self.directory))
+                with self._lock:
+                    self.bytes_in += len(data)
+                    self.bytes_out += len(converted)
+            attachments.extend(file_attachment(path) for path in contents.files)
+
+            # HTML は Markdown にして、書式付きのブロックとして保存する（CLIP_FORMAT=plain ならテキストのまま）
+            if contents.html and load_format_config() != 'plain':
+                text = html_to_markdown(contents.html) or text
+            with self._lock:
+                self.processed += 1
+            return self.enqueue(text or "", title=title, attachments=attachments, **options)
+        except Exception as e:
+            print(f"✗ 画像・ファイルの取り込みエラー: {e}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "image_bytes_in": self.bytes_in,
+                "image_bytes_out": self.bytes_out,
+            }
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class FilePart(io.RawIOBase):
+    """ファイルの一部（start から length バイト）だけを読めるファイルオブジェクト
+
+    httpx の multipart はこれを 64KB ずつ読んで送るので、大きなファイルもメモリに載せずに送れる。
+    再送のときは httpx が seek(0) で先頭に戻す。
+    """
+
+    def __init__(self, file, start=0, length=None):
+        super().__init__()
+        self._file = file
+        self._start = start
+        if length is None:
+            length = os.fstat(file.fileno()).st_size - start
+        self._length = length
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._position = min(max(0, offset), self._length)
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self._length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b""
+        self._file.seek(self._start + self._position)
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def upload_parts(size):
+    """ファイルの大きさから、送信する (開始位置, 長さ) のリストを作る（空ファイルでも1回）"""
+    if size <= SINGLE_PART_LIMIT:
+        return [(0, size)]
+    return [(start, min(PART_SIZE, size - start)) for start in range(0, size, PART_SIZE)]
+
+
+def attachment_block(attachment, file_upload_id):
+    """アップロードしたファイルを表示するブロック（画像は image、それ以外は file）"""
+    kind = 'image' if attachment["content_type"] in IMAGE_CONTENT_TYPES else 'file'
+    block = {"type": "file_upload", "file_upload": {"id": file_upload_id}}
+    if kind == 'file':
+        block["name"] = attachment["filename"]
+    return {"object": "block", "type": kind, kind: block}
@@ -0,0 +1,135 @@
+import os
+import threading
+
+# まとめ送信のモード
+#   off:        1クリップ = 1ページ（従来どおり）
+#   page:       まとめたクリップを1ページの本文ブロックとして作成
+#   concurrent: まとめたクリップを並行してそれぞれページ作成
+BATCH_MODES = ('off', 'page', 'concurrent')
+
+NOTION_ENGINES = ('sync', 'async')
+
+
+def load_batch_config():
+    """環境変数からまとめ送信の設定を読み込み"""
+    mode = os.environ.get('BATCH_MODE', 'off').strip().lower()
+    if mode not in BATCH_MODES:
+        print(f"⚠️  不明な BATCH_MODE です: {mode}（off として扱います）")
+        mode = 'off'
+
+    # 送信エンジン（sync: スレッド / async: イベントループで並行送信）
+    engine = os.environ.get('NOTION_ENGINE', 'sync').strip().lower()
+    if engine not in NOTION_ENGINES:
+        print(f"⚠️  不明な NOTION_ENGINE です: {engine}（sync として扱います）")
+        engine = 'sync'
+
+    config = {
+        "mode": mode,
+        # まとめる最大件数
+        "size": int(os.environ.get('BATCH_SIZE', '10')),
+        # 最初のクリップから送信までの最大待ち時間（秒）
+        "window": float(os.environ.get('BATCH_WINDOW', '10')),
+        # 新しいクリップが来なくなってから送信するまでの時間（秒）
+        "idle": float(os.environ.get('BATCH_IDLE', '2')),
+        # concurrent モードの同時リクエスト数
+        "concurrency": int(os.environ.get('BATCH_CONCURRENCY', '3')),
+        "engine": engine,
+        # async エンジンで同時に送信中にしておくページ作成の数
+        "engine_concurrency": max(1, int(os.environ.get('NOTION_CONCURRENCY', '4'))),
+    }
+
+    # async エンジンでは、溜まっている分を待たずにまとめて取り出して並行送信する
+    if engine == 'async' and mode == 'off':
+        config.update(
+            mode='concurrent',
+            window=0.0,
+            idle=0.0,
+            size=max(config['size'], config['engine_concurrency']),
+        )
+
+    return config
+
+
+class BatchUploader:
+    """まとめたクリップをNotionに送信し、削減できたリクエスト数を記録する"""
+
+    def __init__(self, mode='page', concurrency=3):
+        if mode not in ('page', 'concurrent'):
+            raise ValueError(f"不明なまとめ送信モードです: {mode}")
+
+        self.mode = mode
+        self.concurrency = max(1, concurrency)
+        self._executor = None
+
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.clips = 0
+        self.requests = 0
+        self.last_batch_size = 0
+
+    def upload(self, notion_api, items):
+        """CaptureItem のリストを送信し、各クリップの結果をリストで返す"""
+        if len(items) > 1 and any(item.attachments for item in items):
+            # 画像・ファイルのクリップはまとめずに1件ずつページにする
+            plain = [item for item in items if not item.attachments]
+            results = dict(zip(map(id, plain), self.upload(notion_api, plain) if plain else []))
+            for item in items:
+                if item.attachments:
+                    results[id(item)] = self.upload(notion_api, [item])[0]
+            return [results[id(item)] for item in items]
+
+        if len(items) == 1:
+            results = [notion_api.create_page(
+                title=items[0].title, content=items[0].content, attachments=items[0].attachments
+            )]
+            requests = 1
+        elif self.mode == 'page' or getattr(notion_api, 'storage_mode', 'page') != 'page':
+            # 追記モード（STORAGE_MODE=daily / hourly）でも、まとめて1回で追記する
+            result = notion_api.create_batch_page([(item.title, item.content) for item in items])
+            results = [result] * len(items)
+            requests = 1
+        elif hasattr(notion_api, 'create_pages'):
+            # AsyncNotionEngine はイベントループ上で並行して送信する
+            results = notion_api.create_pages([(item.title, item.content) for item in items])
+            requests = len(items)
+        else:
+            results = list(self._get_executor().map(
+                lambda item: notion_api.create_page(title=item.title, content=item.content),
+                items
+            ))
+            requests = len(items)
+
+        with self._lock:
+            self.batches += 1
+            self.clips += len(items)
+            self.requests += requests
+            self.last_batch_size = len(items)
+
+        return results
+
+    def stats(self):
+        """まとめ送信の統計情報を取得"""
+        with self._lock:
+            saved = self.clips - self.requests
+            return {
+                "mode": self.mode,
+                "batches": self.batches,
+                "clips": self.clips,
+                "requests": self.requests,
+                "requests_saved": saved,
+                "requests_saved_per_batch": saved / self.batches if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+            }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="BatchUpload"
+                )
+            return self._executor
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
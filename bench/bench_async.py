@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+同期版（NotionAPI）と非同期版（AsyncNotionEngine）のスループット比較
+
+代替サーバーに応答遅延を入れ、溜まったクリップを送り切るまでの時間を計測する。
+同期版は1件ずつ往復を待つため遅延に比例して遅くなり、非同期版は同時送信数に
+比例して速くなる。
+
+    python -m bench.bench_async --clips 200 --latency 0.05 --concurrency 1 4 16
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fake_notion import FakeNotionServer
+from bench.run import make_clip
+
+
+def measure(label, api, clips):
+    started = time.perf_counter()
+    if hasattr(api, 'create_pages'):
+        results = api.create_pages(clips)
+    else:
+        results = [api.create_page(title, content) for title, content in clips]
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if not result['success'])
+    note = f"（失敗 {failed}件）" if failed else ""
+    print(f"{label:<22}{elapsed:>8.2f}秒 {len(clips) / elapsed:>8.1f}件/秒{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同期版と非同期版のスループット比較")
+    parser.add_argument("--clips", type=int, default=200, help="送信するクリップ数")
+    parser.add_argument("--latency", type=float, default=0.05, help="代替サーバーの応答遅延（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="非同期版の同時送信数")
+    args = parser.parse_args()
+
+    fake = FakeNotionServer(latency=args.latency, keep_content=False).start()
+    os.environ.update(
+        NOTION_BASE_URL=fake.base_url,
+        NOTION_API_KEY="secret_bench",
+        NOTION_DATABASE_ID="bench-database",
+        # レート制限ではなく往復時間で律速させる
+        NOTION_RATE_LIMIT="10000",
+    )
+
+    from async_notion_api import AsyncNotionEngine
+    from notion_api import NotionAPI
+    from schema_cache import SchemaCache
+
+    clips = [(f"2025-01-01 00:00:{index % 60:02d}", make_clip(index)) for index in range(args.clips)]
+    print(f"{args.clips}件 / 応答遅延 {args.latency * 1000:.0f}ms")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        schema_cache = SchemaCache(Path(workdir) / 'schema_cache.json')
+        with contextlib.redirect_stdout(io.StringIO()):
+            api = NotionAPI(schema_cache=schema_cache)
+            api.test_connection()
+        measure("同期版", api, clips)
+
+        for concurrency in args.concurrency:
+            with contextlib.redirect_stdout(io.StringIO()):
+                engine = AsyncNotionEngine(schema_cache=schema_cache, concurrency=concurrency)
+                engine.test_connection()
+            measure(f"非同期版（同時{concurrency}件）", engine, clips)
+            engine.close()
+
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
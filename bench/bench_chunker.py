@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+大きなクリップの分割処理のベンチマーク
+
+1MB / 10MB のテキストを「メモ」プロパティと本文ブロックのリクエストに
+分割するまでの時間と、入力に対する追加メモリ量を計測する（通信はしない）。
+
+    python -m bench.bench_chunker
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from chunker import REQUEST_BYTES, iter_segments, take_segments, paragraph_blocks, paginate_blocks
+
+# ログ・コード・日本語の文章が混ざったテキストを想定
+SAMPLE_LINES = [
+    "2025-10-17 15:30:45 INFO  worker-3 processed request id=4f9c2 in 123ms\n",
+    "    def create_page(self, title, content):  # Notionにページを作成\n",
+    "クリップボードの内容をホットキー一発でNotionに保存するアプリケーションです。",
+    "長い行" * 900 + "\n",
+    "👨‍👩‍👧 絵文字や é のような結合文字も含む\n",
+]
+
+
+def make_text(size):
+    """指定した文字数程度のテキストを作る"""
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        line = SAMPLE_LINES[index % len(SAMPLE_LINES)]
+        parts.append(line)
+        total += len(line)
+        index += 1
+    return "".join(parts)[:size]
+
+
+def run(text):
+    """ページ作成1回分 + 追記リクエストの JSON を組み立てるまでを計測"""
+    started = time.perf_counter()
+    memo, overflow = take_segments(iter_segments(text))
+    requests = 1
+    payload_bytes = len(json.dumps(memo))
+    blocks = 0
+    for batch in paginate_blocks(paragraph_blocks(overflow), REQUEST_BYTES - payload_bytes):
+        requests += 1
+        blocks += len(batch)
+        payload_bytes += len(json.dumps(batch))
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": elapsed,
+        "memo_segments": len(memo),
+        "blocks": blocks,
+        # ページ作成のリクエストに最初の本文ブロックを同梱するため1回分少ない
+        "requests": requests - 1 if blocks else requests,
+        "payload_mb": payload_bytes / 1_000_000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大きなクリップの分割処理のベンチマーク")
+    parser.add_argument("--sizes", default="1000000,10000000", help="文字数（カンマ区切り）")
+    args = parser.parse_args()
+
+    for size in (int(value) for value in args.sizes.split(",")):
+        text = make_text(size)
+
+        tracemalloc.start()
+        result = run(text)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"{size / 1_000_000:>5.1f}M文字: {result['seconds'] * 1000:8.1f}ms "
+            f"({size / result['seconds'] / 1_000_000:.1f}M文字/秒), "
+            f"メモ {result['memo_segments']}要素 + 本文 {result['blocks']}ブロック, "
+            f"リクエスト {result['requests']}回, "
+            f"ペイロード {result['payload_mb']:.1f}MB, "
+            f"追加メモリ最大 {peak / 1_000_000:.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
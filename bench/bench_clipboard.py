@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+クリップボードの読み取り（clipboard.py）のベンチマーク
+
+使える読み取り方（appkit / gtk / pyperclip / memory）それぞれで、同じテキストを
+書き込んでから繰り返し読み、1回あたりの時間（中央値・p95）を比べる。
+使えない読み取り方（macOS 以外の appkit、xclip のない環境の pyperclip など）は理由を表示して飛ばす。
+
+    python -m bench.bench_clipboard
+    python -m bench.bench_clipboard --size 100000 --reads 200 --backends appkit pyperclip
+"""
+import argparse
+import statistics
+import time
+
+BACKENDS = ('memory', 'appkit', 'gtk', 'pyperclip')
+
+
+def measure(backend, text, reads):
+    """1回あたりの読み取り時間（秒）のリスト"""
+    from clipboard import create_clipboard
+
+    clipboard = create_clipboard(backend)
+    clipboard.write_text(text)
+    if clipboard.read_text() != text:
+        raise RuntimeError("書き込んだ内容を読み取れませんでした")
+
+    timings = []
+    for _ in range(reads):
+        started = time.perf_counter()
+        clipboard.read_text()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="クリップボードの読み取りのベンチマーク")
+    parser.add_argument("--size", type=int, default=1000, help="テキストの文字数")
+    parser.add_argument("--reads", type=int, default=500, help="読み取りの回数")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    args = parser.parse_args()
+
+    text = ("クリップボードのベンチマーク text 0123456789\n" * (args.size // 30 + 1))[:args.size]
+    print(f"{args.size}文字 / {args.reads}回")
+
+    baseline = None
+    for backend in args.backends:
+        try:
+            timings = measure(backend, text, args.reads)
+        except Exception as e:
+            reason = str(e).splitlines()[0] if str(e) else ""
+            print(f"{backend:<10} 使用できません: {type(e).__name__}: {reason}")
+            continue
+
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(
+            f"{backend:<10} 中央値 {median * 1e6:10.1f}µs  p95 {percentile(timings, 0.95) * 1e6:10.1f}µs  "
+            f"({median / baseline:6.1f}倍)"
+        )
+
+
+if __name__ == "__main__":
+    main()
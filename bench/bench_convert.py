@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+ブロック変換（blocks.py）のベンチマーク
+
+1MB の Markdown・コード・URL・普通のテキストについて、変換にかかる時間
+（初回とキャッシュ済み）と、代替サーバーにページを保存するまでの時間を比べる。
+
+    python -m bench.bench_convert
+    python -m bench.bench_convert --size 1000000 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from bench.bench_chunker import make_text
+from bench.fake_notion import FakeNotionServer
+
+MARKDOWN_SECTION = """## 第{index}章 議事録
+
+参加者: 山田、佐藤、Smith。**決定事項**は [議事録](https://example.com/notes/{index}) を参照。{filler}
+
+- 次回までに `config.py` を見直す
+- [ ] 見積もりを出す
+1. 仕様を確認する
+
+> 引用: 変換のコストは通信に比べて小さいこと
+
+```python
+def handler(event):
+    return {{"status": 200, "body": event["body"]}}
+```
+
+"""
+
+CODE_LINES = [
+    "import os\n",
+    "\n",
+    "def process(items, limit=100):\n",
+    "    # 先頭から limit 件だけ処理する\n",
+    "    for index, item in enumerate(items[:limit]):\n",
+    "        print(f\"{index}: {item}\")\n",
+    "    return len(items)\n",
+    "\n",
+]
+
+
+def make_markdown(size):
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        section = MARKDOWN_SECTION.format(index=index, filler="本文の説明が続きます。" * 200)
+        parts.append(section)
+        total += len(section)
+        index += 1
+    return "".join(parts)[:size]
+
+
+def make_code(size):
+    return ("".join(CODE_LINES) * (size // len("".join(CODE_LINES)) + 1))[:size]
+
+
+def make_urls(count):
+    return "\n".join(f"https://example.com/articles/{index}" for index in range(count))
+
+
+def measure(label, api, text, runs):
+    from blocks import block_cache, detect_kind
+
+    block_cache.clear()
+    started = time.perf_counter()
+    blocks = block_cache.convert(text)
+    cold = time.perf_counter() - started
+
+    cached = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        block_cache.convert(text)
+        cached.append(time.perf_counter() - started)
+
+    # 保存（変換はキャッシュ済みなので、ほぼ通信とリクエストの組み立ての時間）
+    started = time.perf_counter()
+    result = api.create_page("2025-01-01 00:00:00", text)
+    network = time.perf_counter() - started
+    note = "" if result['success'] else f"（保存失敗: {result['error']}）"
+
+    converted = f"{len(blocks)}ブロック" if blocks is not None else "変換なし"
+    print(
+        f"{label:<10}{detect_kind(text):<10}{converted:>12}  "
+        f"変換 {cold * 1000:7.1f}ms  キャッシュ {min(cached) * 1000:6.2f}ms  "
+        f"保存 {network * 1000:8.1f}ms  変換/保存 {cold / network * 100:5.1f}%{note}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ブロック変換のベンチマーク")
+    parser.add_argument("--size", type=int, default=1_000_000, help="テキストの文字数")
+    parser.add_argument("--latency", type=float, default=0.05, help="代替サーバーの応答遅延（秒）")
+    parser.add_argument("--runs", type=int, default=5, help="キャッシュ済みの計測回数")
+    args = parser.parse_args()
+
+    fake = FakeNotionServer(latency=args.latency, keep_content=False).start()
+    os.environ.update(
+        NOTION_BASE_URL=fake.base_url,
+        NOTION_API_KEY="secret_bench",
+        NOTION_DATABASE_ID="bench-database",
+        NOTION_RATE_LIMIT="10000",
+        CLIP_FORMAT="auto",
+    )
+
+    from notion_api import NotionAPI
+    from schema_cache import SchemaCache
+
+    samples = [
+        ("Markdown", make_markdown(args.size)),
+        ("コード", make_code(args.size)),
+        ("テキスト", make_text(args.size)),
+        ("URL", make_urls(500)),
+    ]
+    print(f"{args.size / 1_000_000:.1f}M文字 / 応答遅延 {args.latency * 1000:.0f}ms")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            api = NotionAPI(schema_cache=SchemaCache(Path(workdir) / 'schema_cache.json'))
+            api.test_connection()
+        for label, text in samples:
+            measure(label, api, text, args.runs)
+
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+振り分けルール（routing.py）のベンチマーク
+
+よくあるルール（URL・コード・秘密情報・SQL・アプリ・長さ）を並べ、普通のテキスト・URL・コード・
+Markdown それぞれ 1KB / 1MB / 10MB のクリップについて、保存先を決めるまでの時間（中央値・p95・最大）を測る。
+判定はクリップの先頭 scan_chars 文字だけを見るので、大きさが変わっても時間はほぼ変わらない。
+
+    python -m bench.bench_routing
+    python -m bench.bench_routing --runs 500 --scan-chars 4096
+"""
+import argparse
+import statistics
+import time
+
+from bench.bench_chunker import make_text
+from bench.bench_convert import make_code, make_markdown, make_urls
+
+RULES = [
+    {"name": "秘密情報", "pattern": r"password|api[_-]?key|BEGIN [A-Z ]*PRIVATE KEY", "ignore_case": True,
+     "database_id": "db-secret"},
+    {"name": "ターミナル", "app": ["Terminal", "iTerm2"], "database_id": "db-terminal"},
+    {"name": "URL", "type": "url", "database_id": "db-links"},
+    {"name": "SQL", "pattern": r"\bSELECT\b[\s\S]*\bFROM\b", "database_id": "db-code"},
+    {"name": "コード", "type": "code", "database_id": "db-code", "memo_property": "本文"},
+    {"name": "議事録", "pattern": r"^#+ .*議事録", "type": "markdown", "database_id": "db-notes"},
+    {"name": "長文", "min_length": 100_000, "database_id": "db-archive"},
+    {"name": "短文", "max_length": 200, "properties": {"種類": {"select": {"name": "メモ"}}}},
+]
+
+SIZES = (("1KB", 1_000), ("1MB", 1_000_000), ("10MB", 10_000_000))
+
+
+def make_clips():
+    makers = (
+        ("テキスト", make_text),
+        ("URL", lambda size: make_urls(size // 32 + 1)[:size]),
+        ("コード", make_code),
+        ("Markdown", make_markdown),
+    )
+    for kind, make in makers:
+        for label, size in SIZES:
+            yield f"{kind} {label}", make(size)
+
+
+def measure(router, text, runs):
+    timings = []
+    route = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        route = router.route(text)
+        timings.append(time.perf_counter() - started)
+    return route, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="振り分けルールのベンチマーク")
+    parser.add_argument("--runs", type=int, default=200, help="1種類あたりの判定回数")
+    parser.add_argument("--scan-chars", type=int, default=None, help="判定に使う先頭部分の文字数")
+    args = parser.parse_args()
+
+    from routing import DEFAULT_SCAN_CHARS, Router, parse_route
+
+    scan_chars = args.scan_chars or DEFAULT_SCAN_CHARS
+    router = Router([parse_route(index, rule) for index, rule in enumerate(RULES)], scan_chars)
+    print(f"ルール {len(RULES)}件 / 先頭 {scan_chars}文字 / {args.runs}回\n")
+
+    worst = 0.0
+    for label, text in make_clips():
+        route, timings = measure(router, text, args.runs)
+        ordered = sorted(timings)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        worst = max(worst, p95)
+        print(
+            f"{label:<14} → {route.name if route else '既定':<8} 中央値 {statistics.median(timings) * 1e6:7.1f}µs  "
+            f"p95 {p95 * 1e6:7.1f}µs  最大 {ordered[-1] * 1e6:7.1f}µs"
+        )
+    print(f"\np95 の最大: {worst * 1e6:.1f}µs（{'1ms 未満' if worst < 0.001 else '1ms 以上'}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+起動時間のベンチマーク
+
+1. python -X importtime で main.py の import にかかる時間を計測し、重いモジュールを表示
+2. main.py --startup-benchmark を繰り返し起動し、ホットキーが使えるようになるまでの
+   時間（プロセス起動から / main.py の読み込み開始から）を計測
+
+    python -m bench.bench_startup --runs 5
+
+メニューバーアプリ本体を起動するため macOS（rumps / pynput が使える環境）で実行する。
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure_imports(top=10):
+    """import main の時間を -X importtime で計測し、(合計, main が読み込む重い順のリスト) を返す"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    # importtime は子モジュールを親より先に出力する（ネストは名前の前の空白2つ分）
+    children = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = _split_importtime(line)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == "main":
+                children.sort(reverse=True)
+                return int(cumulative_us), children[:top]
+            children = []
+
+    return 0, []
+
+
+def _split_importtime(line):
+    """'import time:  self | cumulative | name' を (self, cumulative, name) に分ける"""
+    fields = line[len("import time:"):].split("|")
+    return [fields[0].strip(), fields[1].strip(), fields[2].rstrip()[1:]]
+
+
+def measure_ready(runs):
+    """ホットキー準備完了までの時間を計測（プロセス起動から, main.py の読み込み開始から）"""
+    wall = []
+    in_process = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "main.py", "--startup-benchmark"],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        for line in process.stdout:
+            if line.startswith("STARTUP_READY"):
+                wall.append(time.perf_counter() - started)
+                in_process.append(float(line.split()[1]))
+                break
+        process.stdout.close()
+        process.wait()
+
+    return wall, in_process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--runs", type=int, default=5, help="起動を繰り返す回数")
+    args = parser.parse_args()
+
+    total, modules = measure_imports()
+    print(f"import main: {total / 1000:.1f}ms")
+    for cumulative_us, name in modules:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+    wall, in_process = measure_ready(args.runs)
+    if not wall:
+        print("ホットキー準備完了を計測できませんでした（.env の設定を確認してください）")
+        return
+    print(
+        f"ホットキー準備完了（中央値, {len(wall)}回）: "
+        f"プロセス起動から {statistics.median(wall) * 1000:.0f}ms / "
+        f"main.py 読み込み開始から {statistics.median(in_process) * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+アップロード用プロセス（uploader_process.py）のベンチマーク
+
+同じクリップを、このプロセスの NotionAPI で送る場合と、子プロセス（UPLOADER_PROCESS=1）に
+送ってもらう場合とで、1件あたりの保存時間（中央値・p95）とメインのプロセスのピークRSSを比べる。
+それぞれ別の Python プロセスで計測するので、読み込んだモジュールが混ざらない。
+
+    python -m bench.bench_uploader_process
+    python -m bench.bench_uploader_process --clips 500 --size 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.fake_notion import FakeNotionServer
+from bench.run import RESULT_PREFIX, ROOT, make_clip, peak_rss_mb, percentile
+
+MODES = ("inprocess", "process")
+
+
+def run_mode(mode, clips, size):
+    """子プロセス側: mode の方法でクリップを送り、結果を1行の JSON で出力する"""
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    if mode == "process":
+        from uploader_process import create_uploader_api
+        notion_api = create_uploader_api()
+    else:
+        from notion_api import create_notion_api
+        notion_api = create_notion_api()
+
+    latencies = []
+    for index in range(clips):
+        started = time.perf_counter()
+        result = notion_api.create_page(f"clip {index}", make_clip(index, size))
+        latencies.append(time.perf_counter() - started)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    rss = peak_rss_mb()
+    with contextlib.suppress(Exception):
+        notion_api.close()
+
+    stdout.write(RESULT_PREFIX + json.dumps({
+        "latencies": latencies,
+        "peak_rss_mb": rss,
+        "notion_client_loaded": 'notion_client' in sys.modules,
+    }) + "\n")
+    stdout.flush()
+
+
+def measure(mode, args, base_url):
+    env = dict(os.environ, NOTION_API_KEY="secret_bench", NOTION_DATABASE_ID="bench-db",
+               NOTION_BASE_URL=base_url, NOTION_RATE_LIMIT="1000")
+    output = subprocess.run(
+        [sys.executable, "-m", "bench.bench_uploader_process", "--child", mode,
+         "--clips", str(args.clips), "--size", str(args.size)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith(RESULT_PREFIX))
+    return json.loads(line[len(RESULT_PREFIX):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アップロード用プロセスのベンチマーク")
+    parser.add_argument("--clips", type=int, default=200, help="送るクリップの数")
+    parser.add_argument("--size", type=int, default=1000, help="1件あたりの文字数")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.child, args.clips, args.size)
+        return
+
+    fake = FakeNotionServer().start()
+    print(f"{args.clips}件 / {args.size}文字\n")
+    try:
+        for mode in MODES:
+            result = measure(mode, args, fake.base_url)
+            latencies = sorted(result["latencies"])
+            print(
+                f"{mode:<10} 中央値 {statistics.median(latencies) * 1e3:7.2f}ms  "
+                f"p95 {percentile(latencies, 95) * 1e3:7.2f}ms  "
+                f"ピークRSS {result['peak_rss_mb']:6.1f}MB  "
+                f"notion_client {'読み込み済み' if result['notion_client_loaded'] else 'なし'}"
+            )
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
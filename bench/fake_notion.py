@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Notion API のローカル代替サーバー
+
+NOTION_BASE_URL をこのサーバーに向けると、実際のNotionに接続せずに
+保存処理を動かせる。fail_next() / set_offline() で失敗を任意に発生させられ、
+rate_limit_next() で 429（Retry-After 付き）、latency で応答遅延を注入できる。
+error_rate / rate_limit_rate を指定すると、その割合でランダムに失敗させる
+（seed を固定すれば毎回同じ順序で失敗する）。
+
+    python -m bench.fake_notion --port 8765
+    NOTION_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Notion API の制限
+TEXT_LIMIT = 2000
+ARRAY_LIMIT = 100
+PAYLOAD_LIMIT = 500_000
+# ファイルアップロード（file_uploads.send）の1回分の上限と、分割送信で最後以外の部分の下限
+FILE_PART_LIMIT = 20 * 1024 * 1024
+FILE_PART_MINIMUM = 5 * 1024 * 1024
+
+
+class FakeNotionServer:
+    """databases.retrieve / pages.create / blocks.children.append / blocks.delete / file_uploads を実装したローカルサーバー"""
+
+    def __init__(self, host='127.0.0.1', port=0, title_property='日付', memo_property='メモ',
+                 latency=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=0,
+                 keep_content=True):
+        self.title_property = title_property
+        self.memo_property = memo_property
+        # タイトル・メモ以外のプロパティ（名前 → 種類、add_property で追加）
+        self.extra_properties = {}
+        self.pages = []
+        self.request_count = 0
+        self._pages_by_id = {}
+        # 追記したブロックID → ページID（blocks.delete 用）
+        self._block_pages = {}
+        # file_uploads（受け取ったファイルは大きさとハッシュだけを残す）
+        self.file_uploads = {}
+        # 各リクエストに加える応答遅延（秒）
+        self.latency = latency
+        # ランダムに 503 / 429 を返す割合
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        # False にするとページの中身を保持しない（ベンチマークでメモリを計測する場合）
+        self.keep_content = keep_content
+        # プロパティ名を変えたら更新される（databases.retrieve の last_edited_time）
+        self.schema_version = "2025-01-01T00:00:00.000Z"
+
+        self._lock = threading.Lock()
+        self._failures = []
+        self._offline = False
+
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="FakeNotionServer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, count=1, status=503, code='service_unavailable', retry_after=None):
+        """次の count 件のリクエストを指定したステータスで失敗させる"""
+        with self._lock:
+            self._failures.extend([(status, code, retry_after)] * count)
+
+    def rate_limit_next(self, count=1, retry_after=1):
+        """次の count 件のリクエストを 429 で失敗させる"""
+        self.fail_next(count, 429, 'rate_limited', retry_after)
+
+    def rename_properties(self, title_property=None, memo_property=None):
+        """データベースのプロパティ名を変更する（構造の変化の再現用）"""
+        self.title_property = title_property or self.title_property
+        self.memo_property = memo_property or self.memo_property
+        self.schema_version = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def add_property(self, name, property_type='select'):
+        """プロパティを追加する（振り分けルールの properties の確認用）"""
+        self.extra_properties[name] = property_type
+        self.schema_version = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def set_offline(self, offline=True):
+        """オフライン状態（すべて503）を切り替える"""
+        self._offline = offline
+
+    def database(self, database_id):
+        return {
+            "object": "database",
+            "id": database_id,
+            "last_edited_time": self.schema_version,
+            "title": [{"plain_text": "Fake Database"}],
+            "properties": {
+                self.title_property: {"id": "title", "type": "title"},
+                self.memo_property: {"id": "memo", "type": "rich_text"},
+                **{name: {"id": name, "type": property_type} for name, property_type in self.extra_properties.items()},
+            },
+        }
+
+    def create_page(self, body):
+        properties = body.get("properties", {})
+        for name, value in properties.items():
+            if name not in (self.title_property, self.memo_property, *self.extra_properties):
+                raise _APIError(400, 'validation_error', f"{name} is not a property that exists.")
+            _validate_rich_text(value.get("title", []))
+            _validate_rich_text(value.get("rich_text", []))
+        children = body.get("children", [])
+        _validate_blocks(children)
+        self._validate_file_blocks(children)
+
+        page_id = str(uuid.uuid4())
+        now = _timestamp()
+        page = {
+            "object": "page",
+            "id": page_id,
+            "url": f"https://www.notion.so/{page_id.replace('-', '')}",
+            "created_time": now,
+            "last_edited_time": now,
+            "archived": False,
+            "parent": body.get("parent"),
+            "properties": properties,
+            "children": children,
+        }
+        if not self.keep_content:
+            page["properties"] = {}
+            page["children"] = []
+        with self._lock:
+            self.pages.append(page)
+            self._pages_by_id[page_id] = page
+        return page
+
+    def update_page(self, page_id, body):
+        with self._lock:
+            page = self._pages_by_id.get(page_id)
+        if page is None:
+            raise _APIError(404, 'object_not_found', f"Could not find page with ID: {page_id}")
+        if "archived" in body:
+            page["archived"] = body["archived"]
+        page["properties"].update(body.get("properties", {}))
+        page["last_edited_time"] = _timestamp()
+        return page
+
+    def query_database(self, database_id, body):
+        """databases.query（last_edited_time・タイトルの絞り込み・並べ替えとページ送りのみ対応）"""
+        with self._lock:
+            pages = [
+                page for page in self.pages
+                if not page["archived"] and (page.get("parent") or {}).get("database_id", database_id) == database_id
+            ]
+        query_filter = body.get("filter") or {}
+        condition = query_filter.get("last_edited_time") or {}
+        if "on_or_after" in condition:
+            pages = [page for page in pages if page["last_edited_time"] >= condition["on_or_after"]]
+        if "equals" in (query_filter.get("title") or {}):
+            name = query_filter.get("property")
+            pages = [
+                page for page in pages
+                if "".join(
+                    item.get("text", {}).get("content", "")
+                    for item in page["properties"].get(name, {}).get("title", [])
+                ) == query_filter["title"]["equals"]
+            ]
+        for sort in reversed(body.get("sorts") or []):
+            pages.sort(
+                key=lambda page: page[sort.get("timestamp", "created_time")],
+                reverse=sort.get("direction") == "descending"
+            )
+
+        start = int(body.get("start_cursor") or 0)
+        end = start + min(int(body.get("page_size") or 100), 100)
+        return {
+            "object": "list",
+            "results": [self._page_response(page) for page in pages[start:end]],
+            "has_more": end < len(pages),
+            "next_cursor": str(end) if end < len(pages) else None,
+        }
+
+    def _page_response(self, page):
+        """保存したページを API の応答の形（plain_text 付き）にする"""
+        properties = {}
+        for name, value in page["properties"].items():
+            kind = "title" if "title" in value else "rich_text"
+            properties[name] = {
+                "type": kind,
+                kind: [
+                    dict(item, plain_text=item.get("text", {}).get("content", ""))
+                    for item in value.get(kind, [])
+                ],
+            }
+        response = {key: value for key, value in page.items() if key != "children"}
+        response["properties"] = properties
+        return response
+
+    def append_children(self, block_id, body):
+        children = body.get("children", [])
+        _validate_blocks(children)
+        self._validate_file_blocks(children)
+        with self._lock:
+            page = self._pages_by_id.get(block_id)
+        if page is None:
+            raise _APIError(404, 'object_not_found', f"Could not find block with ID: {block_id}")
+        if page["archived"]:
+            raise _APIError(400, 'validation_error', "Can't edit block that is archived.")
+        children = [dict(block, id=str(uuid.uuid4())) for block in children]
+        with self._lock:
+            for block in children:
+                self._block_pages[block["id"]] = block_id
+        if self.keep_content:
+            page["children"].extend(children)
+        page["last_edited_time"] = _timestamp()
+        return {"object": "list", "results": children}
+
+    def delete_block(self, block_id):
+        with self._lock:
+            page = self._pages_by_id.get(self._block_pages.pop(block_id, None))
+        if page is None:
+            raise _APIError(404, 'object_not_found', f"Could not find block with ID: {block_id}")
+        page["children"] = [block for block in page["children"] if block.get("id") != block_id]
+        return {"object": "block", "id": block_id, "archived": True}
+
+    def create_file_upload(self, body):
+        mode = body.get("mode", "single_part")
+        parts = int(body.get("number_of_parts") or 1)
+        if mode not in ("single_part", "multi_part"):
+            raise _APIError(400, 'validation_error', f"Unsupported mode: {mode}")
+        if mode == "multi_part" and parts < 1:
+            raise _APIError(400, 'validation_error', "number_of_parts should be ≥ 1")
+        upload = {
+            "object": "file_upload",
+            "id": str(uuid.uuid4()),
+            "status": "pending",
+            "mode": mode,
+            "filename": body.get("filename"),
+            "content_type": body.get("content_type"),
+            "content_length": 0,
+            "number_of_parts": {"total": parts if mode == "multi_part" else 1, "sent": 0},
+            "sha256": hashlib.sha256(),
+        }
+        with self._lock:
+            self.file_uploads[upload["id"]] = upload
+        return self._upload_response(upload)
+
+    def send_file_upload(self, upload_id, fields):
+        with self._lock:
+            upload = self.file_uploads.get(upload_id)
+        if upload is None:
+            raise _APIError(404, 'object_not_found', f"Could not find file upload with ID: {upload_id}")
+        if upload["status"] != "pending":
+            raise _APIError(400, 'validation_error', f"File upload is {upload['status']}.")
+        data = fields.get("file")
+        if data is None:
+            raise _APIError(400, 'validation_error', "file is required.")
+        if len(data) > FILE_PART_LIMIT:
+            raise _APIError(400, 'validation_error', "File part should be ≤ 20MB.")
+
+        parts = upload["number_of_parts"]
+        if upload["mode"] == "multi_part":
+            expected = parts["sent"] + 1
+            if int(fields.get("part_number") or 0) != expected:
+                raise _APIError(400, 'validation_error', f"Expected part_number {expected}.")
+            if expected < parts["total"] and len(data) < FILE_PART_MINIMUM:
+                raise _APIError(400, 'validation_error', "File parts except the last should be ≥ 5MB.")
+        parts["sent"] += 1
+        upload["content_length"] += len(data)
+        upload["sha256"].update(data)
+        if upload["mode"] == "single_part":
+            upload["status"] = "uploaded"
+        return self._upload_response(upload)
+
+    def complete_file_upload(self, upload_id):
+        with self._lock:
+            upload = self.file_uploads.get(upload_id)
+        if upload is None:
+            raise _APIError(404, 'object_not_found', f"Could not find file upload with ID: {upload_id}")
+        parts = upload["number_of_parts"]
+        if upload["mode"] != "multi_part" or parts["sent"] != parts["total"]:
+            raise _APIError(400, 'validation_error', "File upload is not ready to complete.")
+        upload["status"] = "uploaded"
+        return self._upload_response(upload)
+
+    def _upload_response(self, upload):
+        response = {key: value for key, value in upload.items() if key != "sha256"}
+        response["number_of_parts"] = dict(upload["number_of_parts"])
+        return response
+
+    def _validate_file_blocks(self, blocks):
+        """image / file ブロックが参照するアップロードが完了しているか"""
+        for block in blocks:
+            content = block.get(block.get("type"), {})
+            if content.get("type") != "file_upload":
+                continue
+            upload_id = content.get("file_upload", {}).get("id")
+            with self._lock:
+                upload = self.file_uploads.get(upload_id)
+            if upload is None or upload["status"] != "uploaded":
+                raise _APIError(400, 'validation_error', f"File upload {upload_id} is not uploaded.")
+
+    def _next_failure(self):
+        with self._lock:
+            self.request_count += 1
+            if self._offline:
+                return (503, 'service_unavailable', None)
+            if self._failures:
+                return self._failures.pop(0)
+            if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+                return (429, 'rate_limited', self.retry_after)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return (503, 'service_unavailable', None)
+        return None
+
+
+def _timestamp():
+    # 実際の Notion と同じく、last_edited_time は分単位
+    return time.strftime("%Y-%m-%dT%H:%M:00.000Z", time.gmtime())
+
+
+def _validate_rich_text(items):
+    if len(items) > ARRAY_LIMIT:
+        raise _APIError(400, 'validation_error', "rich_text should be ≤ 100 items")
+    for text in items:
+        if len(text.get("text", {}).get("content", "")) > TEXT_LIMIT:
+            raise _APIError(400, 'validation_error', "rich_text content is too long")
+
+
+def _validate_blocks(blocks):
+    if len(blocks) > ARRAY_LIMIT:
+        raise _APIError(400, 'validation_error', "children should be ≤ 100 items")
+    for block in blocks:
+        _validate_rich_text(block.get(block.get("type"), {}).get("rich_text", []))
+
+
+def _parse_multipart(raw, content_type):
+    """multipart/form-data の各フィールドを {名前: 値} にする（ファイルはバイト列のまま）"""
+    boundary = content_type.split("boundary=", 1)[-1].strip().strip('"').encode()
+    fields = {}
+    for part in raw.split(b"--" + boundary)[1:]:
+        if part.startswith(b"--"):
+            break
+        headers, _, value = part.partition(b"\r\n\r\n")
+        name = None
+        for header in headers.decode("utf-8", "replace").split("\r\n"):
+            if header.lower().startswith("content-disposition:"):
+                for param in header.split(";")[1:]:
+                    key, _, quoted = param.strip().partition("=")
+                    if key == "name":
+                        name = quoted.strip('"')
+        if name:
+            value = value[:-2] if value.endswith(b"\r\n") else value
+            fields[name] = value if name == "file" else value.decode("utf-8")
+    return fields
+
+
+class _APIError(Exception):
+    def __init__(self, status, code, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        # ヘッダーと本文が別々に送られても遅延 ACK で待たされないようにする
+        # （待たされるとクライアント側の計測に約40msが上乗せされる）
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def _dispatch(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            content_type = self.headers.get("Content-Type") or ""
+            # ファイルの送信（multipart）は20MB + ヘッダーまで受け付ける
+            limit = FILE_PART_LIMIT + 64 * 1024 if content_type.startswith("multipart/") else PAYLOAD_LIMIT
+            if length > limit:
+                self._send(413, {"object": "error", "status": 413,
+                                 "code": "validation_error", "message": "Payload too large"})
+                return
+            if server.latency:
+                time.sleep(server.latency)
+            try:
+                failure = server._next_failure()
+                if failure:
+                    raise _APIError(failure[0], failure[1], "Injected failure", failure[2])
+                if not self.headers.get("Authorization"):
+                    raise _APIError(401, 'unauthorized', "API token is invalid.")
+
+                if content_type.startswith("multipart/form-data"):
+                    body = _parse_multipart(raw, content_type)
+                else:
+                    body = json.loads(raw) if raw else {}
+                self._send(200, self._route(method, self.path.split("?")[0], body))
+            except _APIError as e:
+                headers = {}
+                if e.retry_after is not None:
+                    headers["Retry-After"] = str(e.retry_after)
+                self._send(e.status, {
+                    "object": "error", "status": e.status, "code": e.code, "message": str(e)
+                }, headers)
+
+        def _route(self, method, path, body):
+            parts = path.strip("/").split("/")
+            if method == "GET" and parts[:2] == ["v1", "databases"] and len(parts) == 3:
+                return server.database(parts[2])
+            if method == "POST" and parts[:2] == ["v1", "databases"] and parts[3:] == ["query"]:
+                return server.query_database(parts[2], body)
+            if method == "POST" and parts == ["v1", "pages"]:
+                return server.create_page(body)
+            if method == "PATCH" and parts[:2] == ["v1", "pages"] and len(parts) == 3:
+                return server.update_page(parts[2], body)
+            if method == "PATCH" and parts[:2] == ["v1", "blocks"] and parts[3:] == ["children"]:
+                return server.append_children(parts[2], body)
+            if method == "DELETE" and parts[:2] == ["v1", "blocks"] and len(parts) == 3:
+                return server.delete_block(parts[2])
+            if method == "POST" and parts == ["v1", "file_uploads"]:
+                return server.create_file_upload(body)
+            if method == "POST" and parts[:2] == ["v1", "file_uploads"] and parts[3:] == ["send"]:
+                return server.send_file_upload(parts[2], body)
+            if method == "POST" and parts[:2] == ["v1", "file_uploads"] and parts[3:] == ["complete"]:
+                return server.complete_file_upload(parts[2])
+            raise _APIError(400, 'invalid_request_url', f"Invalid request URL: {method} {path}")
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Notion API のローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 を返す割合")
+    args = parser.parse_args()
+
+    fake = FakeNotionServer(
+        args.host, args.port,
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate
+    )
+    print(f"Fake Notion API: {fake.base_url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake._server.server_close()
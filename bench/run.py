@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+保存経路のベンチマーク（Notion API の代替サーバーを使い、通信はローカルのみ）
+
+シナリオ:
+  single:     小さなクリップを1件ずつ保存（前の保存が終わってから次を送る）
+  burst:      100件のクリップを一度にキューへ積む
+  large:      10MB のクリップを1件保存
+  cold_start: 新しいプロセスで import → 接続確認 → 最初の1件の保存完了まで
+
+各シナリオは別プロセスで実行し（ピークメモリを分けて計測するため）、
+--runs 回の中央値でスループット・p50/p95/p99・ピークRSSを表示する。
+代替サーバーの遅延・エラー率は乱数の種を固定しているので、毎回同じ条件で比較できる。
+
+    python -m bench.run
+    python -m bench.run --save baseline.json
+    python -m bench.run --compare baseline.json   # 悪化したシナリオがあれば終了コード1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ("single", "burst", "large", "cold_start")
+
+RESULT_PREFIX = "BENCH_RESULT "
+
+# 子プロセス（cold_start）でアプリのモジュールを先に読み込まないよう、import は各関数の中で行う
+
+# 比較するときに「小さいほど良い」項目と「大きいほど良い」項目
+LOWER_IS_BETTER = ("p50", "p95", "p99", "peak_rss_mb", "wall")
+HIGHER_IS_BETTER = ("throughput",)
+
+
+def make_clip(index, size=200):
+    """index ごとに内容の違うクリップ（重複判定でスキップされないように）"""
+    line = f"{index:06d} クリップボードの内容をNotionに保存します。The quick brown fox.\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def percentile(samples, point):
+    """metrics.Histogram と同じ方法でパーセンタイルを計算"""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * point / 100))]
+
+
+def peak_rss_mb():
+    """このプロセスのピークRSS（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class SavePipeline:
+    """main.py の save_selection → upload_item と同じ経路でクリップを保存する
+
+    重複判定のダイジェスト計算、送信箱への書き込み、キュー、NotionAPI.create_page、
+    重複判定インデックスの更新までを通す（クリップボードとメニューバーは使わない）。
+    """
+
+    def __init__(self, workdir):
+        import queue
+
+        from capture_queue import CaptureQueue
+        from dedup import DedupIndex, content_digest
+        from notion_api import NotionAPI
+        from outbox import Outbox
+        from schema_cache import SchemaCache
+
+        self._content_digest = content_digest
+        self.notion_api = NotionAPI(schema_cache=SchemaCache(Path(workdir) / 'schema_cache.json'))
+        self.dedup_index = DedupIndex(Path(workdir) / 'dedup.json')
+        self.outbox = Outbox(Path(workdir) / 'outbox.db')
+        self.capture_queue = CaptureQueue(self._upload, outbox=self.outbox)
+        self._done = queue.Queue()
+
+    def connect(self):
+        result = self.notion_api.test_connection()
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        self.capture_queue.start()
+
+    def submit(self, content):
+        digest = self._content_digest(content)
+        item = self.capture_queue.submit(content)
+        if item is None:
+            return None
+        item.digest = digest
+        self.dedup_index.record(digest)
+        return item
+
+    def wait(self, count):
+        """count 件の保存が終わるまで待ち、(キュー投入から保存完了までの秒数, 成功したか) のリストを返す"""
+        return [self._done.get() for _ in range(count)]
+
+    def close(self):
+        self.capture_queue.stop(timeout=30)
+        self.outbox.close()
+
+    def _upload(self, item):
+        result = self.notion_api.create_page(title=item.title, content=item.content)
+        if result['success'] and item.digest:
+            self.dedup_index.set_page(item.digest, result['page_id'])
+        self._done.put((time.perf_counter() - item.enqueued_at, result['success']))
+        return result
+
+
+def scenario_single(pipeline, count=20):
+    samples = []
+    started = time.perf_counter()
+    for index in range(count):
+        pipeline.submit(make_clip(index))
+        samples.extend(pipeline.wait(1))
+    return samples, time.perf_counter() - started, count * len(make_clip(0))
+
+
+def scenario_burst(pipeline, count=100):
+    started = time.perf_counter()
+    for index in range(count):
+        pipeline.submit(make_clip(index))
+    samples = pipeline.wait(count)
+    return samples, time.perf_counter() - started, count * len(make_clip(0))
+
+
+def scenario_large(pipeline, size=10_000_000):
+    from bench.bench_chunker import make_text
+
+    text = make_text(size)
+    started = time.perf_counter()
+    pipeline.submit(text)
+    samples = pipeline.wait(1)
+    return samples, time.perf_counter() - started, len(text)
+
+
+def run_child(scenario):
+    """子プロセス側: シナリオを1回実行し、結果を1行の JSON で出力"""
+    started = time.perf_counter()
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(io.StringIO()):
+        pipeline = SavePipeline(workdir)
+        pipeline.connect()
+        try:
+            if scenario == "cold_start":
+                pipeline.submit(make_clip(0))
+                samples = pipeline.wait(1)
+                # 起動からの時間を1件目の所要時間とする
+                samples = [(time.perf_counter() - started, samples[0][1])]
+                elapsed, size = samples[0][0], len(make_clip(0))
+            else:
+                runner = {"single": scenario_single, "burst": scenario_burst, "large": scenario_large}
+                samples, elapsed, size = runner[scenario](pipeline)
+        finally:
+            pipeline.close()
+        client_stats = pipeline.notion_api.client.stats()
+
+    latencies = [latency for latency, _ in samples]
+    result = {
+        "clips": len(samples),
+        "failed": sum(1 for _, success in samples if not success),
+        "elapsed": elapsed,
+        "bytes": size,
+        "latencies": latencies,
+        "retries": client_stats.get("retries", 0),
+        "rate_limited": client_stats.get("rate_limited", 0),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    stdout.write(RESULT_PREFIX + json.dumps(result) + "\n")
+    stdout.flush()
+
+
+def run_scenario(scenario, args):
+    """親プロセス側: 代替サーバーを起動し、子プロセスでシナリオを実行"""
+    from bench.fake_notion import FakeNotionServer
+
+    fake = FakeNotionServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        keep_content=False,
+    ).start()
+    try:
+        env = dict(
+            os.environ,
+            NOTION_BASE_URL=fake.base_url,
+            NOTION_API_KEY="secret_bench",
+            NOTION_DATABASE_ID="bench-database",
+            NOTION_RATE_LIMIT=str(args.rate),
+            NOTION_WARMUP_INTERVAL="0",
+            PYTHONDONTWRITEBYTECODE="1",
+        )
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-m", "bench.run", "--child", scenario],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - started
+    finally:
+        fake.stop()
+
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+            result["wall"] = wall
+            result["requests"] = fake.request_count
+            return result
+
+    error = (completed.stderr.strip().splitlines() or ["結果が出力されませんでした"])[-1]
+    raise RuntimeError(f"{scenario}: {error}")
+
+
+def summarize(runs):
+    """複数回の結果を中央値でまとめる"""
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    summary = {
+        "runs": len(runs),
+        "clips": runs[0]["clips"],
+        "failed": max(run["failed"] for run in runs),
+        "throughput": statistics.median(run["clips"] / run["elapsed"] for run in runs),
+        "mb_per_sec": statistics.median(run["bytes"] / run["elapsed"] / 1_000_000 for run in runs),
+        "requests": median("requests"),
+        "retries": median("retries"),
+        "rate_limited": median("rate_limited"),
+        "peak_rss_mb": median("peak_rss_mb"),
+        "wall": median("wall"),
+    }
+    for point in (50, 95, 99):
+        summary[f"p{point}"] = statistics.median(percentile(run["latencies"], point) for run in runs)
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """基準の結果より threshold（割合）以上悪化した項目を返す"""
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if not previous:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            before, after = previous.get(key), current.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if key in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append((scenario, key, before, after, change))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'シナリオ':<12}{'件数':>6}{'件/秒':>10}{'MB/秒':>9}{'p50':>10}{'p95':>10}{'p99':>10}"
+          f"{'RSS':>9}{'リクエスト':>8}{'再送':>6}")
+    for scenario, summary in results.items():
+        print(
+            f"{scenario:<14}{summary['clips']:>6}{summary['throughput']:>10.1f}"
+            f"{summary['mb_per_sec']:>9.2f}"
+            f"{summary['p50'] * 1000:>8.1f}ms{summary['p95'] * 1000:>8.1f}ms{summary['p99'] * 1000:>8.1f}ms"
+            f"{summary['peak_rss_mb']:>7.1f}MB{summary['requests']:>10.0f}{summary['retries']:>8.0f}"
+        )
+        if summary['failed']:
+            print(f"  ⚠️  保存に失敗したクリップ: {summary['failed']}件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存経路のベンチマーク（ローカルの代替サーバーを使用）")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="実行するシナリオ")
+    parser.add_argument("--runs", type=int, default=3, help="各シナリオを繰り返す回数（中央値を表示）")
+    parser.add_argument("--latency", type=float, default=0.05, help="代替サーバーの応答遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 を返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 を返す割合")
+    parser.add_argument("--retry-after", type=float, default=1, help="429 の Retry-After（秒）")
+    parser.add_argument("--rate", type=float, default=1000,
+                        help="クライアント側のレート制限（リクエスト/秒、実際のNotionに合わせるなら 3）")
+    parser.add_argument("--seed", type=int, default=0, help="エラー注入の乱数の種")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    parser.add_argument("--save", help="結果を JSON ファイルに保存")
+    parser.add_argument("--compare", help="基準の結果（--save で保存した JSON）と比較")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="悪化とみなす変化の割合（0.2 = 20%%）")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    results = {}
+    for scenario in args.scenarios:
+        if not args.json:
+            print(f"{scenario} を実行中...", file=sys.stderr)
+        results[scenario] = summarize([run_scenario(scenario, args) for _ in range(args.runs)])
+
+    report = {
+        "config": {
+            "runs": args.runs,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+            "rate": args.rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("⚠️  基準と条件（遅延・エラー率など）が異なります", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for scenario, key, before, after, change in regressions:
+            print(f"✗ {scenario} の {key} が悪化: {before:.4g} → {after:.4g} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("✓ 基準からの悪化はありません", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
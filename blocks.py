@@ -0,0 +1,418 @@
+"""
+クリップの内容に合わせた Notion ブロックへの変換
+
+Markdown（見出し・箇条書き・チェックボックス・引用・区切り線・コードブロック）、
+ソースコード（言語を推定したコードブロック）、URL（ブックマーク）を判定して
+ページ本文のブロックを作る。どれにも当てはまらない普通のテキストは None を返し、
+これまでどおり段落として保存する。
+
+変換は行ごとの1回の走査で、判定に読むのは先頭の一定量だけなので、入力の大きさに
+比例した時間で終わる。結果は内容のハッシュをキーにした LRU キャッシュに入れ、
+再送や同じ内容の保存では変換し直さない。
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+from chunker import ARRAY_LIMIT, TEXT_LIMIT, iter_segments, take_segments, paragraph_blocks
+from dedup import content_digest
+from metrics import metrics
+
+# 変換の方式（CLIP_FORMAT で変更）
+#   auto:  内容に合わせて変換する
+#   plain: 変換せず、すべて段落として保存する
+CLIP_FORMATS = ('auto', 'plain')
+
+# 種類の判定に使う先頭部分の文字数
+DETECT_CHARS = 8192
+
+# 変換するブロック数の上限（100ブロックごとに追記リクエストが1回増えるため、残りは段落にする）
+MAX_BLOCKS = 1000
+
+# コードブロック1個あたりのペイロード（1リクエストに複数入るように）
+CODE_BLOCK_BYTES = 40_000
+
+# キャッシュの上限
+CACHE_ENTRIES = 64
+CACHE_CHARS = 8 * 1024 * 1024
+
+# ```python のような指定から Notion の言語名への変換
+LANGUAGE_ALIASES = {
+    "py": "python", "python3": "python",
+    "js": "javascript", "jsx": "javascript", "node": "javascript",
+    "ts": "typescript", "tsx": "typescript",
+    "sh": "shell", "zsh": "shell", "console": "shell",
+    "rb": "ruby", "rs": "rust", "golang": "go", "kt": "kotlin",
+    "cpp": "c++", "cc": "c++", "cxx": "c++", "h": "c", "cs": "c#", "csharp": "c#",
+    "yml": "yaml", "md": "markdown", "objc": "objective-c",
+    "ps1": "powershell", "text": "plain text", "txt": "plain text", "plaintext": "plain text",
+}
+
+NOTION_LANGUAGES = {
+    "bash", "c", "c#", "c++", "css", "diff", "docker", "go", "graphql", "html", "java",
+    "javascript", "json", "kotlin", "lua", "makefile", "markdown", "objective-c", "perl",
+    "php", "plain text", "powershell", "python", "r", "ruby", "rust", "scala", "shell",
+    "sql", "swift", "toml", "typescript", "xml", "yaml",
+}
+
+# 言語の推定（先頭部分で一致した数が最も多い言語）
+_LANGUAGE_PATTERNS = [
+    ("python", r"^\s*(def \w+\(.*\):|class \w+.*:|from [\w.]+ import |import \w+$|elif .*:|print\()|self\."),
+    ("javascript", r"\b(const|let|var) \w+ = |=> ?\{|function\s*\w*\(|console\.log\(|require\(|module\.exports"),
+    ("typescript", r"^\s*(interface|type) \w+ |: (string|number|boolean)\b|^\s*export (interface|type) "),
+    ("go", r"^package \w+$|^func (\(\w+ \*?\w+\) )?\w+\(|:= |^import \($"),
+    ("rust", r"\bfn \w+\(|\blet mut \b|^use \w+::|\bimpl\b.*\{|println!\("),
+    ("java", r"\bpublic (static )?(class|void|final)\b|System\.out\.|^import java\."),
+    ("c", r"^#include <\w+\.h>|\bprintf\(|\bint main\("),
+    ("c++", r"^#include <\w+>$|std::|\bcout\b|\btemplate ?<"),
+    ("ruby", r"^\s*(def \w+[?!]?$|end$|require ['\"])|\bputs\b|\.each do\b"),
+    ("php", r"<\?php|\$\w+ = |\bfunction \w+\(\$"),
+    ("shell", r"^#!/(usr/)?bin/(env )?(ba|z)?sh|^\s*(echo|export|cd|sudo|apt|brew|pip|npm|git) |^\$ |\bfi$|\bdone$"),
+    ("sql", r"(?i)^\s*(select .+ from|insert into|update \w+ set|create table|delete from|alter table)\b"),
+    ("html", r"(?i)<!doctype html|</?(html|head|body|div|span|p|a|ul|li|script)[ >]"),
+    ("css", r"^[.#]?[\w-]+( [.#]?[\w-]+)* \{$|^\s*[\w-]+: [^;]+;$"),
+    ("json", r"^\s*[{\[]$|^\s*\"[^\"]+\": "),
+    ("yaml", r"^[\w-]+:( |$)|^\s+- \w+"),
+    ("diff", r"^(\+\+\+|---) \S|^@@ .* @@"),
+    ("docker", r"^(FROM|RUN|COPY|CMD|ENTRYPOINT|WORKDIR) "),
+]
+_LANGUAGE_REGEXES = [(language, re.compile(pattern, re.MULTILINE)) for language, pattern in _LANGUAGE_PATTERNS]
+
+# ソースコードらしい行（記号で終わる・インデントされている・キーワードで始まる）
+_CODE_LINE = re.compile(
+    r"[;{}()\[\]:,]\s*$|^(\t| {2,})\S|^\s*(def|class|import|from|return|if|for|while|function|const|let|var|"
+    r"package|func|fn|pub|public|private|#include|#!|SELECT|select|@\w+)\b|^\s*(//|/\*|\*/|--) "
+)
+
+_FENCE = re.compile(r"^\s*(`{3,}|~{3,})\s*([\w+#.-]*)")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_TODO = re.compile(r"^\s*[-*+]\s+\[([ xX])\]\s+(.*)$")
+_BULLET = re.compile(r"^\s*[-*+]\s+(.*)$")
+_NUMBERED = re.compile(r"^\s*\d{1,9}[.)]\s+(.*)$")
+_QUOTE = re.compile(r"^\s*>\s?(.*)$")
+_DIVIDER = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_URL_LINE = re.compile(r"^\s*<?(https?://[^\s<>]+)>?\s*$")
+
+# 行内の書式（`コード`・**太字**・[リンク](URL)・URL）
+_INLINE = re.compile(
+    r"`([^`\n]+)`|\*\*([^*\n]+)\*\*|\[([^\]\n]+)\]\((https?://[^)\s]+)\)|(https?://[^\s<>()\[\]]+)"
+)
+
+# URL・リンクの上限（Notion API の制限）
+URL_LIMIT = 2000
+
+
+def load_format_config():
+    """環境変数から変換の方式を読み込み"""
+    clip_format = os.environ.get('CLIP_FORMAT', 'auto').strip().lower()
+    if clip_format not in CLIP_FORMATS:
+        print(f"⚠️  不明な CLIP_FORMAT です: {clip_format}（auto として扱います）")
+        clip_format = 'auto'
+    return clip_format
+
+
+def detect_kind(text, limit=DETECT_CHARS):
+    """クリップの種類を判定（'url' / 'code' / 'markdown' / 'text'）
+
+    先頭 limit 文字だけを見る。
+    """
+    head = text[:limit]
+    lines = [line for line in head.splitlines() if line.strip()]
+    if len(head) < len(text) and len(lines) > 1:
+        # 途中で切れた最後の行は数えない
+        lines.pop()
+    if not lines:
+        return 'text'
+
+    if all(_URL_LINE.match(line) for line in lines):
+        return 'url'
+
+    markdown = 0
+    code = 0
+    for line in lines:
+        if _FENCE.match(line):
+            # コードブロックの囲みがあれば Markdown として扱う
+            return 'markdown'
+        if _CODE_LINE.search(line):
+            code += 1
+        if (_HEADING.match(line) or _BULLET.match(line) or _NUMBERED.match(line)
+                or _QUOTE.match(line) or _DIVIDER.match(line) or _URL_LINE.match(line)):
+            markdown += 1
+
+    # 「# コメント」や「- 」で始まる行はコードにもあるので、先にコードかを判定する
+    if len(lines) >= 2 and code * 2 >= len(lines) and code > markdown:
+        return 'code'
+    if lines[0].startswith('#!'):
+        return 'code'
+    if markdown:
+        return 'markdown'
+    return 'text'
+
+
+def detect_language(code):
+    """コードの言語を推定（Notion の言語名、分からなければ 'plain text'）"""
+    head = code[:DETECT_CHARS]
+    best = "plain text"
+    best_score = 0
+    for language, regex in _LANGUAGE_REGEXES:
+        score = len(regex.findall(head))
+        if score > best_score:
+            best, best_score = language, score
+    return best
+
+
+def normalize_language(name, code=""):
+    """```の後の言語指定を Notion の言語名にする（指定がなければ推定）"""
+    name = name.strip().lower()
+    if not name:
+        return detect_language(code)
+    name = LANGUAGE_ALIASES.get(name, name)
+    return name if name in NOTION_LANGUAGES else "plain text"
+
+
+def inline_rich_text(text):
+    """行内の書式を解釈して rich_text 配列を作る（各要素は2000文字以下）"""
+    items = []
+    pos = 0
+    for match in _INLINE.finditer(text):
+        if match.start() > pos:
+            _append_text(items, text[pos:match.start()])
+        code, bold, label, link, url = match.groups()
+        if code is not None:
+            _append_text(items, code, annotations={"code": True})
+        elif bold is not None:
+            _append_text(items, bold, annotations={"bold": True})
+        elif label is not None:
+            _append_text(items, label, link=link)
+        else:
+            _append_text(items, url, link=url)
+        pos = match.end()
+    if pos < len(text):
+        _append_text(items, text[pos:])
+    return items
+
+
+def _append_text(items, text, annotations=None, link=None):
+    if link is not None and len(link) > URL_LIMIT:
+        link = None
+    for segment in iter_segments(text):
+        item = {"text": {"content": segment}}
+        if link is not None:
+            item["text"]["link"] = {"url": link}
+        if annotations:
+            item["annotations"] = annotations
+        items.append(item)
+
+
+def text_blocks(block_type, text, extra=None):
+    """rich_text を持つブロックを作る（要素が100を超える場合は同じ種類のブロックに分ける）"""
+    items = inline_rich_text(text)
+    for start in range(0, max(len(items), 1), ARRAY_LIMIT):
+        body = {"rich_text": items[start:start + ARRAY_LIMIT]}
+        if extra:
+            body.update(extra)
+        yield {"object": "block", "type": block_type, block_type: body}
+
+
+def code_blocks(code, language):
+    """コードブロックを作る（大きなコードは CODE_BLOCK_BYTES ごとのブロックに分ける）"""
+    segments = iter_segments(code)
+    while True:
+        taken, segments = take_segments(segments, max_bytes=CODE_BLOCK_BYTES)
+        if not taken:
+            return
+        yield {
+            "object": "block",
+            "type": "code",
+            "code": {
+                "rich_text": [{"text": {"content": segment}} for segment in taken],
+                "language": language,
+            }
+        }
+
+
+def bookmark_block(url):
+    if len(url) > URL_LIMIT:
+        return next(paragraph_blocks([url[:TEXT_LIMIT]]))
+    return {"object": "block", "type": "bookmark", "bookmark": {"url": url}}
+
+
+def markdown_blocks(text, max_blocks=MAX_BLOCKS):
+    """Markdown を1行ずつ走査してブロックのリストを作る
+
+    max_blocks 個に達したら、残りの行は変換せずに段落としてまとめて入れる。
+    """
+    blocks = []
+    paragraph = []
+    fence = None
+    fence_language = ""
+    code_lines = []
+
+    def flush_paragraph():
+        if paragraph:
+            blocks.extend(text_blocks("paragraph", "\n".join(paragraph)))
+            paragraph.clear()
+
+    lines = iter(text.splitlines())
+    for line in lines:
+        if fence is not None:
+            if line.strip().startswith(fence):
+                code = "\n".join(code_lines)
+                blocks.extend(code_blocks(code, normalize_language(fence_language, code)))
+                fence = None
+                code_lines = []
+            else:
+                code_lines.append(line)
+            continue
+
+        if len(blocks) >= max_blocks and not paragraph:
+            # ブロックが多すぎると追記リクエストが増えるので、残りは段落にする
+            rest = "\n".join(chain([line], lines))
+            blocks.extend(paragraph_blocks(iter_segments(rest)))
+            return blocks
+
+        match = _FENCE.match(line)
+        if match:
+            flush_paragraph()
+            fence = match.group(1)
+            fence_language = match.group(2)
+            continue
+
+        if not line.strip():
+            flush_paragraph()
+            continue
+
+        if _DIVIDER.match(line):
+            flush_paragraph()
+            blocks.append({"object": "block", "type": "divider", "divider": {}})
+            continue
+
+        match = _HEADING.match(line)
+        if match:
+            flush_paragraph()
+            # Notion の見出しは3段階まで
+            level = min(len(match.group(1)), 3)
+            heading = match.group(2).rstrip()
+            # 「## 見出し ##」のような閉じの # は除く（「C#」の # は残す）
+            stripped = heading.rstrip('#')
+            if stripped != heading and stripped[-1:].isspace():
+                heading = stripped.rstrip()
+            blocks.extend(text_blocks(f"heading_{level}", heading))
+            continue
+
+        match = _TODO.match(line)
+        if match:
+            flush_paragraph()
+            blocks.extend(text_blocks("to_do", match.group(2), {"checked": match.group(1) != " "}))
+            continue
+
+        match = _BULLET.match(line)
+        if match:
+            flush_paragraph()
+            blocks.extend(text_blocks("bulleted_list_item", match.group(1)))
+            continue
+
+        match = _NUMBERED.match(line)
+        if match:
+            flush_paragraph()
+            blocks.extend(text_blocks("numbered_list_item", match.group(1)))
+            continue
+
+        match = _QUOTE.match(line)
+        if match:
+            flush_paragraph()
+            blocks.extend(text_blocks("quote", match.group(1)))
+            continue
+
+        match = _URL_LINE.match(line)
+        if match:
+            flush_paragraph()
+            blocks.append(bookmark_block(match.group(1)))
+            continue
+
+        paragraph.append(line)
+
+    flush_paragraph()
+    if fence is not None:
+        # 閉じられていないコードブロックは最後までをコードとして扱う
+        code = "\n".join(code_lines)
+        blocks.extend(code_blocks(code, normalize_language(fence_language, code)))
+    return blocks
+
+
+def convert_blocks(text, kind=None):
+    """クリップをページ本文のブロックのリストに変換（普通のテキストなら None）"""
+    kind = kind or detect_kind(text)
+    if kind == 'text':
+        return None
+    if kind == 'code':
+        return list(code_blocks(text.strip('\n'), detect_language(text)))
+    # URL だけのクリップも、各行がブックマークになる Markdown として扱う
+    return markdown_blocks(text)
+
+
+class BlockCache:
+    """内容のハッシュ → 変換結果 の LRU キャッシュ
+
+    同じ内容は同じブロックになるので、再送や重複したクリップの保存では変換し直さない。
+    件数と元のテキストの合計文字数の両方に上限がある。返したブロックは共有されるので、
+    呼び出し側で変更しないこと。
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, max_chars=CACHE_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, text):
+        """変換結果を返す（キャッシュになければ変換して保存）"""
+        # 判定は先頭だけを見るので、普通のテキストはハッシュを計算せずに返す
+        kind = detect_kind(text)
+        if kind == 'text':
+            return None
+        key = content_digest(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        with metrics.span("convert"):
+            blocks = convert_blocks(text, kind)
+
+        if len(text) <= self.max_chars:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = (blocks, len(text))
+                    self._chars += len(text)
+                while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                    _, (_, size) = self._entries.popitem(last=False)
+                    self._chars -= size
+        return blocks
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+    def stats(self):
+        """キャッシュの統計情報を取得"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "chars": self._chars,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# アプリ全体で共有するキャッシュ
+block_cache = BlockCache()
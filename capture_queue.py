@@ -0,0 +1,332 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+from dedup import hash_text
+from metrics import metrics
+
+
+class CaptureItem:
+    """キャプチャしたクリップ1件分のデータ"""
+
+    def __init__(self, content, title=None, key=None, attachments=None, route=None):
+        self.content = content
+        # 画像・ファイル（attachments.py の dict のリスト、ページの末尾に表示する）
+        self.attachments = attachments or []
+        # タイトルはキャプチャ時刻（送信が遅れても取得した時刻を残す）
+        self.title = title or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._key = key
+        # 重複判定用の内容のダイジェスト（判定したときのみ設定される）
+        self.digest = None
+        # 保存先（設定を再読み込みしても、それより前に積まれた分は元の保存先に送る）
+        self.target = None
+        # 振り分けルールの名前（routing.py、送信箱から戻したときに同じ保存先を選び直す）
+        self.route = route
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def key(self):
+        """重複排除用のキー（タイムスタンプと内容のハッシュ）"""
+        if self._key is None:
+            digest = hash_text(self.title + '\0')
+            for attachment in self.attachments:
+                digest = hash_text(attachment["path"] + '\0', digest)
+            self._key = hash_text(self.content, digest).hexdigest()
+        return self._key
+
+    @property
+    def wait_time(self):
+        """キューで待っていた時間（秒）"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.enqueued_at
+
+    @property
+    def latency(self):
+        """キュー投入から送信完了までの時間（秒）"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.enqueued_at
+
+
+class CaptureQueue:
+    """ホットキーで取得したクリップを受け取り、バックグラウンドで送信するキュー
+
+    handler はワーカースレッドから CaptureItem を1件ずつ受け取って呼ばれ、
+    NotionAPI.create_page と同じ形式の結果 dict を返す。
+    outbox を渡すと、submit の時点で送信箱へ書き込み（キューに積む前に永続化する）、結果を記録する。
+
+    batch_handler を渡すとまとめ送信になり、最大 batch_size 件を
+    batch_window 秒まで、または batch_idle 秒新しいクリップが来なくなるまで
+    溜めてから、CaptureItem のリストで呼ばれる（結果もクリップごとのリスト）。
+
+    max_depth を指定すると、送信待ちがその件数に達している間 submit が待たされる
+    （スクリプトなどから大量に送られてきたときの流量制御）。
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, outbox=None, batch_handler=None,
+                 batch_size=10, batch_window=10.0, batch_idle=2.0, max_depth=0):
+        self.handler = handler
+        self.outbox = outbox
+        self.batch_handler = batch_handler
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.batch_idle = batch_idle
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._thread = None
+        self._lock = threading.Lock()
+        # abandon で送信を打ち切ったら、ワーカーは送信中の分が終わりしだい停止する
+        self._abandoned = threading.Event()
+        # キューに積まれている（または送信中の）クリップのキー
+        self._queued_keys = set()
+
+        # 統計情報
+        self.processed = 0
+        self.failed = 0
+        self.last_wait = None
+        self.last_latency = None
+        self.max_latency = 0.0
+        self._latency_total = 0.0
+
+    def start(self):
+        """ワーカースレッドを起動"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="CaptureQueueWorker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """キューに残っている分を処理してからワーカーを停止（溜めている分も送信）
+
+        timeout 秒以内に終わらなければ False を返す（ワーカーは止まらないので、abandon で打ち切る）。
+        """
+        if not self._thread:
+            return True
+        started = time.monotonic()
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.monotonic() - started))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        self._thread = None
+        return True
+
+    def abandon(self):
+        """送信を打ち切り、まだ送信を始めていないクリップを返す（送信中の分はそのまま終わらせる）"""
+        self._abandoned.set()
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                items.append(item)
+        # 待機中のワーカーを起こして止める
+        try:
+            self._queue.put_nowait(self._STOP)
+        except queue.Full:
+            pass
+        return items
+
+    def submit(self, content, title=None, timeout=None, target=None, attachments=None, route=None, key=None):
+        """クリップをキューに積む（送信完了は待たない）
+
+        キューが max_depth 件で埋まっていれば空くまで待つ（timeout 秒を過ぎたら queue.Full）。
+        target は handler に渡す item.target（送信箱から戻した分は None）。
+        送信箱に書き込んでから積むので、積んだ後にプロセスが落ちても次回起動時に再送される。
+        送信箱で送信済みと分かったクリップ・すでに積まれているクリップ（同じ時刻・同じ内容）は積まずに None を返す。
+        key を指定すると、時刻と内容から作るキーの代わりに使う（同じ内容を何度でも送る場合）。
+        """
+        item = CaptureItem(content, title, key=key, attachments=attachments, route=route)
+        item.target = target
+        if not self._persist(item):
+            return None
+        try:
+            self._queue.put(item, timeout=timeout)
+        except queue.Full:
+            # 積めなかった分は送信箱からも取り消す（呼び出し側が積み直す）
+            self._forget(item)
+            raise
+        return item
+
+    def resubmit(self, item):
+        """送信箱から戻したクリップを積み直す（すでにキューにあれば何もしない）"""
+        with self._lock:
+            if item.key in self._queued_keys:
+                return False
+            self._queued_keys.add(item.key)
+        self._queue.put(item)
+        return True
+
+    def depth(self):
+        """送信待ちの件数"""
+        return self._queue.qsize()
+
+    def outstanding(self):
+        """積まれてからまだ送信が終わっていない件数（送信中の分を含む）"""
+        with self._lock:
+            return len(self._queued_keys)
+
+    def stats(self):
+        """キューの統計情報を取得"""
+        with self._lock:
+            processed = self.processed
+            return {
+                "depth": self.depth(),
+                "processed": processed,
+                "failed": self.failed,
+                "last_wait": self.last_wait,
+                "last_latency": self.last_latency,
+                "avg_latency": self._latency_total / processed if processed else None,
+                "max_latency": self.max_latency,
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping and not self._abandoned.is_set():
+            if self.batch_handler:
+                batch, stopping = self._collect_batch()
+                if batch and not self._abandoned.is_set():
+                    self._process_batch(batch)
+            else:
+                batch, stopping = self._collect()
+                for item in batch:
+                    if self._abandoned.is_set():
+                        # 送信箱には書き込み済みなので、次回起動時に再送される
+                        break
+                    self._process(item)
+
+    def _collect(self):
+        """溜まっている分をまとめて取り出す"""
+        batch = [self._queue.get()]
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if self._STOP in batch:
+            return [item for item in batch if item is not self._STOP], True
+        return batch, False
+
+    def _collect_batch(self):
+        """まとめ送信の1回分を集める（件数・待ち時間・アイドル時間で区切る）"""
+        first = self._queue.get()
+        if first is self._STOP:
+            return [], True
+
+        batch = [first]
+        started = last = time.monotonic()
+        while len(batch) < self.batch_size:
+            now = time.monotonic()
+            timeout = min(started + self.batch_window - now, last + self.batch_idle - now)
+            try:
+                # 待ち時間を過ぎても、すでに積まれている分は同じ回にまとめる
+                if timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                return batch, True
+            batch.append(item)
+            last = time.monotonic()
+
+        return batch, False
+
+    def _persist(self, item):
+        """送信箱に書き込む（送信済み、またはすでにキューにあるクリップなら False）"""
+        with self._lock:
+            if item.key in self._queued_keys:
+                return False
+            self._queued_keys.add(item.key)
+        if not self.outbox:
+            return True
+        try:
+            if self.outbox.add_many([item]):
+                return True
+        except Exception as e:
+            # 送信箱に書けなくても送信はする（再送はできない）
+            print(f"✗ 送信箱への書き込みエラー: {e}")
+            return True
+        with self._lock:
+            self._queued_keys.discard(item.key)
+        return False
+
+    def _forget(self, item):
+        with self._lock:
+            self._queued_keys.discard(item.key)
+        if self.outbox:
+            try:
+                self.outbox.discard(item.key)
+            except Exception as e:
+                print(f"✗ 送信箱の更新エラー: {e}")
+
+    def _process(self, item):
+        item.started_at = time.perf_counter()
+        try:
+            result = self.handler(item)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        item.finished_at = time.perf_counter()
+
+        self._finish(item, result)
+
+    def _process_batch(self, items):
+        started = time.perf_counter()
+        for item in items:
+            item.started_at = started
+        try:
+            results = self.batch_handler(items)
+        except Exception as e:
+            results = [{"success": False, "error": str(e)}] * len(items)
+        finished = time.perf_counter()
+
+        for item, result in zip(items, results):
+            item.finished_at = finished
+            self._finish(item, result)
+
+    def _finish(self, item, result):
+        if self.outbox:
+            try:
+                if result and result.get("success"):
+                    self.outbox.mark_sent(item.key)
+                else:
+                    self.outbox.mark_failed(
+                        item.key,
+                        (result or {}).get("error", ""),
+                        permanent=not (result or {}).get("retryable", True),
+                    )
+            except Exception as e:
+                print(f"✗ 送信箱の更新エラー: {e}")
+        with self._lock:
+            self._queued_keys.discard(item.key)
+
+        self._record(item, result)
+
+    def _record(self, item, result):
+        with self._lock:
+            self.processed += 1
+            if not result or not result.get("success"):
+                self.failed += 1
+            self.last_wait = item.wait_time
+            self.last_latency = item.latency
+            self.max_latency = max(self.max_latency, item.latency)
+            self._latency_total += item.latency
+
+        metrics.observe("queue_wait", item.wait_time)
+        metrics.observe("save", item.finished_at - item.started_at)
+        metrics.observe("end_to_end", item.latency)
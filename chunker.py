@@ -0,0 +1,150 @@
+import json
+import unicodedata
+from itertools import chain
+
+# Notion API の制限
+# rich_text 1要素あたりの文字数（UTF-16 のコード単位で数えられる）
+TEXT_LIMIT = 2000
+# 配列（rich_text・children）の要素数
+ARRAY_LIMIT = 100
+# 1リクエストのペイロード（上限 500KB に余裕を持たせる）
+REQUEST_BYTES = 450_000
+
+# 「メモ」プロパティに入れる分量の上限（残りはページ本文に入れる）
+MEMO_BYTES = 100_000
+
+# 書記素の途中で区切らないために後ろへ戻る最大文字数
+_MAX_GRAPHEME_BACKTRACK = 32
+
+
+def iter_segments(text, limit=TEXT_LIMIT):
+    """テキストを limit 以下のセグメントに分割して順に返す
+
+    できるだけ改行、次に空白の直後で区切り、見つからなければ結合文字や
+    絵文字の ZWJ シーケンスを分断しない位置で区切る。元の文字列から
+    スライスで切り出すだけなので、全体のコピーは作らない。
+    """
+    pos = 0
+    length = len(text)
+    while pos < length:
+        end = min(pos + limit, length)
+        segment = text[pos:end]
+
+        # 絵文字などサロゲートペアになる文字は2単位として数える
+        if not segment.isascii():
+            over = _utf16_length(segment) - limit
+            while over > 0:
+                end -= max(1, over // 2)
+                segment = text[pos:end]
+                over = _utf16_length(segment) - limit
+
+        if end < length:
+            end = _find_break(text, pos, end)
+            segment = text[pos:end]
+
+        yield segment
+        pos = end
+
+
+def take_segments(segments, max_bytes=MEMO_BYTES, max_items=ARRAY_LIMIT):
+    """セグメントを上限まで取り出し、(取り出した分, 残りのイテレータ) を返す"""
+    taken = []
+    size = 0
+    for segment in segments:
+        cost = _json_size(segment)
+        if taken and (len(taken) >= max_items or size + cost > max_bytes):
+            return taken, chain([segment], segments)
+        taken.append(segment)
+        size += cost
+    return taken, iter(())
+
+
+def rich_text(segments):
+    """セグメントのリストから rich_text 配列を作る"""
+    return [{"text": {"content": segment}} for segment in segments]
+
+
+def paragraph_blocks(segments):
+    """セグメントごとに段落ブロックを作って順に返す"""
+    for segment in segments:
+        yield {
+            "object": "block",
+            "type": "paragraph",
+            "paragraph": {"rich_text": rich_text([segment])}
+        }
+
+
+def paginate_blocks(blocks, first_budget=REQUEST_BYTES, max_items=ARRAY_LIMIT):
+    """ブロックを1リクエスト分ずつ（100個・ペイロード上限以内）に区切って返す
+
+    最初の1回分はページ作成リクエストに同梱するため、プロパティの分を
+    差し引いた first_budget を使う。収まらなければ最初は空のリストになる。
+    """
+    batch = []
+    size = 0
+    budget = first_budget
+    first = True
+    for block in blocks:
+        cost = _json_size(block)
+        if len(batch) >= max_items or size + cost > budget:
+            if batch or first:
+                yield batch
+            batch = []
+            size = 0
+            budget = REQUEST_BYTES
+            first = False
+        batch.append(block)
+        size += cost
+
+    if batch or first:
+        yield batch
+
+
+def _find_break(text, pos, end):
+    """pos〜end の範囲で区切りに適した位置を探す"""
+    half = pos + (end - pos) // 2
+
+    cut = text.rfind('\n', half, end)
+    if cut != -1:
+        return cut + 1
+
+    cut = text.rfind(' ', half, end)
+    if cut != -1:
+        return cut + 1
+
+    for candidate in range(end, max(pos + 1, end - _MAX_GRAPHEME_BACKTRACK), -1):
+        if _is_grapheme_boundary(text, candidate):
+            return candidate
+    return end
+
+
+def _is_grapheme_boundary(text, index):
+    """index の直前で区切っても書記素が分断されないか（簡易判定）"""
+    before = text[index - 1]
+    after = text[index]
+    if before == '\r' and after == '\n':
+        return False
+    if before == '\u200d' or after == '\u200d':
+        return False
+    if unicodedata.combining(after):
+        return False
+
+    code = ord(after)
+    # 異体字セレクタ・肌の色・タグ文字
+    if 0xFE00 <= code <= 0xFE0F or 0xE0100 <= code <= 0xE01EF:
+        return False
+    if 0x1F3FB <= code <= 0x1F3FF or 0xE0020 <= code <= 0xE007F:
+        return False
+    # 国旗（リージョナルインジケータの組）
+    if 0x1F1E6 <= code <= 0x1F1FF and 0x1F1E6 <= ord(before) <= 0x1F1FF:
+        return False
+    return True
+
+
+def _utf16_length(segment):
+    return len(segment.encode('utf-16-le')) // 2
+
+
+def _json_size(value):
+    """JSONにしたときのバイト数（非ASCIIはエスケープされる前提で多めに見積もる）"""
+    return len(json.dumps(value))
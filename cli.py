@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+コマンドラインからの操作（メニューバーなし）
+
+    python cli.py daemon                  # ソケットでクリップを受け付けるデーモン
+    python cli.py daemon --stdin --no-socket < clips.txt
+    python cli.py send "保存するテキスト"    # 起動中のデーモンに送る
+    some-command | python cli.py send      # 標準入力の各行を送る
+    python cli.py import ~/notes app.log   # ファイル・ディレクトリを一括インポート
+    python cli.py sync                     # ローカルミラーを同期
+    python cli.py search 会議 議事録        # ローカルミラーを全文検索
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+import daemon
+
+
+def cmd_daemon(args):
+    socket_path = None if args.no_socket else (args.socket or daemon.default_socket_path())
+    if socket_path is None and not args.stdin:
+        print("✗ --no-socket を指定する場合は --stdin も指定してください")
+        return 2
+    return daemon.run_daemon(
+        socket_path=socket_path,
+        use_stdin=args.stdin,
+        framing=args.framing,
+        max_depth=args.max_depth,
+        verbose=args.verbose
+    )
+
+
+def cmd_send(args):
+    socket_path = args.socket or daemon.default_socket_path()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(socket_path))
+    except OSError as e:
+        print(f"✗ デーモンに接続できません: {socket_path}（{e}）")
+        return 1
+
+    with connection:
+        if args.text:
+            # 引数のテキストはデーモン側の形式で区切って送る
+            try:
+                data = b''.join(daemon.encode_clip(text, args.framing) for text in args.text)
+            except ValueError as e:
+                print(f"✗ {e}")
+                return 2
+            connection.sendall(data)
+        else:
+            # 標準入力はそのまま流す（区切りはデーモン側で解釈する）
+            while True:
+                chunk = sys.stdin.buffer.read(64 * 1024)
+                if not chunk:
+                    break
+                connection.sendall(chunk)
+        connection.shutdown(socket.SHUT_WR)
+        reply = connection.makefile('r', encoding='utf-8').readline().strip()
+
+    print(reply or "✗ デーモンから応答がありません")
+    return 0 if reply.startswith("OK") else 1
+
+
+def cmd_import(args):
+    import importer
+    daemon.load_env()
+    return importer.run_import(
+        args.paths,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        extensions=args.ext
+    )
+
+
+def cmd_sync(args):
+    from mirror import Mirror, MirrorSync, sync_client_for
+    from notion_api import NotionAPI
+    daemon.load_env()
+    try:
+        notion_api = NotionAPI()
+    except Exception as e:
+        print(f"✗ 初期化エラー: {e}")
+        return 1
+
+    mirror = Mirror()
+    try:
+        result = MirrorSync(sync_client_for(notion_api), notion_api.database_id, mirror).sync(full=args.full)
+        if not result['success']:
+            print(f"✗ 同期に失敗: {result['error']}")
+            return 1
+        print(f"✓ 同期しました: 取得 {result['fetched']}件 / 削除 {result['removed']}件 / "
+              f"リクエスト {result['requests']}回 ({result['elapsed']:.1f}秒)")
+        print(f"ミラーのページ数: {mirror.count(notion_api.database_id)}")
+        return 0
+    finally:
+        mirror.close()
+
+
+def cmd_search(args):
+    from mirror import Mirror
+    daemon.load_env()
+    mirror = Mirror()
+    try:
+        started = time.perf_counter()
+        results = mirror.search(" ".join(args.query), os.environ.get('NOTION_DATABASE_ID'), limit=args.limit)
+        elapsed = time.perf_counter() - started
+    finally:
+        mirror.close()
+
+    for result in results:
+        print(f"{result['title']}  {result['url'] or ''}")
+        print(f"    {result['snippet']}")
+    print(f"{len(results)}件 ({elapsed * 1000:.1f}ms)")
+    return 0 if results else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="clip-to-notion", description="Clip to Notion のコマンドライン")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    daemon_parser = subcommands.add_parser("daemon", help="ソケット・標準入力からクリップを受け付ける")
+    daemon_parser.add_argument("--socket", help=f"ソケットのパス（既定: {daemon.SOCKET_PATH}）")
+    daemon_parser.add_argument("--no-socket", action="store_true", help="ソケットで受け付けない")
+    daemon_parser.add_argument("--stdin", action="store_true", help="標準入力からも受け付ける")
+    daemon_parser.add_argument("--framing", choices=daemon.FRAMINGS, default="line",
+                               help="クリップの区切り方（line: 1行1件 / length: バイト数の後に本文）")
+    daemon_parser.add_argument("--max-depth", type=int, default=daemon.DEFAULT_MAX_DEPTH,
+                               help="送信待ちの上限（超えると受信を止めて送り側を待たせる）")
+    daemon_parser.add_argument("-v", "--verbose", action="store_true", help="保存に成功したクリップも表示")
+    daemon_parser.set_defaults(func=cmd_daemon)
+
+    send_parser = subcommands.add_parser("send", help="起動中のデーモンにクリップを送る")
+    send_parser.add_argument("text", nargs="*", help="送るテキスト（省略すると標準入力）")
+    send_parser.add_argument("--socket", help="ソケットのパス")
+    send_parser.add_argument("--framing", choices=daemon.FRAMINGS, default="line",
+                             help="デーモンの --framing と同じものを指定")
+    send_parser.set_defaults(func=cmd_send)
+
+    import_parser = subcommands.add_parser("import", help="ファイル・ディレクトリを一括インポート")
+    import_parser.add_argument("paths", nargs="+", help="インポートするファイル・ディレクトリ")
+    import_parser.add_argument("--ext", nargs="+", help="対象の拡張子（例: .md .txt、省略するとすべて）")
+    import_parser.add_argument("--workers", type=int, help="変換するプロセス数（既定: CPU数）")
+    import_parser.add_argument("--concurrency", type=int,
+                               help="同時に送信するページ数（既定: NOTION_CONCURRENCY）")
+    import_parser.add_argument("--checkpoint", help="進捗の記録先（既定: ~/.clip_to_notion/imports/）")
+    import_parser.set_defaults(func=cmd_import)
+
+    sync_parser = subcommands.add_parser("sync", help="Notion データベースをローカルミラーに同期")
+    sync_parser.add_argument("--full", action="store_true", help="すべて取り直し、削除されたページも反映")
+    sync_parser.set_defaults(func=cmd_sync)
+
+    search_parser = subcommands.add_parser("search", help="ローカルミラーを全文検索（オフライン）")
+    search_parser.add_argument("query", nargs="+", help="検索する語（すべてを含むページを探す）")
+    search_parser.add_argument("--limit", type=int, default=20, help="表示する件数")
+    search_parser.set_defaults(func=cmd_search)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
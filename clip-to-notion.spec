@@ -9,7 +9,27 @@ a = Analysis(
     datas=[
 	('setup_launcher.py', '.'),
         ('setup_gui.py', '.'),
+        ('config.py', '.'),
         ('notion_api.py', '.'),
+        ('period_pages.py', '.'),
+        ('capture_queue.py', '.'),
+        ('clipboard.py', '.'),
+        ('routing.py', '.'),
+        ('uploader_process.py', '.'),
+        ('clip_history.py', '.'),
+        ('outbox.py', '.'),
+        ('shutdown.py', '.'),
+        ('batch_uploader.py', '.'),
+        ('rate_limit.py', '.'),
+        ('chunker.py', '.'),
+        ('blocks.py', '.'),
+        ('attachments.py', '.'),
+        ('schema_cache.py', '.'),
+        ('dedup.py', '.'),
+        ('transport.py', '.'),
+        ('async_notion_api.py', '.'),
+        ('metrics.py', '.'),
+        ('mirror.py', '.'),
 	('setup_launcher.py', 'Contents/Frameworks'),
 
     ],
@@ -0,0 +1,304 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# 覚えておく件数
+DEFAULT_HISTORY_SIZE = 50
+
+# メモリに置く本文の合計の上限（バイト）
+DEFAULT_HISTORY_BYTES = 4 * 1024 * 1024
+
+# これより大きいクリップはメモリに置かず、メモリマップしたファイルに書き出す（バイト）
+SPILL_THRESHOLD = 64 * 1024
+
+# 書き出し先のファイルの大きさ（リングバッファとして先頭から上書きしていく）
+DEFAULT_SPILL_BYTES = 64 * 1024 * 1024
+
+# クリップボードの変更を確認する間隔（秒）
+DEFAULT_WATCH_INTERVAL = 0.5
+
+# 変更回数が取れないクリップボード（gtk・pyperclip）を確認する間隔（秒、毎回内容を読むので長めにする）
+READ_WATCH_INTERVAL = 5.0
+
+# メニューに表示する1件あたりの文字数
+PREVIEW_CHARS = 40
+
+
+def load_history_config():
+    """環境変数からクリップボード履歴の設定を読み込み（CLIP_HISTORY=1 で有効）"""
+    return {
+        "enabled": os.environ.get('CLIP_HISTORY', '').strip().lower() in ('1', 'true', 'yes', 'on'),
+        "size": max(1, int(os.environ.get('CLIP_HISTORY_SIZE', DEFAULT_HISTORY_SIZE))),
+        "max_bytes": max(0, int(os.environ.get('CLIP_HISTORY_BYTES', DEFAULT_HISTORY_BYTES))),
+        "spill_bytes": max(0, int(os.environ.get('CLIP_HISTORY_SPILL_BYTES', DEFAULT_SPILL_BYTES))),
+        "interval": float(os.environ.get('CLIP_HISTORY_INTERVAL', DEFAULT_WATCH_INTERVAL)),
+    }
+
+
+class HistoryEntry:
+    """履歴の1件（件数が多くても小さく済むよう __slots__ で属性を固定する）
+
+    本文は小さければ UTF-8 のバイト列で持ち、大きければ書き出し先の位置（offset, length）だけを持つ。
+    """
+
+    __slots__ = ('captured_at', 'digest', 'preview', 'data', 'offset', 'length')
+
+    def __init__(self, captured_at, digest, preview, data=None, offset=-1, length=0):
+        self.captured_at = captured_at
+        self.digest = digest
+        self.preview = preview
+        self.data = data
+        self.offset = offset
+        self.length = length
+
+    @property
+    def spilled(self):
+        return self.data is None
+
+    @property
+    def title(self):
+        """保存するときのタイトル（キャプチャ時刻）"""
+        return datetime.fromtimestamp(self.captured_at).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SpillFile:
+    """大きなクリップの書き出し先（メモリマップした一時ファイルのリングバッファ）
+
+    一時ファイルは名前を持たず、閉じれば消える（クリップボードの内容をディスクに残さない）。
+    書き込みが末尾に届いたら先頭に戻り、上書きされた範囲の履歴は呼び出し側で捨てる。
+    """
+
+    def __init__(self, capacity=DEFAULT_SPILL_BYTES):
+        self.capacity = capacity
+        self._file = tempfile.TemporaryFile()
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self._position = 0
+
+    def write(self, data):
+        """書き込んで offset を返す（入りきらない大きさなら None）"""
+        if len(data) > self.capacity:
+            return None
+        if self._position + len(data) > self.capacity:
+            self._position = 0
+        offset = self._position
+        self._map[offset:offset + len(data)] = data
+        self._position += len(data)
+        return offset
+
+    def read(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class ClipHistory:
+    """直近のクリップボードの内容を覚えておくリングバッファ
+
+    件数（size）とメモリ上の本文の合計（max_bytes）の両方で上限を設け、古いものから捨てる。
+    SPILL_THRESHOLD を超える大きなクリップは SpillFile に書き出し、メモリには位置だけを置く。
+    """
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE, max_bytes=DEFAULT_HISTORY_BYTES,
+                 spill_bytes=DEFAULT_SPILL_BYTES):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._spill_bytes = spill_bytes
+        self._spill = None
+        self._entries = deque()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.added = 0
+        self.evicted = 0
+
+    def add(self, text, captured_at=None):
+        """クリップを追加（直前と同じ内容なら何もせず False を返す）"""
+        data = text.encode('utf-8')
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        preview = " ".join(text[:PREVIEW_CHARS * 2].split())[:PREVIEW_CHARS]
+        entry = HistoryEntry(captured_at or time.time(), digest, preview)
+
+        with self._lock:
+            if self._entries and self._entries[-1].digest == digest:
+                return False
+            # 同じ内容が以前にもあれば、古い方を捨てて新しい位置に置き直す
+            for old in [old for old in self._entries if old.digest == digest]:
+                self._remove(old)
+
+            if len(data) > SPILL_THRESHOLD and self._spill_bytes:
+                if self._spill is None:
+                    self._spill = SpillFile(self._spill_bytes)
+                offset = self._spill.write(data)
+                if offset is None:
+                    print(f"⚠️  クリップボード履歴に入りきらない大きさです（{len(data)}バイト）")
+                    return False
+                self._evict_overwritten(offset, len(data))
+                entry.offset, entry.length = offset, len(data)
+            else:
+                entry.data = data
+                self._memory_bytes += len(data)
+
+            self._entries.append(entry)
+            self.added += 1
+            while len(self._entries) > self.size:
+                self._remove(self._entries[0])
+            # メモリの上限を超えたら、メモリに置いている古いものから捨てる（書き出したものは残す）
+            while self._memory_bytes > self.max_bytes:
+                oldest = next(old for old in self._entries if not old.spilled)
+                if oldest is entry:
+                    break
+                self._remove(oldest)
+        return True
+
+    def entries(self):
+        """新しい順の履歴（本文は text() で取り出す）"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def text(self, entry):
+        """履歴の本文（すでに捨てられていれば None）"""
+        with self._lock:
+            if entry.spilled:
+                if entry.offset < 0 or self._spill is None:
+                    return None
+                data = self._spill.read(entry.offset, entry.length)
+            else:
+                data = entry.data
+        return data.decode('utf-8') if data is not None else None
+
+    def clear(self):
+        with self._lock:
+            for entry in list(self._entries):
+                self._remove(entry)
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def stats(self):
+        """履歴の統計情報（metrics に登録する）"""
+        with self._lock:
+            spilled = sum(1 for entry in self._entries if entry.spilled)
+            return {
+                "entries": len(self._entries),
+                "spilled": spilled,
+                "memory_bytes": self._memory_bytes,
+                "added": self.added,
+                "evicted": self.evicted,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _evict_overwritten(self, offset, length):
+        # 書き出し先で上書きされた範囲にあった履歴を捨てる
+        end = offset + length
+        for entry in [entry for entry in self._entries if entry.spilled]:
+            if entry.offset < end and offset < entry.offset + entry.length:
+                self._remove(entry)
+
+    def _remove(self, entry):
+        self._entries.remove(entry)
+        if not entry.spilled:
+            self._memory_bytes -= len(entry.data)
+            entry.data = None
+        entry.offset = -1
+        self.evicted += 1
+
+
+class ClipboardWatcher:
+    """クリップボードを定期的に確認し、変わっていれば履歴に追加するスレッド
+
+    変更回数（change_count、clipboard.py の AppKitClipboard など）が取れる環境では、
+    待機中は変更回数を比べるだけで内容を読まない。
+    取れない環境では内容を読み、ハッシュだけを比べる（内容は履歴に追加するときだけ保持する）。
+    pyperclip では読むたびに xclip / pbpaste を起動するので、READ_WATCH_INTERVAL 秒より短くは確認しない。
+    """
+
+    def __init__(self, history, read_text, change_count=None, interval=DEFAULT_WATCH_INTERVAL):
+        self.history = history
+        self.read_text = read_text
+        self.change_count = change_count
+        if change_count is None and interval < READ_WATCH_INTERVAL:
+            print(f"⚠️  このクリップボードは変更を検知できないため、{READ_WATCH_INTERVAL:g}秒ごとに内容を確認します")
+            interval = READ_WATCH_INTERVAL
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_count = None
+        self._last_hash = None
+        self.reads = 0
+
+    def start(self):
+        if self._thread is None:
+            # 起動前からクリップボードにある内容は履歴に入れない
+            if self.change_count is not None:
+                self._last_count = self.change_count()
+            else:
+                self._last_hash = hash(self.read_text() or '')
+            self._thread = threading.Thread(target=self._run, daemon=True, name="ClipboardWatcher")
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def poll(self):
+        """1回分の確認（変わっていれば履歴に追加して True を返す）"""
+        if self.change_count is not None:
+            count = self.change_count()
+            if count == self._last_count:
+                return False
+            self._last_count = count
+
+        text = self.read_text()
+        self.reads += 1
+        if not text or not text.strip():
+            return False
+        if self.change_count is None:
+            text_hash = hash(text)
+            if text_hash == self._last_hash:
+                return False
+            self._last_hash = text_hash
+        return self.history.add(text)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"✗ クリップボード履歴の取得エラー: {e}")
+
+
+def parse_selection(text, count):
+    """「1 3 5-7」のような指定を 0 始まりの番号のリストにする（範囲外は無視）"""
+    indexes = []
+    seen = set()
+    for part in text.replace(',', ' ').split():
+        first, _, last = part.partition('-')
+        try:
+            start = int(first)
+            end = int(last) if last else start
+        except ValueError:
+            continue
+        # 「1-999999999」のような指定でも履歴の件数までしか数えない
+        for number in range(max(1, min(start, end)), min(count, max(start, end)) + 1):
+            if number - 1 not in seen:
+                seen.add(number - 1)
+                indexes.append(number - 1)
+    return indexes
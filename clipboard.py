@@ -0,0 +1,156 @@
+import os
+import threading
+
+from attachments import AppKitPasteboard, RichContents
+
+# クリップボードの読み取り方（CLIPBOARD_BACKEND で変更）
+#   auto:      使えるものから appkit → gtk → pyperclip の順に選ぶ
+#   appkit:    macOS の NSPasteboard をプロセス内で読む（pbpaste を起動しない）
+#   gtk:       PyGObject（Gtk 3）で X11 / Wayland のクリップボードをプロセス内で読む
+#   pyperclip: pyperclip.paste()（macOS は pbpaste、Linux は xclip / xsel を起動する）
+#   memory:    メモリ上のクリップボード（動作確認・ベンチマーク用）
+CLIPBOARD_BACKENDS = ('auto', 'appkit', 'gtk', 'pyperclip', 'memory')
+
+
+def load_clipboard_backend():
+    """環境変数からクリップボードの読み取り方を読み込み"""
+    backend = os.environ.get('CLIPBOARD_BACKEND', 'auto').strip().lower()
+    if backend not in CLIPBOARD_BACKENDS:
+        print(f"⚠️  不明な CLIPBOARD_BACKEND です: {backend}（auto として扱います）")
+        backend = 'auto'
+    return backend
+
+
+class AppKitClipboard:
+    """NSPasteboard を直接読むクリップボード（macOS）
+
+    pyperclip は読むたびに pbpaste を起動するが、こちらはプロセス内で読むだけで済む。
+    変更回数（changeCount）も取れるので、クリップボード履歴の監視は内容を読まずに済む。
+    """
+
+    name = 'appkit'
+
+    def __init__(self):
+        from AppKit import NSPasteboard, NSPasteboardTypeString
+        self._pasteboard = NSPasteboard.generalPasteboard()
+        self._string_type = NSPasteboardTypeString
+        self._rich = AppKitPasteboard(self._pasteboard)
+
+    def read_text(self):
+        return self._pasteboard.stringForType_(self._string_type)
+
+    def write_text(self, text):
+        self._pasteboard.clearContents()
+        self._pasteboard.setString_forType_(text, self._string_type)
+
+    def change_count(self):
+        return self._pasteboard.changeCount()
+
+    def read_rich(self):
+        return self._rich.read()
+
+
+class GtkClipboard:
+    """Gtk のクリップボード（X11 / Wayland をプロセス内で読む、PyGObject が必要）"""
+
+    name = 'gtk'
+    change_count = None
+
+    def __init__(self):
+        import gi
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gdk, Gtk
+        if not Gtk.init_check([])[0]:
+            raise ValueError("ディスプレイに接続できません")
+        self._clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+
+    def read_text(self):
+        return self._clipboard.wait_for_text()
+
+    def write_text(self, text):
+        self._clipboard.set_text(text, -1)
+        self._clipboard.store()
+
+    def read_rich(self):
+        return None
+
+
+class PyperclipClipboard:
+    """pyperclip を使うクリップボード（ほかが使えない環境の代わり）"""
+
+    name = 'pyperclip'
+    change_count = None
+
+    def __init__(self):
+        import pyperclip
+        self._pyperclip = pyperclip
+
+    def read_text(self):
+        return self._pyperclip.paste()
+
+    def write_text(self, text):
+        self._pyperclip.copy(text)
+
+    def read_rich(self):
+        return None
+
+
+class MemoryClipboard:
+    """メモリ上のクリップボード（Linux での動作確認・ベンチマーク用）
+
+    書き込むたびに変更回数が増えるので、NSPasteboard と同じように監視できる。
+    """
+
+    name = 'memory'
+
+    def __init__(self, text=""):
+        self._lock = threading.Lock()
+        self._text = text
+        self._rich = RichContents()
+        self._count = 0
+
+    def read_text(self):
+        with self._lock:
+            return self._text
+
+    def write_text(self, text):
+        self.set(text)
+
+    def set(self, text="", html=None, images=(), files=()):
+        """テキストと画像・HTML・ファイルをまとめて書き込む（コピーし直すのと同じ）"""
+        with self._lock:
+            self._text = text
+            self._rich = RichContents(html, images, files)
+            self._count += 1
+
+    def clear(self):
+        self.set()
+
+    def change_count(self):
+        with self._lock:
+            return self._count
+
+    def read_rich(self):
+        with self._lock:
+            rich = self._rich
+            return RichContents(rich.html, rich.images, rich.files)
+
+
+_BACKENDS = {
+    'appkit': AppKitClipboard,
+    'gtk': GtkClipboard,
+    'pyperclip': PyperclipClipboard,
+    'memory': MemoryClipboard,
+}
+
+
+def create_clipboard(backend='auto'):
+    """クリップボードを作成（auto なら使えるものを順に試す）"""
+    if backend != 'auto':
+        return _BACKENDS[backend]()
+    for name in ('appkit', 'gtk'):
+        try:
+            return _BACKENDS[name]()
+        except (ImportError, ValueError):
+            continue
+    return PyperclipClipboard()
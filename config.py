@@ -0,0 +1,153 @@
+import os
+import threading
+from pathlib import Path
+
+# .envファイルのパス（ユーザーのホームディレクトリ）
+ENV_FILE_PATH = Path.home() / '.clip_to_notion' / '.env'
+
+# 表示用のショートカットキー → pynput の指定
+HOTKEYS = {
+    "⌘⇧V": '<cmd>+<shift>+v',
+    "⌘⌃⇧V": '<cmd>+<ctrl>+<shift>+v',
+    "⌘⌥V": '<cmd>+<alt>+v',
+    "⌘⇧N": '<cmd>+<shift>+n',
+}
+DEFAULT_HOTKEY = "⌘⇧V"
+
+# 変更されたら NotionAPI を作り直す設定
+NOTION_KEY_PREFIXES = ('NOTION_', 'CLIP_FORMAT', 'SCHEMA_CACHE_', 'STORAGE_MODE', 'ROUTING_')
+
+# 設定ファイルの変更を確認する間隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+class EnvConfig:
+    """~/.clip_to_notion/.env の読み込み・書き込み
+
+    内容はファイルの更新時刻・サイズ・inode をキーにキャッシュするので、何度
+    呼んでもファイルを読むのは変更されたときだけ。変更の確認（changed）は stat 1回なので、
+    設定の再読み込みはこれを一定間隔で呼ぶだけで済む。
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else ENV_FILE_PATH
+        self._lock = threading.Lock()
+        self._signature = None
+        self._values = {}
+        # apply() で os.environ に設定した項目（ファイルから消えたら環境変数からも消す）
+        self._applied = {}
+
+    def ensure_directory(self):
+        """設定ファイル用のディレクトリを作成"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def values(self):
+        """設定ファイルの内容（変更されていなければキャッシュを返す）"""
+        with self._lock:
+            signature = self._stat()
+            if signature != self._signature:
+                self._values = self._read() if signature else {}
+                self._signature = signature
+            return dict(self._values)
+
+    def get(self, key, default=None):
+        return self.values().get(key) or default
+
+    def exists(self):
+        return self.path.exists()
+
+    def is_complete(self):
+        """必須項目（API Key と Database ID）が設定されているか"""
+        values = self.values()
+        return bool(values.get('NOTION_API_KEY') and values.get('NOTION_DATABASE_ID'))
+
+    def hotkey(self):
+        """ショートカットキーの (表示, pynput の指定)"""
+        display = self.get('HOTKEY', DEFAULT_HOTKEY)
+        if display not in HOTKEYS:
+            display = DEFAULT_HOTKEY
+        return display, HOTKEYS[display]
+
+    def apply(self, override=True):
+        """設定ファイルの内容を環境変数に反映し、変更された項目名の集合を返す
+
+        override=False なら、すでに環境変数で指定されている項目はそのまま残す。
+        """
+        values = self.values()
+        changed = set()
+        with self._lock:
+            for key in list(self._applied):
+                if key not in values and os.environ.get(key) == self._applied[key]:
+                    del os.environ[key]
+                    del self._applied[key]
+                    changed.add(key)
+            for key, value in values.items():
+                if value is None or os.environ.get(key) == value:
+                    continue
+                if not override and key in os.environ and key not in self._applied:
+                    continue
+                os.environ[key] = value
+                self._applied[key] = value
+                changed.add(key)
+        return changed
+
+    def changed(self):
+        """前回読み込んでからファイルが変更されたか（stat のみ）"""
+        with self._lock:
+            return self._stat() != self._signature
+
+    def save(self, updates):
+        """項目を書き換えて保存（ほかの項目・コメントは残す）
+
+        一時ファイルに書いてから置き換えるので、読み込み側が書きかけの内容を見ることはない。
+        """
+        with self._lock:
+            try:
+                lines = self.path.read_text(encoding='utf-8').splitlines()
+            except FileNotFoundError:
+                lines = []
+
+            remaining = dict(updates)
+            for index, line in enumerate(lines):
+                key = line.split('=', 1)[0].strip()
+                if key.startswith('export '):
+                    key = key[len('export '):].strip()
+                if '=' in line and key in remaining:
+                    lines[index] = f"{key}={remaining.pop(key)}"
+            lines.extend(f"{key}={value}" for key, value in remaining.items())
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_name(self.path.name + '.tmp')
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            # API Key を含むので本人だけが読めるようにする
+            os.chmod(temporary, 0o600)
+            os.replace(temporary, self.path)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read(self):
+        from dotenv import dotenv_values
+        try:
+            return dict(dotenv_values(self.path, encoding='utf-8'))
+        except OSError:
+            return {}
+
+
+def poll_interval():
+    """設定ファイルの変更を確認する間隔（CONFIG_POLL_INTERVAL で変更）"""
+    return float(os.environ.get('CONFIG_POLL_INTERVAL', DEFAULT_POLL_INTERVAL))
+
+
+def is_notion_key(key):
+    """変更されたら NotionAPI を作り直す必要がある設定か"""
+    return key.startswith(NOTION_KEY_PREFIXES)
+
+
+# アプリ全体で共有する設定
+env_config = EnvConfig()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+メニューバー・ホットキーなしで動くデーモン（Linux / CI 向け）
+
+Unix ドメインソケットと標準入力からクリップを受け取り、メニューバー版と同じ
+送信箱・送信キュー・NotionAPI を通して保存する。
+
+クリップの区切り方（--framing）:
+  line:   1行 = 1クリップ（UTF-8、空行は無視）
+  length: 「バイト数\\n」の後に本文（改行を含むクリップも送れる）
+
+ソケットの接続ごとに、書き込み側を閉じると「OK 受け付けた件数」が返る。
+送信待ちが --max-depth 件に達すると読み込みを止めるので、送り側は自然に待たされる。
+"""
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+from capture_queue import CaptureQueue
+from outbox import Outbox, OutboxReplayer
+from batch_uploader import BatchUploader, load_batch_config
+from metrics import metrics, start_metrics_server
+from config import env_config
+from blocks import block_cache
+from shutdown import ShutdownCoordinator, load_shutdown_config
+
+# ソケットの既定の場所（CLIP_SOCKET で変更可能）
+SOCKET_PATH = Path.home() / '.clip_to_notion' / 'daemon.sock'
+
+FRAMINGS = ('line', 'length')
+
+# 1クリップの上限（これを超える行・長さは受け付けずに接続を閉じる）
+MAX_CLIP_BYTES = 16 * 1024 * 1024
+
+# 送信待ちの上限（これを超えると受信を止めて送り側を待たせる）
+DEFAULT_MAX_DEPTH = 1000
+
+
+class FramingError(ValueError):
+    """クリップの区切りが不正"""
+
+
+def read_clips(stream, framing='line', max_bytes=MAX_CLIP_BYTES):
+    """バイナリストリームからクリップを1件ずつ返す"""
+    if framing == 'line':
+        while True:
+            line = stream.readline(max_bytes + 1)
+            if not line:
+                return
+            if len(line) > max_bytes:
+                raise FramingError(f"1行が長すぎます（{max_bytes}バイトまで）")
+            text = line.rstrip(b'\r\n').decode('utf-8', 'replace')
+            if text.strip():
+                yield text
+    else:
+        while True:
+            header = stream.readline(32)
+            if not header:
+                return
+            header = header.strip()
+            # 本文の後の改行（空行）は区切りとして読み飛ばす
+            if not header:
+                continue
+            if not header.isdigit():
+                raise FramingError(f"長さの指定が不正です: {header[:20]!r}")
+            size = int(header)
+            if size > max_bytes:
+                raise FramingError(f"クリップが大きすぎます: {size}バイト（{max_bytes}バイトまで）")
+            payload = stream.read(size)
+            if len(payload) < size:
+                raise FramingError("クリップの途中で接続が切れました")
+            text = payload.decode('utf-8', 'replace')
+            if text.strip():
+                yield text
+
+
+def encode_clip(text, framing='line'):
+    """クリップを送信用のバイト列にする（read_clips の逆）"""
+    data = text.encode('utf-8')
+    if framing == 'line':
+        if b'\n' in data:
+            raise ValueError("line 形式では改行を含むクリップは送れません（length 形式を使ってください）")
+        return data + b'\n'
+    return b'%d\n' % len(data) + data + b'\n'
+
+
+def load_env():
+    """~/.clip_to_notion/.env があれば読み込む（環境変数で指定した値が優先）"""
+    env_config.apply(override=False)
+
+
+class _ClipHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        count, error = self.server.clip_daemon.ingest(self.rfile)
+        reply = f"OK {count}\n" if error is None else f"ERR {error} (受け付けた件数: {count})\n"
+        try:
+            self.wfile.write(reply.encode('utf-8'))
+        except OSError:
+            pass
+
+
+class _ClipServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ClipDaemon:
+    """ソケット・標準入力から受け取ったクリップを Notion に保存する"""
+
+    def __init__(self, socket_path=None, framing='line', max_depth=DEFAULT_MAX_DEPTH, verbose=False):
+        if framing not in FRAMINGS:
+            raise ValueError(f"不明な区切り方です: {framing}")
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.framing = framing
+        self.verbose = verbose
+
+        # メニューバー版と同じ経路（送信箱 → 送信キュー → Notion）
+        self.outbox = Outbox()
+        batch_config = load_batch_config()
+        self.batch_uploader = None
+        if batch_config['mode'] != 'off':
+            self.batch_uploader = BatchUploader(batch_config['mode'], batch_config['concurrency'])
+
+        from notion_api import create_notion_api
+        self.notion_api = create_notion_api(batch_config['engine'], batch_config['engine_concurrency'])
+
+        self.capture_queue = CaptureQueue(
+            self.upload_item,
+            outbox=self.outbox,
+            batch_handler=self.upload_batch if self.batch_uploader else None,
+            batch_size=batch_config['size'],
+            batch_window=batch_config['window'],
+            batch_idle=batch_config['idle'],
+            max_depth=max_depth
+        )
+        self.outbox_replayer = OutboxReplayer(
+            self.outbox, self.capture_queue, probe=self.check_connection
+        )
+        # 保存したクリップはローカルミラーにも書き込む（cli.py search で検索できる）
+        from mirror import Mirror
+        self.mirror = Mirror()
+        self._server = None
+        self._server_thread = None
+        self.metrics_server = None
+
+        # 受信の統計情報
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.received = 0
+        # キューが積まなかったクリップ（送信箱で送信済みと分かった分）
+        self.skipped = 0
+        self.rejected = 0
+        self.stalls = 0
+
+    def start(self):
+        result = self.notion_api.test_connection()
+        if result['success']:
+            print(f"✓ Notion接続成功: {result.get('database_name', 'Unknown')}")
+        else:
+            # 接続できなくても受け付け、送信箱に溜めて接続回復後に再送する
+            print(f"✗ Notion接続失敗: {result['error']}（送信箱に保存して再送します）")
+
+        self.capture_queue.start()
+        self.outbox_replayer.start()
+
+        metrics.register("queue", self.capture_queue.stats)
+        metrics.register("blocks", block_cache.stats)
+        metrics.register("daemon", self.stats)
+        metrics.register("rate_limit", self.notion_api.client.stats)
+        if self.batch_uploader:
+            metrics.register("batch", self.batch_uploader.stats)
+        self.metrics_server = start_metrics_server()
+
+        if self.socket_path:
+            self._start_server()
+
+    def ingest(self, stream):
+        """ストリームのクリップをすべてキューに積み、(受け付けた件数, エラー) を返す"""
+        with self._lock:
+            self.connections += 1
+        count = 0
+        try:
+            for clip in read_clips(stream, self.framing):
+                if self.submit(clip):
+                    count += 1
+        except (FramingError, OSError) as e:
+            with self._lock:
+                self.rejected += 1
+            print(f"✗ 受信エラー: {e}")
+            return count, str(e)
+        return count, None
+
+    def submit(self, clip):
+        """クリップをキューに積む（送信待ちが上限なら空くまで待つ、積まなかったら False）
+
+        同じ秒に同じ内容の行が続いても別のクリップとして送るので、送信箱のキーは
+        時刻と内容からではなく1件ごとに作る。
+        """
+        key = uuid.uuid4().hex
+        try:
+            item = self.capture_queue.submit(clip, timeout=0, key=key)
+        except queue.Full:
+            with self._lock:
+                self.stalls += 1
+            item = self.capture_queue.submit(clip, key=key)
+        with self._lock:
+            if item is None:
+                self.skipped += 1
+            else:
+                self.received += 1
+        return item is not None
+
+    def upload_item(self, item):
+        result = self.notion_api.create_page(title=item.title, content=item.content)
+        self._report(result)
+        self._add_to_mirror([item], [result])
+        return result
+
+    def upload_batch(self, items):
+        results = self.batch_uploader.upload(self.notion_api, items)
+        for result in results:
+            self._report(result)
+        self._add_to_mirror(items, results)
+        return results
+
+    def check_connection(self):
+        return self.notion_api.test_connection()['success']
+
+    def stats(self):
+        """受信の統計情報を取得"""
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "received": self.received,
+                "skipped": self.skipped,
+                "rejected": self.rejected,
+                # 送信待ちが上限に達して受信を止めた回数
+                "stalls": self.stalls,
+            }
+
+    def stop(self, timeout=10):
+        """受け付けを止め、キューに残っている分を timeout 秒まで送信してから終了（残りは送信箱に残す）"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._remove_socket()
+        self.outbox_replayer.stop()
+        report = ShutdownCoordinator(self.capture_queue, self.outbox, timeout).drain()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if not report['finished']:
+            # 送信中の呼び出しは待たない（送信箱から次回起動時に再送する）
+            return report
+        if self.batch_uploader:
+            self.batch_uploader.close()
+        if hasattr(self.notion_api, 'close'):
+            self.notion_api.close()
+        if self.mirror:
+            self.mirror.close()
+        self.outbox.close()
+        return report
+
+    def _add_to_mirror(self, items, results):
+        if self.mirror is None:
+            return
+        from mirror import saved_pages
+        try:
+            for page_id, title, content, url, appended in saved_pages(items, results):
+                self.mirror.add_local(self.notion_api.database_id, page_id, title, content, url, append=appended)
+        except Exception as e:
+            print(f"✗ ローカルミラーへの書き込みに失敗: {e}")
+
+    def _report(self, result):
+        if not result['success']:
+            print(f"✗ 保存失敗: {result['error']}")
+        elif self.verbose:
+            print(f"✓ 保存成功: {result['url']}")
+
+    def _start_server(self):
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_socket()
+        self._server = _ClipServer(str(self.socket_path), _ClipHandler)
+        self._server.clip_daemon = self
+        # 同じユーザーのプロセスからのみ接続できるようにする
+        os.chmod(self.socket_path, 0o600)
+        self._server_thread = threading.Thread(
+            target=self._server.serve_forever, name="ClipSocketServer", daemon=True
+        )
+        self._server_thread.start()
+        print(f"受信待ち: {self.socket_path}（{self.framing} 形式）")
+
+    def _remove_stale_socket(self):
+        """前回異常終了したときのソケットファイルを削除（別のデーモンが動いていればエラー）"""
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self._remove_socket()
+        else:
+            raise RuntimeError(f"すでにデーモンが起動しています: {self.socket_path}")
+        finally:
+            probe.close()
+
+    def _remove_socket(self):
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def default_socket_path():
+    return Path(os.environ.get('CLIP_SOCKET') or SOCKET_PATH)
+
+
+def run_daemon(socket_path=None, use_stdin=False, framing='line',
+               max_depth=DEFAULT_MAX_DEPTH, verbose=False):
+    """デーモンを起動し、SIGINT / SIGTERM（ソケットなしなら標準入力の終わり）まで動かす"""
+    load_env()
+    try:
+        daemon = ClipDaemon(socket_path, framing=framing, max_depth=max_depth, verbose=verbose)
+        daemon.start()
+    except Exception as e:
+        print(f"✗ 起動エラー: {e}")
+        return 1
+
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    if use_stdin:
+        count, error = daemon.ingest(sys.stdin.buffer)
+        print(f"標準入力から受け付けた件数: {count}")
+        if error is not None or not socket_path:
+            # 標準入力だけのときは、すべて送り終えてから終了する
+            daemon.stop(timeout=None if error is None else 10)
+            return 0 if error is None else 1
+
+    while not stopping.wait(1):
+        pass
+    print("\n終了します（送信待ちのクリップを送信中）...")
+    daemon.stop(timeout=load_shutdown_config()['deadline'])
+    return 0
+
+
+if __name__ == "__main__":
+    from cli import main
+    sys.exit(main(["daemon"] + sys.argv[1:]))
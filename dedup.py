@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# 重複判定用インデックスの保存先
+DEDUP_PATH = Path.home() / '.clip_to_notion' / 'dedup.json'
+
+# 重複したクリップの扱い
+#   skip:   保存しない
+#   bump:   既存ページのタイトル（時刻）を更新する
+#   always: 重複でも保存する
+DEDUP_POLICIES = ('skip', 'bump', 'always')
+
+# ハッシュ計算時に一度にエンコードする文字数（巨大なクリップでもメモリを倍にしない）
+_HASH_CHUNK_CHARS = 64 * 1024
+
+
+def hash_text(text, digest=None):
+    """テキストを少しずつエンコードしながら BLAKE2 ハッシュに流し込む"""
+    if digest is None:
+        digest = hashlib.blake2b(digest_size=16)
+    for start in range(0, len(text), _HASH_CHUNK_CHARS):
+        digest.update(text[start:start + _HASH_CHUNK_CHARS].encode('utf-8', 'surrogatepass'))
+    return digest
+
+
+def content_digest(text):
+    """クリップ内容のダイジェスト（16進文字列）"""
+    return hash_text(text).hexdigest()
+
+
+def load_dedup_config():
+    """環境変数から重複判定の設定を読み込み"""
+    policy = os.environ.get('DEDUP_POLICY', 'skip').strip().lower()
+    if policy not in DEDUP_POLICIES:
+        print(f"⚠️  不明な DEDUP_POLICY です: {policy}（skip として扱います）")
+        policy = 'skip'
+
+    return {
+        "policy": policy,
+        # 重複とみなす時間（秒）
+        "window": float(os.environ.get('DEDUP_WINDOW', '300')),
+        # 覚えておくクリップの件数
+        "size": int(os.environ.get('DEDUP_SIZE', '1000')),
+    }
+
+
+class DedupIndex:
+    """最近保存したクリップのダイジェストを覚えておく LRU インデックス
+
+    ダイジェスト → (保存時刻, ページID) を最大 max_entries 件保持し、
+    window 秒以内に同じ内容が来たら重複として返す。ページIDが分かった
+    時点でディスクに保存するので、再起動後も重複を判定できる。
+    """
+
+    def __init__(self, path=None, max_entries=1000, window=300):
+        self.path = Path(path) if path else DEDUP_PATH
+        self.max_entries = max_entries
+        self.window = window
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._load()
+
+    def lookup(self, digest):
+        """window 秒以内に保存した同じ内容があれば {"saved_at", "page_id"} を返す"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            saved_at, page_id = entry
+            if time.time() - saved_at > self.window:
+                return None
+            self._entries.move_to_end(digest)
+            return {"saved_at": saved_at, "page_id": page_id}
+
+    def record(self, digest, page_id=None):
+        """クリップを登録（ページIDはまだ分からなくてもよい）"""
+        with self._lock:
+            self._entries[digest] = (time.time(), page_id)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_page(self, digest, page_id):
+        """保存できたページのIDを記録してディスクに書き出す"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            saved_at = entry[0] if entry else time.time()
+            self._entries[digest] = (saved_at, page_id)
+            snapshot = list(self._entries.items())
+        self._save(snapshot)
+
+    def forget(self, digest):
+        """登録を取り消す（保存できなかったクリップを、もう一度コピーすれば送れるようにする）"""
+        with self._lock:
+            if self._entries.pop(digest, None) is None:
+                return
+            snapshot = list(self._entries.items())
+        self._save(snapshot)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        cutoff = time.time() - self.window
+        for digest, (saved_at, page_id) in data[-self.max_entries:]:
+            if saved_at >= cutoff:
+                self._entries[digest] = (saved_at, page_id)
+
+    def _save(self, snapshot):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with self._save_lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump([[digest, list(entry)] for digest, entry in snapshot], f)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"✗ 重複判定インデックスの保存に失敗しました: {e}")
@@ -0,0 +1,361 @@
+"""
+ファイル・ディレクトリの一括インポート
+
+    python cli.py import ~/notes ~/logs/app.log
+
+ディレクトリをたどりながらファイルを読み込み（大きなファイルは mmap）、
+プロセスプールでテキストに変換し、同時送信数とレート制限を守って Notion に
+ページとして保存する。保存できたファイルはチェックポイント（JSONL）に記録し、
+中断しても同じコマンドで続きから再開できる。
+"""
+import hashlib
+import json
+import mmap
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# チェックポイントの保存先
+CHECKPOINT_DIR = Path.home() / '.clip_to_notion' / 'imports'
+
+# これより大きいファイルは mmap で読む（ページキャッシュから直接デコードし、コピーを減らす）
+MMAP_THRESHOLD = 1024 * 1024
+
+# これより大きいファイルは取り込まない
+MAX_FILE_BYTES = 64 * 1024 * 1024
+
+# 先頭のこのバイト数に NUL があればバイナリとみなして飛ばす
+BINARY_SNIFF_BYTES = 8192
+
+
+def iter_files(paths, extensions=None):
+    """パスを順にたどってファイルを返す（隠しファイル・隠しディレクトリは除く）
+
+    ディレクトリは名前順に1階層ずつ読むので、ファイル数が多くても一覧を保持しない。
+    """
+    for path in paths:
+        path = Path(path).expanduser()
+        if path.is_file():
+            yield path
+            continue
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"⚠️  ディレクトリを読めません: {directory}（{e}）")
+                continue
+            subdirectories = []
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(Path(entry.path))
+                elif entry.is_file() and (not extensions or Path(entry.name).suffix.lower() in extensions):
+                    yield Path(entry.path)
+            # 名前順に処理するため逆順に積む
+            stack.extend(reversed(subdirectories))
+
+
+def read_text(path):
+    """ファイルを UTF-8 のテキストとして読み込む（バイナリなら None）"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return ""
+        if size < MMAP_THRESHOLD:
+            data = f.read()
+            if b'\0' in data[:BINARY_SNIFF_BYTES]:
+                return None
+            return data.decode('utf-8', 'replace')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped.find(b'\0', 0, BINARY_SNIFF_BYTES) != -1:
+                return None
+            return str(mapped, 'utf-8', 'replace')
+
+
+def convert_file(path, root):
+    """ファイルを (タイトル, 本文) に変換（プロセスプールのワーカーで実行）
+
+    タイトルはファイルの更新時刻と root からの相対パス。
+    取り込まないファイルは (None, 理由) を返す。
+    """
+    try:
+        stat = os.stat(path)
+        if stat.st_size > MAX_FILE_BYTES:
+            return None, f"ファイルが大きすぎます（{stat.st_size}バイト）"
+        text = read_text(path)
+    except OSError as e:
+        return None, str(e)
+    if text is None:
+        return None, "バイナリファイル"
+
+    text = text.lstrip('\ufeff').replace('\r\n', '\n')
+    if not text.strip():
+        return None, "空のファイル"
+
+    modified = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+    return f"{modified} {os.path.relpath(path, root)}", text
+
+
+def _ignore_sigint():
+    # Ctrl+C は親プロセスだけで扱い、変換ワーカーは中断の後始末まで動かす
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def file_signature(path):
+    """チェックポイントで同じファイルかを判定するための (パス, サイズ, 更新時刻)"""
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns]
+
+
+def default_checkpoint_path(paths):
+    """インポート対象ごとのチェックポイントファイル"""
+    key = "\0".join(sorted(str(Path(path).expanduser().resolve()) for path in paths))
+    return CHECKPOINT_DIR / f"{hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()}.jsonl"
+
+
+class Checkpoint:
+    """保存できたファイルを1行ずつ追記する JSONL（再開時に読み込んでスキップする）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        self._lock = threading.Lock()
+        self._load()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, signature):
+        return tuple(signature) in self.done
+
+    def record(self, signature, page_id):
+        with self._lock:
+            self._file.write(json.dumps({"file": signature, "page_id": page_id}, ensure_ascii=False) + "\n")
+            # 中断されても記録済みの分は失われないよう、1件ごとに書き出す
+            self._file.flush()
+            self.done.add(tuple(signature))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(tuple(json.loads(line)["file"]))
+                    except (ValueError, KeyError, TypeError):
+                        # 書き込み途中で中断された最後の行など
+                        continue
+        except FileNotFoundError:
+            pass
+
+
+class Importer:
+    """ファイルを変換して Notion に並行して保存する
+
+    変換はプロセスプール（workers）、送信は notion_api に対して最大 concurrency 件。
+    変換待ち・送信待ちの件数にはそれぞれ上限があり、ファイル数が多くてもメモリは増えない。
+    """
+
+    def __init__(self, notion_api, checkpoint, workers=None, concurrency=4, progress_interval=5.0):
+        self.notion_api = notion_api
+        self.checkpoint = checkpoint
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._uploader = None
+        self._stop = threading.Event()
+        self.started_at = None
+        self.imported = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.failed = 0
+        self.bytes = 0
+        self._last_progress = 0.0
+
+    def run(self, paths, extensions=None):
+        """インポートを実行（Ctrl+C では送信中の分を待ってから中断）"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.started_at = self._last_progress = time.monotonic()
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_sigint)
+        # 変換待ちは workers の数倍までにして、送信が遅いときに変換結果を溜め込まない
+        window = self.workers * 4
+        pending = []
+        try:
+            for path, root in self._targets(paths, extensions):
+                signature = file_signature(path)
+                if signature in self.checkpoint:
+                    with self._lock:
+                        self.resumed += 1
+                    continue
+                pending.append((signature, pool.submit(convert_file, str(path), str(root))))
+                if len(pending) >= window:
+                    self._upload(*pending.pop(0))
+            while pending:
+                self._upload(*pending.pop(0))
+        except KeyboardInterrupt:
+            self._stop.set()
+            print("\n中断しています（送信中の分を待っています）...")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._wait_uploads()
+            self.checkpoint.close()
+            self._print_progress(final=True)
+
+        return not self._stop.is_set()
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+            return {
+                "imported": self.imported,
+                "resumed": self.resumed,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "bytes": self.bytes,
+                "elapsed": elapsed,
+                "files_per_sec": self.imported / elapsed if elapsed else 0.0,
+            }
+
+    def _targets(self, paths, extensions):
+        """(ファイル, タイトルの相対パスの基準) を順に返す"""
+        for path in paths:
+            path = Path(path).expanduser()
+            root = path if path.is_dir() else path.parent
+            for file_path in iter_files([path], extensions):
+                yield file_path, root
+
+    def _upload(self, signature, conversion):
+        """変換結果を待って送信を始める（送信中が concurrency 件なら空くまで待つ）"""
+        try:
+            title, content = conversion.result()
+        except Exception as e:
+            self._fail(signature, e)
+            return
+        if title is None:
+            print(f"スキップ: {signature[0]}（{content}）")
+            with self._lock:
+                self.skipped += 1
+            return
+
+        self._slots.acquire()
+        try:
+            if hasattr(self.notion_api, 'submit_page'):
+                # AsyncNotionEngine: イベントループ上で並行して送信
+                future = self.notion_api.submit_page(title, content)
+            else:
+                future = self._get_uploader().submit(self.notion_api.create_page, title, content)
+            future.add_done_callback(lambda done: self._finish(signature, len(content), done))
+        except Exception as e:
+            # 送信を始められなかった（ループ・スレッドプールが終了済みなど）ので、枠を返す
+            self._slots.release()
+            self._fail(signature, e)
+
+    def _finish(self, signature, size, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finally:
+            self._slots.release()
+
+        if result['success']:
+            self.checkpoint.record(signature, result['page_id'])
+            with self._lock:
+                self.imported += 1
+                self.bytes += size
+            self._print_progress()
+        else:
+            self._fail(signature, result['error'])
+
+    def _fail(self, signature, error):
+        print(f"✗ 保存失敗: {signature[0]}（{error}）")
+        with self._lock:
+            self.failed += 1
+        self._print_progress()
+
+    def _get_uploader(self):
+        with self._lock:
+            if self._uploader is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._uploader = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="ImportUpload"
+                )
+            return self._uploader
+
+    def _wait_uploads(self):
+        """送信中の分がすべて終わるまで待つ"""
+        for _ in range(self.concurrency):
+            self._slots.acquire()
+        for _ in range(self.concurrency):
+            self._slots.release()
+        if self._uploader:
+            self._uploader.shutdown(wait=True)
+
+    def _print_progress(self, final=False):
+        now = time.monotonic()
+        with self._lock:
+            if not final and now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+        stats = self.stats()
+        label = "結果" if final else "進捗"
+        print(f"{label}: 保存 {stats['imported']}件 / 前回までに保存済み {stats['resumed']}件 / "
+              f"スキップ {stats['skipped']}件 / 失敗 {stats['failed']}件 "
+              f"({stats['files_per_sec']:.1f}件/秒, {stats['bytes'] / 1_000_000:.1f}MB)")
+
+
+def run_import(paths, checkpoint_path=None, workers=None, concurrency=None, extensions=None):
+    """cli.py import の本体"""
+    from batch_uploader import load_batch_config
+    from notion_api import create_notion_api
+
+    missing = [path for path in paths if not Path(path).expanduser().exists()]
+    if missing:
+        print(f"✗ 見つかりません: {', '.join(missing)}")
+        return 2
+
+    batch_config = load_batch_config()
+    concurrency = concurrency or batch_config['engine_concurrency']
+    try:
+        notion_api = create_notion_api(batch_config['engine'], concurrency)
+        result = notion_api.test_connection()
+    except Exception as e:
+        print(f"✗ 初期化エラー: {e}")
+        return 1
+    if not result['success']:
+        print(f"✗ Notion接続失敗: {result['error']}")
+        return 1
+    print(f"✓ Notion接続成功: {result.get('database_name', 'Unknown')}")
+
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else default_checkpoint_path(paths)
+    checkpoint = Checkpoint(checkpoint_path)
+    if checkpoint.done:
+        print(f"前回の続きから再開します（保存済み: {len(checkpoint.done)}件）")
+    print(f"チェックポイント: {checkpoint_path}")
+
+    if extensions:
+        extensions = {ext.lower() if ext.startswith('.') else f".{ext.lower()}" for ext in extensions}
+
+    importer = Importer(notion_api, checkpoint, workers=workers, concurrency=concurrency)
+    try:
+        completed = importer.run(paths, extensions)
+    finally:
+        if hasattr(notion_api, 'close'):
+            notion_api.close()
+
+    if not completed:
+        print("中断しました。同じコマンドを再実行すると続きから再開します")
+        return 130
+    return 1 if importer.stats()['failed'] else 0
@@ -1,44 +1,32 @@
 #!/usr/bin/env python3
+import time
+_STARTED_AT = time.perf_counter()
+
 import rumps
-import pyperclip
 import sys
-import os
-from pathlib import Path
-from pynput import keyboard
-from datetime import datetime
-from dotenv import load_dotenv
-from notion_client import Client
-
-from notion_api import NotionAPI 
+import multiprocessing
+import threading
 
-# .envファイルのパスをユーザーのホームディレクトリに設定
-ENV_FILE_PATH = Path.home() / '.clip_to_notion' / '.env'
+# notion_client / pynput / pyperclip / dotenv は起動を速くするため使う時点で読み込む
+from capture_queue import CaptureQueue
+from outbox import Outbox, OutboxReplayer
+from batch_uploader import BatchUploader, load_batch_config
+from dedup import DedupIndex, hash_text, load_dedup_config
+from metrics import metrics, start_metrics_server
+from blocks import block_cache
+from config import env_config, is_notion_key, poll_interval
+from attachments import AttachmentProcessor, discard_attachments, load_attachment_config
+from clip_history import ClipHistory, ClipboardWatcher, load_history_config, parse_selection
+from clipboard import create_clipboard, load_clipboard_backend
+from routing import frontmost_app, load_router
+from uploader_process import load_uploader_config
+from shutdown import ShutdownCoordinator, load_shutdown_config
 
-def ensure_env_directory():
-    """環境設定ファイル用のディレクトリを作成"""
-    ENV_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+# 設定変更後、古い保存先に積まれていた分の送信を待つ最大時間（秒）
+RETIRE_TIMEOUT = 60
 
-def check_env_file():
-    """環境変数ファイルの存在と内容をチェック"""
-    if not ENV_FILE_PATH.exists():
-        return False
-    
-    try:
-        with open(ENV_FILE_PATH, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            if not content:
-                return False
-                
-            # 必須項目があるかチェック
-            has_api_key = 'NOTION_API_KEY=' in content
-            has_db_id = 'NOTION_DATABASE_ID=' in content
-            
-            # 環境変数を読み込み
-            load_dotenv(ENV_FILE_PATH, override=True)
-            
-            return has_api_key and has_db_id
-    except:
-        return False
+# 「履歴から送信」に表示する件数
+HISTORY_MENU_ENTRIES = 20
 
 
 def run_setup():
@@ -47,7 +35,7 @@ def run_setup():
     print("初回セットアップが必要です")
     print("=" * 50)
     
-    ensure_env_directory()
+    env_config.ensure_directory()
     
     # 説明ダイアログ
     rumps.alert(
@@ -107,7 +95,8 @@ def run_setup():
     # 接続テスト
     print("Notion接続をテスト中...")
     try:
-        client = Client(auth=api_key)
+        from transport import create_notion_client
+        client = create_notion_client(api_key)
         database = client.databases.retrieve(database_id=db_id)
         db_name = database.get("title", [{}])[0].get("plain_text", "Unknown")
         print(f"✓ 接続成功: {db_name}")
@@ -134,17 +123,16 @@ def run_setup():
     else:  # Other
         hotkey = "⌘⌃⇧V"
     
-    # 設定を保存
-    env_content = f"""NOTION_API_KEY={api_key}
-NOTION_DATABASE_ID={db_id}
-HOTKEY={hotkey}
-"""
-    
+    # 設定を保存（ほかの項目は残す）
     try:
-        with open(ENV_FILE_PATH, 'w', encoding='utf-8') as f:
-            f.write(env_content)
+        env_config.save({
+            "NOTION_API_KEY": api_key,
+            "NOTION_DATABASE_ID": db_id,
+            "HOTKEY": hotkey,
+        })
+        env_config.apply()
         
-        print(f"✓ 設定を保存しました: {ENV_FILE_PATH}")
+        print(f"✓ 設定を保存しました: {env_config.path}")
         rumps.alert("設定完了", f"設定を保存しました！\n\nデータベース: {db_name}\nショートカット: {hotkey}")
         
     except Exception as e:
@@ -153,67 +141,136 @@ HOTKEY={hotkey}
         sys.exit(1)
 
 
-def load_hotkey_config():
-    """ホットキー設定を読み込み"""
-    default_display = "⌘⇧V"
-    default_pynput = '<cmd>+<shift>+v'
-    
-    if not ENV_FILE_PATH.exists():
-        return default_display, default_pynput
-    
-    try:
-        with open(ENV_FILE_PATH, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.startswith('HOTKEY='):
-                    hotkey = line.split('=', 1)[1].strip().strip('"\'')
-                    
-                    hotkey_map = {
-                        "⌘⇧V": '<cmd>+<shift>+v',
-                        "⌘⌃⇧V": '<cmd>+<ctrl>+<shift>+v',
-                        "⌘⌥V": '<cmd>+<alt>+v',
-                        "⌘⇧N": '<cmd>+<shift>+n'
-                    }
-                    
-                    return hotkey, hotkey_map.get(hotkey, default_pynput)
-    except:
-        pass
-    
-    return default_display, default_pynput
-
-
 class ClipToNotion(rumps.App):
     def __init__(self):
         super(ClipToNotion, self).__init__("📋", quit_button=None)
         
         # ホットキー設定を読み込み
-        self.hotkey_display, self.hotkey_pynput = load_hotkey_config()
+        self.hotkey_display, self.hotkey_pynput = env_config.hotkey()
+        
+        self.save_item = rumps.MenuItem(
+            f"クリップボードを登録 ({self.hotkey_display})", callback=self.save_selection
+        )
+        self.status_item = rumps.MenuItem("状態: 接続確認中...")
+        
+        # クリップボード（macOS では NSPasteboard を直接読み、pbpaste を起動しない）
+        self.clipboard = create_clipboard(load_clipboard_backend())
+        
+        # 振り分けルール（routes.json、内容・種類・長さ・アプリで保存先のデータベースを選ぶ）
+        self.router = load_router()
+        # ルール名 → 保存先の NotionAPI（既定の保存先に送るルールは含めない）
+        self.route_apis = {}
+        
+        # クリップボード履歴（CLIP_HISTORY=1 のとき、直近のコピーを覚えておき後からまとめて送れる）
+        history_config = load_history_config()
+        self.clip_history = None
+        self.clipboard_watcher = None
+        history_items = []
+        if history_config['enabled']:
+            self.clip_history = ClipHistory(
+                size=history_config['size'],
+                max_bytes=history_config['max_bytes'],
+                spill_bytes=history_config['spill_bytes']
+            )
+            history_items = [rumps.MenuItem("履歴から送信...", callback=self.send_history)]
         
         self.menu = [
-            rumps.MenuItem(f"クリップボードを登録 ({self.hotkey_display})", callback=self.save_selection),
+            self.save_item,
+            *history_items,
+            rumps.MenuItem("検索...", callback=self.search_clips),
+            None,
+            self.status_item,
+            rumps.MenuItem("統計", callback=self.show_stats),
             None,
             rumps.MenuItem("設定を変更", callback=self.open_settings),
             None,
             rumps.MenuItem("終了", callback=self.quit_app)
         ]
         
-        # Notion API初期化
-        try:
-            self.notion_api = NotionAPI()
-            test_result = self.notion_api.test_connection()
-            if test_result['success']:
-                print(f"✓ Notion接続成功: {test_result.get('database_name', 'Unknown')}")
-            else:
-                print(f"✗ Notion接続失敗: {test_result['error']}")
-                rumps.alert("Notion接続エラー", test_result['error'])
-        except Exception as e:
-            print(f"✗ 初期化エラー: {e}")
-            rumps.alert("初期化エラー", str(e))
+        # 送信キュー（ホットキーのスレッドではNotionへの通信を待たない）
+        # キャプチャはまず送信箱に保存され、失敗した分は接続回復時に再送される
+        # BATCH_MODE を指定すると、連続したクリップをまとめて送信する
+        self.outbox = Outbox()
+        batch_config = self.batch_config = load_batch_config()
+        self.batch_uploader = None
+        if batch_config['mode'] != 'off':
+            self.batch_uploader = BatchUploader(batch_config['mode'], batch_config['concurrency'])
+        self.capture_queue = CaptureQueue(
+            self.upload_item,
+            outbox=self.outbox,
+            batch_handler=self.upload_batch if self.batch_uploader else None,
+            batch_size=batch_config['size'],
+            batch_window=batch_config['window'],
+            batch_idle=batch_config['idle']
+        )
+        self.capture_queue.start()
+        
+        # 終了時は送信待ちの分を SHUTDOWN_DEADLINE 秒まで送り、残りは送信箱から次回起動時に送る
+        self.shutdown = ShutdownCoordinator(
+            self.capture_queue, self.outbox, load_shutdown_config()['deadline']
+        )
+        
+        # 各段階の所要時間と統計情報（METRICS_PORT を指定すると /metrics で公開）
+        metrics.register("queue", self.capture_queue.stats)
+        metrics.register("blocks", block_cache.stats)
+        if self.batch_uploader:
+            metrics.register("batch", self.batch_uploader.stats)
+        if self.clip_history:
+            metrics.register("history", self.clip_history.stats)
+        if self.router.routes:
+            metrics.register("routing", self.router.stats)
+        
+        # 画像・HTML・ファイルの取り込み（圧縮はワーカーで行い、ホットキーのスレッドでは待たない）
+        attachment_config = load_attachment_config()
+        self.rich_enabled = attachment_config['mode'] != 'off'
+        self.attachment_processor = AttachmentProcessor(
+            self._enqueue,
+            max_dimension=attachment_config['max_dimension'],
+            quality=attachment_config['quality'],
+            workers=attachment_config['workers']
+        )
+        metrics.register("attachments", self.attachment_processor.stats)
+        self.metrics_server = start_metrics_server()
+        
+        # 重複したクリップの判定（DEDUP_POLICY: skip / bump / always）
+        dedup_config = load_dedup_config()
+        self.dedup_policy = dedup_config['policy']
+        self.dedup_index = DedupIndex(
+            max_entries=dedup_config['size'], window=dedup_config['window']
+        )
             
-        # グローバルホットキーの設定
-        self.hotkey_listener = keyboard.GlobalHotKeys({
-            self.hotkey_pynput: self.save_selection
-        })
-        self.hotkey_listener.start()
+        # グローバルホットキーの設定（Notionの接続確認を待たずに受け付ける）
+        self.hotkey_listener = self._start_hotkey_listener()
+        self.hotkey_ready_at = time.perf_counter() - _STARTED_AT
+        
+        # UPLOADER_PROCESS=1 なら Notion への送信は子プロセスで行い、このプロセスには notion_client を読み込まない
+        self.uploader_config = load_uploader_config()
+        
+        # Notion API の初期化と接続確認はバックグラウンドで行う
+        # 完了前のクリップはキューで待たせ、結果はタイマーでメニューに反映する
+        self.notion_api = None
+        self.mirror = None
+        self.mirror_syncer = None
+        self.notion_ready = threading.Event()
+        self._startup_result = None
+        # 設定の再読み込み（保存先ごとの送信待ちの件数を数え、古い保存先は送り終えてから閉じる）
+        self._targets_changed = threading.Condition()
+        self._pending_targets = {}
+        self._reload_result = None
+        self._reload_lock = threading.Lock()
+        # 保存先の切り替え中はクリアされる（その間のクリップは新しい保存先に送る）
+        self.notion_switched = threading.Event()
+        self.notion_switched.set()
+        self.outbox_replayer = OutboxReplayer(
+            self.outbox, self.capture_queue, probe=self.check_connection
+        )
+        threading.Thread(target=self._init_notion, name="NotionInit", daemon=True).start()
+        self._startup_timer = rumps.Timer(self._apply_startup_result, 0.2)
+        self._startup_timer.start()
+        
+        # 設定ファイルの変更を監視し、再起動せずに反映する（更新時刻を確認するだけ）
+        self._config_timer = rumps.Timer(self._check_config, poll_interval())
+        self._config_timer.start()
         
         # 起動メッセージ
         print("\n" + "=" * 50)
@@ -224,23 +281,342 @@ class ClipToNotion(rumps.App):
         print(f"2. {self.hotkey_display} を押す")
         print("3. Notionに保存されます")
         print("\n終了: メニューバーアイコンから「終了」を選択")
+        print(f"ホットキー準備完了: {self.hotkey_ready_at:.2f}秒")
         print("=" * 50 + "\n")
         
+    def _init_notion(self):
+        """Notion API を初期化して接続を確認（バックグラウンドスレッドで実行）"""
+        try:
+            notion_api = self._create_notion_api()
+            test_result = notion_api.test_connection()
+            self.route_apis = self._create_route_apis(notion_api, self.router)
+            self.notion_api = notion_api
+            if not self.uploader_config['enabled']:
+                from transport import transport_stats
+                metrics.register("transport", transport_stats.snapshot)
+            if test_result['success']:
+                print(f"✓ Notion接続成功: {test_result.get('database_name', 'Unknown')}")
+            else:
+                print(f"✗ Notion接続失敗: {test_result['error']}")
+            self._startup_result = test_result
+        except Exception as e:
+            print(f"✗ 初期化エラー: {e}")
+            self._startup_result = {"success": False, "error": str(e), "fatal": True}
+        finally:
+            self.notion_ready.set()
+        
+        # 振り分け先のデータベース構造を先に取得し、最初のクリップで待たないようにする
+        self._warm_route_apis(self.route_apis)
+        
+        # 未送信のクリップの再送は Notion API の準備ができてから始める
+        self.outbox_replayer.start()
+        
+        # オフライン検索用のローカルミラー（前回以降に編集されたページだけを取り込む）
+        if self.notion_api is not None:
+            from mirror import Mirror
+            self.mirror = Mirror()
+            self._start_mirror_syncer(self.notion_api)
+        
+        # アイドル中も接続を温めておき、次のホットキーで接続確立を待たないようにする
+        # （アップロード用のプロセスを使う場合は、ミラーの同期と一緒に子プロセスで行う）
+        if not self.uploader_config['enabled']:
+            from transport import ConnectionWarmer
+            self.connection_warmer = ConnectionWarmer()
+            self.connection_warmer.start()
+        
+        # クリップボードの監視（変更回数が変わったときだけ内容を読む）
+        if self.clip_history is not None:
+            history_config = load_history_config()
+            self.clipboard_watcher = ClipboardWatcher(
+                self.clip_history,
+                self.get_selected_text,
+                change_count=self.clipboard.change_count,
+                interval=history_config['interval']
+            ).start()
+        
+    def _create_notion_api(self):
+        """現在の設定で NotionAPI（NOTION_ENGINE=async なら AsyncNotionEngine）を作る"""
+        batch_config = load_batch_config()
+        if self.uploader_config['enabled']:
+            return self._create_uploader_api(batch_config)
+        from notion_api import create_notion_api
+        notion_api = create_notion_api(batch_config['engine'], batch_config['engine_concurrency'])
+        if hasattr(notion_api, 'stats'):
+            metrics.register("engine", notion_api.stats)
+        metrics.register("rate_limit", notion_api.client.stats)
+        return notion_api
+    
+    def _create_uploader_api(self, batch_config):
+        """アップロード用の子プロセスを起動し、その NotionAPI の代わり（RemoteNotionAPI）を返す"""
+        from uploader_process import create_uploader_api
+        notion_api = create_uploader_api(
+            batch_config['engine'], batch_config['engine_concurrency'], self.uploader_config['call_timeout']
+        )
+        metrics.register("uploader", notion_api.stats)
+        # 子プロセスの統計情報は、表示・/metrics の取得のたびに問い合わせる
+        for group in ("rate_limit", "transport", "engine"):
+            metrics.register(group, lambda group=group: notion_api.remote_stats().get(group))
+        return notion_api
+    
+    def _create_route_apis(self, notion_api, router):
+        """振り分けルールごとの保存先の NotionAPI（クライアントは notion_api と共有する）
+
+        保存先が同じルールは同じ NotionAPI を使う。通信はしないので、接続確認は _warm_route_apis で行う。
+        """
+        route_apis = {}
+        by_target = {}
+        for route in router.routes:
+            if not (route.database_id or route.memo_property or route.properties):
+                continue
+            target_api = by_target.get(route.target)
+            if target_api is None:
+                target_api = by_target[route.target] = notion_api.for_target(
+                    database_id=route.database_id,
+                    memo_property=route.memo_property,
+                    properties=route.properties
+                )
+            route_apis[route.name] = target_api
+        return route_apis
+    
+    def _warm_route_apis(self, route_apis):
+        """振り分け先ごとに接続を確認し、データベース構造をキャッシュする"""
+        warmed = {}
+        for name, notion_api in route_apis.items():
+            if notion_api not in warmed:
+                warmed[notion_api] = notion_api.test_connection()
+            result = warmed[notion_api]
+            if result['success']:
+                print(f"✓ 振り分け先: {name} → {result.get('database_name', 'Unknown')}")
+            else:
+                print(f"✗ 振り分け先に接続できません: {name}（{result['error']}）")
+    
+    def _api_for_route(self, name):
+        """振り分けルールの保存先（ルールがない・既定の保存先なら現在の NotionAPI）"""
+        if name is None:
+            return self.notion_api
+        return self.route_apis.get(name, self.notion_api)
+    
+    def _start_mirror_syncer(self, notion_api):
+        if self.uploader_config['enabled']:
+            # 同期の通信も子プロセスで行う（接続の維持も一緒に始める）
+            notion_api.start_services(mirror=True)
+            return
+        from mirror import MirrorSync, MirrorSyncer, sync_client_for
+        self.mirror_syncer = MirrorSyncer(MirrorSync(
+            sync_client_for(notion_api), notion_api.database_id, self.mirror
+        ))
+        self.mirror_syncer.start()
+    
+    def _start_hotkey_listener(self):
+        from pynput import keyboard
+        listener = keyboard.GlobalHotKeys({
+            self.hotkey_pynput: self.save_selection
+        })
+        listener.start()
+        return listener
+    
+    def _check_config(self, _=None):
+        """設定ファイルが変更されていれば反映（メインスレッドのタイマーで実行）"""
+        result = self._reload_result
+        if result is not None:
+            self._reload_result = None
+            if result['success']:
+                self.status_item.title = f"状態: 接続済み ({result.get('database_name', 'Unknown')})"
+            else:
+                self.status_item.title = "状態: 接続エラー（オフライン中は送信箱に保存）"
+        
+        if self.router.changed():
+            # 振り分けルールが変わったら、保存先の NotionAPI を作り直す
+            print("\n振り分けルールの変更を反映します")
+            self.status_item.title = "状態: 設定を反映中..."
+            self.notion_switched.clear()
+            threading.Thread(target=self._reload_notion, name="NotionReload", daemon=True).start()
+        
+        if not env_config.changed():
+            return
+        changed = env_config.apply()
+        if not changed:
+            return
+        print(f"\n設定ファイルの変更を反映します: {', '.join(sorted(changed))}")
+        
+        if 'HOTKEY' in changed:
+            self._apply_hotkey()
+        if any(key.startswith('DEDUP_') for key in changed):
+            dedup_config = load_dedup_config()
+            self.dedup_policy = dedup_config['policy']
+            self.dedup_index.max_entries = dedup_config['size']
+            self.dedup_index.window = dedup_config['window']
+        if any(is_notion_key(key) for key in changed):
+            self.status_item.title = "状態: 設定を反映中..."
+            self.notion_switched.clear()
+            threading.Thread(target=self._reload_notion, name="NotionReload", daemon=True).start()
+        
+        restart_keys = sorted(
+            key for key in changed
+            if not (key == 'HOTKEY' or key.startswith('DEDUP_') or is_notion_key(key))
+        )
+        if restart_keys:
+            print(f"⚠️  次の設定はアプリの再起動後に反映されます: {', '.join(restart_keys)}")
+    
+    def _apply_hotkey(self):
+        """ホットキーを登録し直す（新しいキーを先に登録し、受け付けない時間を作らない）"""
+        display, combo = env_config.hotkey()
+        if combo == self.hotkey_pynput:
+            return
+        old_listener = self.hotkey_listener
+        self.hotkey_display, self.hotkey_pynput = display, combo
+        self.hotkey_listener = self._start_hotkey_listener()
+        old_listener.stop()
+        self.save_item.title = f"クリップボードを登録 ({display})"
+        print(f"✓ ショートカットキーを変更しました: {display}")
+    
+    def _reload_notion(self):
+        """新しい設定の NotionAPI に切り替える（バックグラウンドスレッドで実行）
+
+        切り替え前にキューに積まれていたクリップは古い保存先に送り、送り終えてから
+        古い NotionAPI を閉じる。
+        """
+        # 起動時の初期化が終わってから、続けて変更された場合は1回ずつ切り替える
+        self.notion_ready.wait()
+        with self._reload_lock:
+            try:
+                self._switch_notion_api()
+            finally:
+                self.notion_switched.set()
+    
+    def _switch_notion_api(self):
+        try:
+            notion_api = self._create_notion_api()
+            test_result = notion_api.test_connection()
+            router = load_router()
+            route_apis = self._create_route_apis(notion_api, router)
+        except Exception as e:
+            # 作り直せなければ元の設定のまま送信を続ける
+            print(f"✗ 設定の反映に失敗しました（元の設定のまま続けます）: {e}")
+            self._reload_result = {"success": False, "error": str(e)}
+            return
+        
+        old_api = self.notion_api
+        old_route_apis = self.route_apis
+        self.router = router
+        self.route_apis = route_apis
+        self.notion_api = notion_api
+        if router.routes:
+            metrics.register("routing", router.stats)
+        if test_result['success']:
+            print(f"✓ 保存先を切り替えました: {test_result.get('database_name', 'Unknown')}")
+        else:
+            print(f"✗ Notion接続失敗: {test_result['error']}（送信箱に保存して再送します）")
+        self._reload_result = test_result
+        
+        if self.mirror is not None:
+            if self.mirror_syncer:
+                self.mirror_syncer.stop()
+            self._start_mirror_syncer(notion_api)
+        self._warm_route_apis(route_apis)
+        if old_api is not None and old_api is not notion_api:
+            threading.Thread(
+                target=self._retire_notion_api, args=([old_api, *old_route_apis.values()],),
+                name="NotionRetire", daemon=True
+            ).start()
+    
+    def _retire_notion_api(self, notion_apis):
+        """古い保存先（振り分け先を含む）宛ての送信待ちがなくなってから閉じる"""
+        with self._targets_changed:
+            drained = self._targets_changed.wait_for(
+                lambda: not any(self._pending_targets.get(notion_api) for notion_api in notion_apis),
+                timeout=RETIRE_TIMEOUT
+            )
+        if not drained:
+            print("⚠️  古い保存先への送信が終わらないまま切り替えました")
+        for notion_api in notion_apis:
+            if hasattr(notion_api, 'close'):
+                notion_api.close()
+    
+    def _hold_target(self, notion_api):
+        if notion_api is None:
+            return
+        with self._targets_changed:
+            self._pending_targets[notion_api] = self._pending_targets.get(notion_api, 0) + 1
+    
+    def _release_targets(self, items):
+        for item in items:
+            self._release_target(item.target)
+    
+    def _release_target(self, notion_api):
+        if notion_api is None:
+            return
+        with self._targets_changed:
+            count = self._pending_targets.get(notion_api, 0) - 1
+            if count > 0:
+                self._pending_targets[notion_api] = count
+            else:
+                self._pending_targets.pop(notion_api, None)
+            self._targets_changed.notify_all()
+    
+    def _target_for(self, item):
+        """クリップの保存先（積んだ時点の NotionAPI、送信箱から戻した分は現在のもの）"""
+        if item.target is not None:
+            return item.target
+        self._wait_for_notion()
+        return self._api_for_route(item.route)
+    
+    def _apply_startup_result(self, timer):
+        """接続確認の結果をメニューに反映（メインスレッドのタイマーで実行）"""
+        result = self._startup_result
+        if result is None:
+            return
+        timer.stop()
+        
+        if result['success']:
+            self.status_item.title = f"状態: 接続済み ({result.get('database_name', 'Unknown')})"
+        elif result.get('fatal'):
+            self.status_item.title = "状態: 初期化エラー"
+            rumps.alert("初期化エラー", result['error'])
+        else:
+            self.status_item.title = "状態: 接続エラー（オフライン中は送信箱に保存）"
+            rumps.alert("Notion接続エラー", result['error'])
+        
+    def check_connection(self):
+        """Notionに接続できるかどうか（送信箱の再送判定用）"""
+        if self.notion_api is None:
+            return False
+        return self.notion_api.test_connection()['success']
+    
+    def _wait_for_notion(self):
+        """Notion API の初期化を待って返す（初期化に失敗していれば None）"""
+        self.notion_ready.wait()
+        self.notion_switched.wait()
+        return self.notion_api
+        
     def get_selected_text(self):
         """クリップボードから直接テキストを取得"""
         try:
-            text = pyperclip.paste()
+            text = self.clipboard.read_text()
             return text if text else None
         except Exception as e:
             print(f"✗ クリップボード取得エラー: {e}")
             return None
     
     def save_selection(self, _=None):
-        """クリップボードのテキストをNotionに保存"""
+        """クリップボードのテキストを送信キューに追加"""
+        fired_at = time.perf_counter()
         try:
-            print("\nクリップボードからテキストを取得中...")
+            with metrics.span("clipboard_read"):
+                selected_text = self.get_selected_text()
+                rich = self.clipboard.read_rich() if self.rich_enabled else None
+            # アプリの条件があるときだけ、コピー元（最前面）のアプリを調べる
+            app = frontmost_app() if self.router.uses_app else None
             
-            selected_text = self.get_selected_text()
+            # 画像・ファイル・HTML はワーカーで圧縮・変換してからキューに積む
+            if rich:
+                from datetime import datetime
+                title = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.attachment_processor.submit(rich, selected_text, title, app=app)
+                metrics.observe("hotkey", time.perf_counter() - fired_at)
+                if rich.has_attachments():
+                    print(f"\n画像・ファイルを取り込み中: {len(rich.images) + len(rich.files)}件")
+                return
             
             if not selected_text:
                 print("⚠️  クリップボードが空です")
@@ -251,31 +627,270 @@ class ClipToNotion(rumps.App):
                 print("⚠️  空のテキストです")
                 return
             
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            print(f"保存中: {len(selected_text)}文字")
-            
-            result = self.notion_api.create_page(
-                title=timestamp,
-                content=selected_text
-            )
-            
-            if result['success']:
-                print(f"✓ 保存成功: {timestamp}")
-                print(f"  URL: {result['url']}\n")
-            else:
-                print(f"✗ 保存失敗: {result['error']}\n")
+            if self._enqueue(selected_text, app=app):
+                metrics.observe("hotkey", time.perf_counter() - fired_at)
         
         except Exception as e:
             print(f"✗ エラー: {e}\n")
     
+    def _enqueue(self, text, title=None, attachments=None, app=None):
+        """保存先を振り分け、重複を判定して送信キューに積む（積まなかった場合は None）"""
+        if not text.strip() and not attachments:
+            print("⚠️  空のテキストです")
+            return None
+        
+        route = self.router.route(text, app)
+        route_name = route.name if route else None
+        
+        if not self.shutdown.accepting:
+            # 終了処理中は送信キューに積まず、送信箱に残して次回起動時に送る
+            self.shutdown.defer(text, title=title, attachments=attachments, route=route_name)
+            return None
+        
+        digest = None
+        if self.dedup_policy != 'always':
+            # 画像は内容のハッシュがファイル名なので、ファイル名も含めて判定する
+            paths = "".join(attachment["path"] + "\0" for attachment in attachments or ())
+            # 連結すると大きなクリップをコピーしてしまうので、ハッシュに続けて流し込む
+            digest = hash_text(text, hash_text(paths)).hexdigest()
+            if self.handle_duplicate(digest, route_name):
+                discard_attachments(attachments)
+                return None
+        
+        # 設定の変更前に積んだ分は元の保存先へ、切り替え中なら切り替え後の保存先へ送る
+        target = self._api_for_route(route_name) if self.notion_switched.is_set() else None
+        self._hold_target(target)
+        item = self.capture_queue.submit(
+            text, title=title, target=target, attachments=attachments, route=route_name
+        )
+        if item is None:
+            # 送信済み・送信待ちと分かった（同じ時刻・同じ内容のクリップ）
+            self._release_target(target)
+            return None
+        if digest:
+            item.digest = digest
+            self.dedup_index.record(digest)
+        attached = f", 添付{len(item.attachments)}件" if item.attachments else ""
+        routed = f", 振り分け: {route_name}" if route_name else ""
+        print(f"\nキューに追加: {item.title} ({len(text)}文字{attached}{routed}, 待ち: {self.capture_queue.depth()}件)")
+        return item
+    
+    def send_history(self, _):
+        """クリップボード履歴から選んだものをまとめて送信キューに積む"""
+        entries = self.clip_history.entries()[:HISTORY_MENU_ENTRIES]
+        if not entries:
+            rumps.alert("クリップボード履歴", "履歴はまだありません")
+            return
+        
+        lines = [
+            f"{number}. {entry.title[11:]}  {entry.preview}"
+            for number, entry in enumerate(entries, 1)
+        ]
+        response = rumps.Window(
+            "送信する番号を入力してください（例: 1 3 5-7）\n\n" + "\n".join(lines),
+            "履歴から送信",
+            default_text="1",
+            ok="送信",
+            cancel="キャンセル",
+            dimensions=(320, 24)
+        ).run()
+        if not response.clicked:
+            return
+        
+        # コピーした順（古い順）に積み、タイトルはコピーした時刻にする
+        selected = sorted(
+            (entries[index] for index in parse_selection(response.text, len(entries))),
+            key=lambda entry: entry.captured_at
+        )
+        queued = 0
+        for entry in selected:
+            text = self.clip_history.text(entry)
+            if text is None:
+                print(f"⚠️  履歴から消えたため送信できません: {entry.preview}")
+                continue
+            if self._enqueue(text, title=entry.title):
+                queued += 1
+        print(f"履歴から送信: {queued}/{len(selected)}件")
+    
+    def handle_duplicate(self, digest, route_name=None):
+        """直前に保存した内容と同じなら DEDUP_POLICY に従って処理し、True を返す"""
+        duplicate = self.dedup_index.lookup(digest)
+        if duplicate is None:
+            return False
+        
+        if self.dedup_policy == 'bump' and duplicate['page_id']:
+            print("\n同じ内容が保存済みです: 既存ページの時刻を更新します")
+            threading.Thread(
+                target=self._bump_page, args=(digest, duplicate['page_id'], route_name), daemon=True
+            ).start()
+        else:
+            print("\n⚠️  同じ内容が直前に保存されています（スキップ）")
+        return True
+    
+    def _bump_page(self, digest, page_id, route_name=None):
+        """既存ページのタイトルを現在時刻に更新（バックグラウンドで実行）"""
+        self._wait_for_notion()
+        notion_api = self._api_for_route(route_name)
+        if notion_api is None:
+            return
+        from datetime import datetime
+        result = notion_api.touch_page(page_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if result['success']:
+            self.dedup_index.record(digest, page_id)
+            print("✓ 既存ページの時刻を更新しました\n")
+        else:
+            print(f"✗ 時刻の更新に失敗: {result['error']}\n")
+    
+    def upload_item(self, item):
+        """キューから取り出したクリップをNotionに保存（ワーカースレッドで実行）"""
+        try:
+            return self._upload_item(item)
+        finally:
+            self._release_targets([item])
+    
+    def _upload_item(self, item):
+        notion_api = self._target_for(item)
+        if notion_api is None:
+            return {"success": False, "error": "Notion API が初期化されていません", "retryable": True}
+        
+        print(f"保存中: {len(item.content)}文字")
+        
+        result = notion_api.create_page(
+            title=item.title,
+            content=item.content,
+            attachments=item.attachments
+        )
+        self._finish_attachments([item], [result])
+        self._finish_dedup([item], [result])
+        
+        if result['success']:
+            self._add_to_mirror(notion_api, [item], [result])
+            print(f"✓ 保存成功: {item.title} (待ち {item.wait_time:.2f}秒)")
+            print(f"  URL: {result['url']}\n")
+        else:
+            print(f"✗ 保存失敗: {result['error']}")
+            if result.get('retryable', True):
+                print("  送信箱に保存しました。接続が回復したら再送します\n")
+        
+        return result
+    
+    def upload_batch(self, items):
+        """まとめたクリップをNotionに保存（ワーカースレッドで実行）
+
+        設定の変更をまたいで溜まった分は、保存先ごとに分けて送る。
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(id(self._target_for(item)), []).append(item)
+        results = {}
+        for group in groups.values():
+            try:
+                for item, result in zip(group, self._upload_batch(group)):
+                    results[id(item)] = result
+            finally:
+                self._release_targets(group)
+        return [results[id(item)] for item in items]
+    
+    def _upload_batch(self, items):
+        if len(items) == 1:
+            return [self._upload_item(items[0])]
+        
+        notion_api = self._target_for(items[0])
+        if notion_api is None:
+            return [{"success": False, "error": "Notion API が初期化されていません", "retryable": True}] * len(items)
+        
+        print(f"まとめて保存中: {len(items)}件")
+        
+        results = self.batch_uploader.upload(notion_api, items)
+        self._finish_attachments(items, results)
+        self._finish_dedup(items, results)
+        self._add_to_mirror(notion_api, items, results)
+        
+        succeeded = sum(1 for result in results if result['success'])
+        stats = self.batch_uploader.stats()
+        print(f"✓ {succeeded}/{len(items)}件 保存成功 "
+              f"(削減したリクエスト: 累計{stats['requests_saved']}件)")
+        for result in results:
+            if not result['success']:
+                print(f"✗ 保存失敗: {result['error']}")
+                break
+        print()
+        
+        return results
+    
+    def _finish_dedup(self, items, results):
+        """保存できたクリップのページIDを記録し、再送しても失敗するクリップは重複判定から外す"""
+        for item, result in zip(items, results):
+            if not item.digest:
+                continue
+            if result['success']:
+                self.dedup_index.set_page(item.digest, result['page_id'])
+            elif not result.get('retryable', True):
+                self.dedup_index.forget(item.digest)
+    
+    def _finish_attachments(self, items, results):
+        """保存できた（または再送しても失敗する）クリップの書き出した画像を消す"""
+        for item, result in zip(items, results):
+            if item.attachments and (result['success'] or not result.get('retryable', True)):
+                discard_attachments(item.attachments)
+    
+    def _add_to_mirror(self, notion_api, items, results):
+        """保存したクリップをローカルミラーにすぐ反映（同期を待たずに検索できるように）"""
+        if self.mirror is None:
+            return
+        from mirror import saved_pages
+        try:
+            for page_id, title, content, url, appended in saved_pages(items, results):
+                self.mirror.add_local(notion_api.database_id, page_id, title, content, url, append=appended)
+        except Exception as e:
+            print(f"✗ ローカルミラーへの書き込みに失敗: {e}")
+    
+    def search_clips(self, _):
+        """ローカルミラーを全文検索（オフラインでも使える）"""
+        if self.mirror is None:
+            rumps.alert("検索", "Notionへの接続を確認中です。しばらくしてからお試しください")
+            return
+        
+        response = rumps.Window(
+            "検索する語句を入力してください（空白区切りですべてを含むものを探します）",
+            "検索",
+            ok="検索",
+            cancel="キャンセル",
+            dimensions=(320, 24)
+        ).run()
+        query = response.text.strip()
+        if not response.clicked or not query:
+            return
+        
+        started = time.perf_counter()
+        results = self.mirror.search(query, database_id=self.notion_api.database_id, limit=10)
+        elapsed = time.perf_counter() - started
+        if not results:
+            rumps.alert("検索", f"「{query}」は見つかりませんでした")
+            return
+        
+        lines = [f"{result['title']}\n{result['snippet']}" for result in results]
+        clicked = rumps.alert(
+            f"検索結果: {len(results)}件（{elapsed * 1000:.0f}ms）",
+            "\n\n".join(lines),
+            ok="最初の結果を開く",
+            cancel="閉じる"
+        )
+        if clicked == 1 and results[0]['url']:
+            import webbrowser
+            webbrowser.open(results[0]['url'])
+    
+    def show_stats(self, _):
+        """保存経路の各段階の所要時間（p50/p95/p99）などを表示"""
+        rumps.alert("統計", metrics.summary())
+    
     def open_settings(self, _):
         """設定画面を開く（rumps ダイアログ版）"""
         print("\n設定画面を起動しています...")
         
         # 現在の設定を読み込み
-        current_api_key = os.environ.get('NOTION_API_KEY', '')
-        current_db_id = os.environ.get('NOTION_DATABASE_ID', '')
+        current_api_key = env_config.get('NOTION_API_KEY', '')
+        current_db_id = env_config.get('NOTION_DATABASE_ID', '')
         
         # API Key入力
         window = rumps.Window(
@@ -324,7 +939,8 @@ class ClipToNotion(rumps.App):
         # 接続テスト
         print("Notion接続をテスト中...")
         try:
-            client = Client(auth=api_key)
+            from transport import create_notion_client
+            client = create_notion_client(api_key)
             database = client.databases.retrieve(database_id=db_id)
             db_name = database.get("title", [{}])[0].get("plain_text", "Unknown")
             print(f"✓ 接続成功: {db_name}")
@@ -350,55 +966,78 @@ class ClipToNotion(rumps.App):
         else:  # Other
             hotkey = "⌘⌃⇧V"
         
-        # 設定を保存
-        env_content = f"""NOTION_API_KEY={api_key}
-NOTION_DATABASE_ID={db_id}
-HOTKEY={hotkey}
-"""
-        
+        # 設定を保存し、再起動せずに反映する（送信待ちの分は元の保存先に送る）
         try:
-            with open(ENV_FILE_PATH, 'w', encoding='utf-8') as f:
-                f.write(env_content)
-            
-            print(f"✓ 設定を保存しました: {ENV_FILE_PATH}")
-            
-            response = rumps.alert(
-                "設定を更新しました",
-                f"設定を保存しました！\n\n"
-                f"データベース: {db_name}\n"
-                f"ショートカット: {hotkey}\n\n"
-                "変更を反映するにはアプリを再起動してください。\n"
-                "今すぐ再起動しますか？",
-                ok="再起動する",
-                cancel="後で"
-            )
-            
-            if response == 1:
-                self.quit_app(None)
-            
+            env_config.save({
+                "NOTION_API_KEY": api_key,
+                "NOTION_DATABASE_ID": db_id,
+                "HOTKEY": hotkey,
+            })
         except Exception as e:
             print(f"✗ 保存失敗: {e}")
             rumps.alert("保存エラー", f"設定の保存に失敗しました。\n\n{str(e)}")
+            return
+        
+        print(f"✓ 設定を保存しました: {env_config.path}")
+        self._check_config()
+        rumps.alert(
+            "設定を更新しました",
+            f"設定を保存して反映しました。\n\n"
+            f"データベース: {db_name}\n"
+            f"ショートカット: {hotkey}"
+        )
             
     def quit_app(self, _):
-        """アプリケーションを終了"""
+        """アプリケーションを終了（送信中・送信待ちのクリップは SHUTDOWN_DEADLINE 秒まで送る）"""
         print("\nアプリケーションを終了します...")
+        # ここから届いたクリップは送信キューに積まない
+        self.shutdown.begin()
+        self._config_timer.stop()
         if self.hotkey_listener:
             self.hotkey_listener.stop()
+        if self.clipboard_watcher:
+            self.clipboard_watcher.stop()
+        self.outbox_replayer.stop()
+        if self.mirror_syncer:
+            self.mirror_syncer.stop()
+        # 圧縮中の画像も送信箱に書き込んでから終了する
+        self.attachment_processor.close()
+        # まとめ送信で溜めている分も含めて期限まで送信し、残りは送信箱に残す
+        report = self.shutdown.drain()
+        if report['finished']:
+            if self.batch_uploader:
+                self.batch_uploader.close()
+            if self.notion_api is not None and hasattr(self.notion_api, 'close'):
+                self.notion_api.close()
+            if self.mirror:
+                self.mirror.close()
+        # 期限を過ぎた場合は送信中の呼び出しを待たずに終了する（送信箱から次回起動時に再送）
+        if self.clip_history:
+            self.clip_history.close()
         rumps.quit_application()
 
 
 if __name__ == "__main__":
+    # アプリ化（PyInstaller）したときに、アップロード用の子プロセスとして起動された場合の処理
+    multiprocessing.freeze_support()
+    
     # ディレクトリを確保
-    ensure_env_directory()
+    env_config.ensure_directory()
     
-    # .envファイルを読み込み
-    load_dotenv(ENV_FILE_PATH)
+    # .envファイルを読み込み（起動中はこの内容をキャッシュして使う）
+    env_config.apply()
     
     # 初回起動時のセットアップチェック
-    if not check_env_file():
+    if not env_config.is_complete():
         run_setup()
     
     # メインアプリを起動
     app = ClipToNotion()
+    
+    # 起動時間の計測用（bench/bench_startup.py）: ホットキー準備完了で終了する
+    if '--startup-benchmark' in sys.argv:
+        print(f"STARTUP_READY {app.hotkey_ready_at:.6f}", flush=True)
+        app.hotkey_listener.stop()
+        sys.exit(0)
+    
     app.run()
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus のヒストグラムのバケット境界（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# パーセンタイル計算に使う直近のサンプル数
+RESERVOIR_SIZE = 1024
+
+# 保存経路の各段階（表示順）
+STAGES = (
+    ("hotkey", "ホットキー処理"),
+    ("clipboard_read", "クリップボード取得"),
+    ("routing", "振り分けの判定"),
+    ("queue_wait", "キュー待ち"),
+    ("convert", "ブロック変換"),
+    ("connect", "接続確立"),
+    ("http_request", "HTTPリクエスト"),
+    ("save", "保存処理"),
+    ("end_to_end", "キュー投入〜保存完了"),
+)
+
+METRIC_PREFIX = "clip_to_notion"
+
+
+class Histogram:
+    """レイテンシのヒストグラム（Prometheus 用のバケットと直近サンプルのパーセンタイル）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self._recent.append(seconds)
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    self.bucket_counts[index] += 1
+                    break
+
+    def percentiles(self, points=(50, 95, 99)):
+        """直近のサンプルから p50 / p95 / p99 などを計算"""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return {point: None for point in points}
+        return {
+            point: samples[min(len(samples) - 1, int(len(samples) * point / 100))]
+            for point in points
+        }
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for count in self.bucket_counts:
+                running += count
+                cumulative.append(running)
+            return cumulative, self.count, self.total
+
+
+class MetricsRegistry:
+    """段階ごとのヒストグラムと、各コンポーネントの統計情報をまとめる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._collectors = {}
+
+    def histogram(self, stage):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            return histogram
+
+    def observe(self, stage, seconds):
+        """段階 stage の所要時間を記録"""
+        if seconds is not None:
+            self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        """with ブロックの所要時間を stage として記録"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def register(self, name, collector):
+        """stats() のような dict を返す関数を登録（数値の項目がゲージとして出力される）"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def collect(self):
+        """登録された統計情報を {名前: dict} で取得"""
+        with self._lock:
+            collectors = list(self._collectors.items())
+        results = {}
+        for name, collector in collectors:
+            try:
+                results[name] = collector() or {}
+            except Exception as e:
+                results[name] = {"error": str(e)}
+        return results
+
+    def summary(self):
+        """メニュー表示用のテキスト"""
+        lines = []
+        with self._lock:
+            histograms = dict(self._histograms)
+        for stage, label in STAGES:
+            histogram = histograms.get(stage)
+            if histogram is None or not histogram.count:
+                continue
+            p = histogram.percentiles()
+            lines.append(
+                f"{label}: p50 {_ms(p[50])} / p95 {_ms(p[95])} / p99 {_ms(p[99])} ({histogram.count}件)"
+            )
+        if not lines:
+            lines.append("まだ計測データがありません")
+
+        stats = self.collect()
+        queue = stats.get("queue") or {}
+        if queue:
+            lines.append("")
+            lines.append(f"送信待ち: {queue.get('depth', 0)}件 / 送信済み: {queue.get('processed', 0)}件 "
+                         f"/ 失敗: {queue.get('failed', 0)}件")
+        rate = stats.get("rate_limit") or {}
+        if rate.get("requests"):
+            lines.append(f"レート制限の待ち: {rate.get('throttle_wait', 0):.1f}秒 / "
+                         f"429: {rate.get('rate_limited', 0)}回 / 再送: {rate.get('retries', 0)}回")
+        transport = stats.get("transport") or {}
+        if transport.get("requests"):
+            lines.append(f"接続確立: {transport.get('connects', 0)}回 / "
+                         f"リクエスト: {transport.get('requests', 0)}回")
+        batch = stats.get("batch") or {}
+        if batch.get("batches"):
+            lines.append(f"まとめ送信で削減したリクエスト: {batch.get('requests_saved', 0)}件")
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        """Prometheus のテキスト形式で出力"""
+        lines = []
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines.append(f"# HELP {name} Time spent in each stage of the save path.")
+        lines.append(f"# TYPE {name} histogram")
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for stage, histogram in histograms:
+            cumulative, count, total = histogram.snapshot()
+            for bound, value in zip(BUCKETS, cumulative):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for group, values in sorted(self.collect().items()):
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"{METRIC_PREFIX}_{group}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds):
+    if seconds is None:
+        return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds >= 0.01 else f"{seconds * 1000:.2f}ms"
+
+
+# アプリ全体で共有するレジストリ
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """localhost で /metrics（Prometheus 形式）を返す HTTP サーバー"""
+
+    def __init__(self, port, registry=None, host='127.0.0.1'):
+        registry = registry or metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="MetricsServer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def start_metrics_server():
+    """METRICS_PORT が設定されていれば /metrics を公開する"""
+    port = os.environ.get('METRICS_PORT')
+    if not port:
+        return None
+    try:
+        server = MetricsServer(int(port)).start()
+    except (OSError, ValueError) as e:
+        print(f"✗ メトリクスサーバーを起動できません: {e}")
+        return None
+    print(f"メトリクス: http://127.0.0.1:{server.port}/metrics")
+    return server
@@ -0,0 +1,395 @@
+"""
+Notion データベースのローカルミラー（オフライン検索用）
+
+databases.query をページ送りしながら、前回の同期以降に編集されたページだけを
+SQLite に取り込み、タイトルと「メモ」を FTS5 で全文検索できるようにする。
+このアプリで保存したクリップは保存直後にミラーへ書き込むので、同期を待たずに検索できる。
+
+    python cli.py sync            # 前回以降の差分を同期
+    python cli.py sync --full     # すべて取り直し、削除されたページも反映
+    python cli.py search 会議 議事録
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from chunker import iter_segments, take_segments
+from schema_cache import MEMO_PROPERTY_NAME
+
+# ローカルミラーのデータベースファイル
+MIRROR_PATH = Path.home() / '.clip_to_notion' / 'mirror.db'
+
+# 自動で同期する間隔（秒、MIRROR_SYNC_INTERVAL で変更、0 で無効）
+DEFAULT_SYNC_INTERVAL = 15 * 60
+
+# databases.query の1回あたりの件数（API の上限）
+QUERY_PAGE_SIZE = 100
+
+# trigram トークナイザーで検索できる最短の文字数（これより短い語は LIKE で探す）
+TRIGRAM_MIN_CHARS = 3
+
+
+class Mirror:
+    """Notion データベースのローカルコピー（SQLite + FTS5 全文検索）
+
+    タイトルと「メモ」のテキストを保存し、trigram トークナイザーの FTS5 索引で
+    日本語も含めてオフラインで検索できるようにする。同期の続きの位置
+    （last_edited_time）もデータベースごとにここに保存する。
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else MIRROR_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Notion から取り直せるキャッシュなので、書き込みの fsync は減らす
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                id TEXT PRIMARY KEY,
+                database_id TEXT NOT NULL,
+                title TEXT NOT NULL DEFAULT '',
+                memo TEXT NOT NULL DEFAULT '',
+                url TEXT,
+                created_time TEXT,
+                last_edited_time TEXT,
+                local INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id, last_edited_time);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                database_id TEXT PRIMARY KEY,
+                cursor TEXT,
+                synced_at REAL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+                title, memo, content='pages', content_rowid='rowid', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+                INSERT INTO pages_fts (rowid, title, memo) VALUES (new.rowid, new.title, new.memo);
+            END;
+            CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+                INSERT INTO pages_fts (pages_fts, rowid, title, memo)
+                VALUES ('delete', old.rowid, old.title, old.memo);
+            END;
+            CREATE TRIGGER IF NOT EXISTS pages_au AFTER UPDATE ON pages BEGIN
+                INSERT INTO pages_fts (pages_fts, rowid, title, memo)
+                VALUES ('delete', old.rowid, old.title, old.memo);
+                INSERT INTO pages_fts (rowid, title, memo) VALUES (new.rowid, new.title, new.memo);
+            END;
+            """
+        )
+
+    def add_local(self, database_id, page_id, title, content, url=None, append=False):
+        """このアプリで保存したページをすぐに反映（次の同期で Notion の内容に置き換わる）
+
+        「メモ」には Notion と同じく、プロパティに入る分だけを保存する。
+        append=True（期間ページへの追記）なら、検索できるよう既存の「メモ」の後ろに足す。
+        """
+        with self._lock:
+            if append:
+                row = self._conn.execute("SELECT memo FROM pages WHERE id = ?", (page_id,)).fetchone()
+                if row and row["memo"]:
+                    content = row["memo"] + "\n\n" + content
+            memo = "".join(take_segments(iter_segments(content))[0])
+            self._conn.execute(
+                """INSERT INTO pages (id, database_id, title, memo, url, local)
+                   VALUES (?, ?, ?, ?, ?, 1)
+                   ON CONFLICT(id) DO UPDATE SET title = excluded.title, memo = excluded.memo,
+                       url = COALESCE(excluded.url, pages.url)""",
+                (page_id, database_id, title, memo, url)
+            )
+
+    def upsert_pages(self, database_id, pages, cursor=None):
+        """同期で取得したページを1トランザクションで書き込み、続きの位置を進める"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """INSERT INTO pages (id, database_id, title, memo, url, created_time, last_edited_time, local)
+                       VALUES (:id, :database_id, :title, :memo, :url, :created_time, :last_edited_time, 0)
+                       ON CONFLICT(id) DO UPDATE SET
+                           title = excluded.title, url = excluded.url,
+                           -- 期間ページは「メモ」が空で本文に追記されるので、手元で足した分を残す
+                           memo = CASE WHEN excluded.memo = '' THEN pages.memo ELSE excluded.memo END,
+                           created_time = excluded.created_time,
+                           last_edited_time = excluded.last_edited_time, local = 0""",
+                    [dict(page, database_id=database_id) for page in pages]
+                )
+                if cursor:
+                    self._conn.execute(
+                        """INSERT INTO sync_state (database_id, cursor, synced_at) VALUES (?, ?, ?)
+                           ON CONFLICT(database_id) DO UPDATE SET
+                               cursor = MAX(COALESCE(sync_state.cursor, ''), excluded.cursor),
+                               synced_at = excluded.synced_at""",
+                        (database_id, cursor, time.time())
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove_missing(self, database_id, seen_ids):
+        """完全同期で見つからなかった（削除・アーカイブされた）ページを消す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM pages WHERE database_id = ? AND local = 0", (database_id,)
+            ).fetchall()
+            missing = [(row["id"],) for row in rows if row["id"] not in seen_ids]
+            self._conn.executemany("DELETE FROM pages WHERE id = ?", missing)
+        return len(missing)
+
+    def cursor(self, database_id):
+        """前回の同期で取得した最新の last_edited_time"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cursor FROM sync_state WHERE database_id = ?", (database_id,)
+            ).fetchone()
+        return row["cursor"] if row else None
+
+    def reset_cursor(self, database_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sync_state WHERE database_id = ?", (database_id,))
+
+    def count(self, database_id=None):
+        with self._lock:
+            if database_id:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM pages WHERE database_id = ?", (database_id,)
+                ).fetchone()
+            else:
+                row = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()
+        return row[0]
+
+    def search(self, query, database_id=None, limit=20):
+        """タイトルと「メモ」を全文検索（空白区切りの語をすべて含むページ、関連度順）"""
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return []
+
+        long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_CHARS]
+        short_terms = [term for term in terms if len(term) < TRIGRAM_MIN_CHARS]
+
+        conditions = []
+        params = []
+        if long_terms:
+            conditions.append("pages_fts MATCH ?")
+            params.append(" AND ".join(_fts_phrase(term) for term in long_terms))
+        for term in short_terms:
+            # trigram の索引は3文字未満の語に使えないため、本文を直接探す
+            conditions.append("(pages.title LIKE ? ESCAPE '\\' OR pages.memo LIKE ? ESCAPE '\\')")
+            pattern = f"%{_like_escape(term)}%"
+            params.extend([pattern, pattern])
+        if database_id:
+            conditions.append("pages.database_id = ?")
+            params.append(database_id)
+
+        snippet_params = []
+        if long_terms:
+            source = "pages_fts JOIN pages ON pages.rowid = pages_fts.rowid"
+            snippet = "snippet(pages_fts, -1, '[', ']', '…', 16)"
+            order = "bm25(pages_fts), "
+        else:
+            # 見つかった位置の前後を切り出す（メモ全体は読み込まない）
+            source = "pages"
+            snippet = "substr(pages.memo, max(1, instr(pages.memo, ?) - 30), 90)"
+            snippet_params.append(short_terms[0])
+            order = ""
+        sql = f"""
+            SELECT pages.id, pages.title, pages.url, pages.last_edited_time, pages.local,
+                   {snippet} AS snippet
+            FROM {source}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order}COALESCE(pages.last_edited_time, '9999') DESC
+            LIMIT ?
+        """
+        with self._lock:
+            rows = self._conn.execute(sql, snippet_params + params + [limit]).fetchall()
+
+        return [
+            {
+                "page_id": row["id"],
+                "title": row["title"],
+                "url": row["url"],
+                "snippet": " ".join(row["snippet"].split()),
+                "last_edited_time": row["last_edited_time"],
+                "local": bool(row["local"]),
+            }
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _fts_phrase(term):
+    """ユーザーの入力を FTS5 のフレーズとして扱う（演算子として解釈させない）"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_escape(term):
+    return re.sub(r"([\\%_])", r"\\\1", term)
+
+
+def plain_text(items):
+    """rich_text / title の配列をテキストにする"""
+    return "".join(item.get("plain_text") or item.get("text", {}).get("content", "") for item in items or [])
+
+
+def page_record(page, memo_name=MEMO_PROPERTY_NAME):
+    """databases.query の結果のページをミラーの行にする"""
+    title = ""
+    memo = ""
+    for name, value in page.get("properties", {}).items():
+        kind = value.get("type")
+        if kind == "title":
+            title = plain_text(value.get("title"))
+        elif name == memo_name and kind == "rich_text":
+            memo = plain_text(value.get("rich_text"))
+    return {
+        "id": page["id"],
+        "title": title,
+        "memo": memo,
+        "url": page.get("url"),
+        "created_time": page.get("created_time"),
+        "last_edited_time": page.get("last_edited_time"),
+    }
+
+
+def saved_pages(items, results):
+    """保存に成功したクリップを (ページID, タイトル, 本文, URL, 追記か) にまとめる
+
+    まとめ送信（page モード）では複数のクリップが同じページになるので、1件にまとめる。
+    期間ページへの追記（STORAGE_MODE=daily / hourly）はページのタイトルが期間になる。
+    """
+    pages = {}
+    for item, result in zip(items, results):
+        if not result.get('success'):
+            continue
+        page = pages.setdefault(result['page_id'], [item.title, [], result.get('url'), result.get('appended', False)])
+        if page[3]:
+            page[0] = result['title']
+        page[1].append(item.content)
+    for page_id, (title, contents, url, appended) in pages.items():
+        if len(contents) > 1 and not appended:
+            title = f"{title} 他{len(contents) - 1}件"
+        yield page_id, title, "\n\n".join(contents), url, appended
+
+
+def sync_client_for(notion_api):
+    """ミラーの同期に使う同期版のクライアント
+
+    非同期エンジンの場合は、同期版のクライアントを別に作る（レート制限のトークンバケットは
+    API キーごとに共有される）。
+    """
+    client = notion_api.client
+    if not asyncio.iscoroutinefunction(client.request):
+        return client
+    from transport import create_notion_client
+    return create_notion_client(notion_api.api_key)
+
+
+class MirrorSync:
+    """databases.query をページ送りしながら、前回以降に編集されたページをミラーに取り込む
+
+    last_edited_time は分単位なので、前回の最新時刻「以降」（同じ分を含む）を取り直す。
+    取り込みは上書きなので、同じページを何度取得しても問題ない。アーカイブされた
+    ページは query の結果に含まれないため、full=True の完全同期でのみ削除を反映する。
+    """
+
+    def __init__(self, client, database_id, mirror, memo_name=MEMO_PROPERTY_NAME):
+        self.client = client
+        self.database_id = database_id
+        self.mirror = mirror
+        self.memo_name = memo_name
+        self._lock = threading.Lock()
+        self.last_result = None
+
+    def sync(self, full=False):
+        """同期して {"success", "fetched", "removed", "requests", "elapsed"} を返す"""
+        if not self._lock.acquire(blocking=False):
+            return {"success": False, "error": "同期中です"}
+        started = time.monotonic()
+        fetched = removed = requests = 0
+        try:
+            cursor = None if full else self.mirror.cursor(self.database_id)
+            seen_ids = set()
+            body = {
+                "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}],
+                "page_size": QUERY_PAGE_SIZE,
+            }
+            if cursor:
+                body["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": cursor}}
+
+            while True:
+                response = self.client.databases.query(database_id=self.database_id, **body)
+                requests += 1
+                records = [page_record(page, self.memo_name) for page in response.get("results", [])]
+                latest = max((record["last_edited_time"] or "" for record in records), default=None)
+                # ページごとに書き込んで位置を進めるので、途中で失敗しても次回はその続きから
+                self.mirror.upsert_pages(self.database_id, records, latest)
+                fetched += len(records)
+                seen_ids.update(record["id"] for record in records)
+                if not response.get("has_more"):
+                    break
+                body["start_cursor"] = response["next_cursor"]
+
+            if full:
+                removed = self.mirror.remove_missing(self.database_id, seen_ids)
+
+            result = {"success": True, "fetched": fetched, "removed": removed, "requests": requests}
+        except Exception as e:
+            result = {"success": False, "error": str(e), "fetched": fetched, "requests": requests}
+        finally:
+            self._lock.release()
+
+        result["elapsed"] = time.monotonic() - started
+        self.last_result = result
+        return result
+
+
+class MirrorSyncer:
+    """一定間隔でバックグラウンド同期するスレッド"""
+
+    def __init__(self, mirror_sync, interval=None):
+        if interval is None:
+            interval = float(os.environ.get('MIRROR_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL))
+        self.mirror_sync = mirror_sync
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="MirrorSyncer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def sync_now(self):
+        """次の間隔を待たずに同期する"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            result = self.mirror_sync.sync()
+            if result['success'] and result['fetched']:
+                print(f"✓ ローカルミラーを同期しました: {result['fetched']}件 ({result['elapsed']:.1f}秒)")
+            elif not result['success']:
+                print(f"✗ ローカルミラーの同期に失敗: {result['error']}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
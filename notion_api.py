@@ -1,95 +1,395 @@
 import os
-from notion_client import Client
+import json
+import threading
+from itertools import chain
+from notion_client.errors import APIResponseError, HTTPResponseError
 from datetime import datetime
-from pathlib import Path
 
-class NotionAPI:
-    def __init__(self):
+from chunker import (
+    REQUEST_BYTES, iter_segments, take_segments, rich_text, paragraph_blocks, paginate_blocks
+)
+from transport import create_notion_client
+from blocks import block_cache, load_format_config
+from period_pages import PeriodPageCache, group_by_period, load_storage_mode
+from attachments import FilePart, attachment_block, upload_parts
+from schema_cache import SchemaCache, MEMO_PROPERTY_NAME, schema_from_database
+
+class NotionAPIBase:
+    """NotionAPI と AsyncNotionAPI に共通の部分（設定・データベース構造・リクエスト内容の組み立て）
+
+    通信はサブクラスが行い、ここでは Notion に送る内容だけを作る。
+    """
+
+    def __init__(self, schema_cache=None, database_id=None, memo_property=None, properties=None):
         # 環境変数から取得（load_dotenv済みの前提）
+        # 振り分けルール（routing.py）の保存先は database_id・memo_property・properties で指定する
         self.api_key = os.environ.get('NOTION_API_KEY')
-        self.database_id = os.environ.get('NOTION_DATABASE_ID')
+        self.database_id = database_id or os.environ.get('NOTION_DATABASE_ID')
 
         if not self.api_key:
             raise ValueError("NOTION_API_KEY環境変数が設定されていません")
         if not self.database_id:
             raise ValueError("NOTION_DATABASE_ID環境変数が設定されていません")
 
-        self.client = Client(auth=self.api_key)
+        # データベース構造はディスクにキャッシュし、起動ごとの取得を省く
+        self.schema_cache = schema_cache or SchemaCache()
         self.title_property = None
-        self.memo_property_name = "メモ"
+        self.memo_property_name = memo_property or MEMO_PROPERTY_NAME
+        # ページに一緒に設定するプロパティ（タグなど）
+        self.extra_properties = properties or {}
+        self.clip_format = load_format_config()
+        # STORAGE_MODE=daily / hourly なら期間ごとのページに追記する
+        self.storage_mode = load_storage_mode()
+        self.period_pages = PeriodPageCache()
 
-    def create_page(self, title, content):
-        """Notionデータベースに新しいページを作成"""
-        try:
-            # 初回のみデータベース構造を取得
-            if self.title_property is None:
-                database = self.client.databases.retrieve(database_id=self.database_id)
-                properties_schema = database.get("properties", {})
-
-                # タイトルプロパティを探す
-                for prop_name, prop_info in properties_schema.items():
-                    if prop_info.get("type") == "title":
-                        self.title_property = prop_name
-                        print(f"タイトルプロパティを検出: {prop_name}")
-                        break
-
-                if not self.title_property:
-                    raise ValueError("タイトルプロパティが見つかりません")
-
-            # 日付列に入れるための現在時刻を生成
-            page_name_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # プロパティを構築
-            properties = {
-                # タイトルプロパティ（日付列）に現在時刻を設定
-                self.title_property: {
-                    "title": [
-                        {
-                            "text": {
-                                "content": page_name_date 
-                            }
-                        }
-                    ]
-                },
-                # 「メモ」プロパティに選択範囲のテキストを設定
-                self.memo_property_name: {
-                    "rich_text": [
-                        {
-                            "text": {
-                                "content": content
-                            }
-                        }
-                    ]
-                }
+    def _page_content(self, title, content):
+        """1クリップ分のページの (プロパティ, 本文ブロック)"""
+        # 2000文字ごとに分割し、「メモ」に入りきらない分はページ本文に入れる
+        memo, overflow = take_segments(iter_segments(content))
+        # Markdown・コード・URL は本文に全体を書式付きで入れる（「メモ」は検索用のテキストのまま）
+        blocks = self._converted_blocks(content)
+        if blocks is None:
+            blocks = paragraph_blocks(overflow)
+        return self._build_properties(title, memo), blocks
+
+    def _batch_content(self, clips):
+        """まとめページの (プロパティ, 本文ブロック)"""
+        first_title = clips[0][0] or now_title()
+        if len(clips) > 1:
+            first_title = f"{first_title} 他{len(clips) - 1}件"
+        # 「メモ」には各クリップを空行区切りで入れる（入りきらない分は本文のみ）
+        memo, _ = take_segments(self._joined_segments(clips))
+        return self._build_properties(first_title, memo), self._batch_blocks(clips)
+
+    def _first_request(self, properties, blocks):
+        """pages.create の引数と、1回に入りきらない本文ブロックのバッチを返す"""
+        first_budget = REQUEST_BYTES - len(json.dumps(properties))
+        batches = paginate_blocks(blocks, first_budget)
+        request = {
+            "parent": {"database_id": self.database_id},
+            "properties": properties,
+            "children": next(batches),
+        }
+        return request, batches
+
+    def _title_properties(self, title):
+        """タイトル（時刻）だけを更新するプロパティ"""
+        return {self.title_property: {"title": rich_text([title])}}
+
+    def _joined_segments(self, clips):
+        """各クリップのセグメントを空行区切りで順に返す"""
+        for index, (_, content) in enumerate(clips):
+            if index:
+                yield "\n\n"
+            yield from iter_segments(content)
+
+    def _batch_blocks(self, clips):
+        """まとめページの本文ブロック（クリップごとに時刻の見出し + 段落）"""
+        for clip_title, content in clips:
+            yield {
+                "object": "block",
+                "type": "heading_3",
+                "heading_3": {"rich_text": rich_text([clip_title])}
             }
+            blocks = self._converted_blocks(content)
+            if blocks is None:
+                blocks = paragraph_blocks(iter_segments(content))
+            yield from blocks
 
-            # ページ本文は空
-            children = [] 
+    def _converted_blocks(self, content):
+        """内容に合わせて変換した本文ブロック（普通のテキスト・変換しない設定なら None）"""
+        if self.clip_format == 'plain':
+            return None
+        return block_cache.convert(content)
 
-            # Notionにページを作成
-            response = self.client.pages.create(
-                parent={"database_id": self.database_id},
-                properties=properties,
-                children=children
-            )
+    def _upload_request(self, attachment, parts):
+        """file_uploads.create の引数（20MB を超えるファイルは分割して送る）"""
+        request = {"filename": attachment["filename"], "content_type": attachment["content_type"]}
+        if len(parts) > 1:
+            request.update(mode="multi_part", number_of_parts=len(parts))
+        else:
+            request["mode"] = "single_part"
+        return request
 
-            return {
-                "success": True,
-                "page_id": response["id"],
-                "url": response["url"]
+    def _send_fields(self, attachment, file, start, length, number, parts):
+        """file_uploads.send の引数（ファイルは FilePart で少しずつ読みながら送る）"""
+        fields = {"file": (attachment["filename"], FilePart(file, start, length), attachment["content_type"])}
+        if len(parts) > 1:
+            fields["part_number"] = str(number)
+        return fields
+
+    def _period_properties(self, period):
+        """期間ページのプロパティ（タイトルは日付または時間、クリップは本文に追記する）"""
+        return self._build_properties(period, [])
+
+    def _period_query(self, period):
+        """キャッシュにない期間ページを探す databases.query の引数"""
+        return {
+            "filter": {"property": self.title_property, "title": {"equals": period}},
+            "sorts": [{"timestamp": "created_time", "direction": "ascending"}],
+            "page_size": 1,
+        }
+
+    def _cached_schema(self):
+        """ディスクにキャッシュした構造（「メモ」に使うプロパティが違う保存先のものは使わない）"""
+        schema = self.schema_cache.get(self.database_id)
+        if schema is None or schema.get("memo_property") != self.memo_property_name:
+            return None
+        return schema
+
+    def _store_schema(self, database):
+        """取得したデータベース構造をキャッシュに保存"""
+        schema = schema_from_database(database, self.memo_property_name)
+        if schema["title_property"]:
+            self.schema_cache.put(self.database_id, schema)
+        return schema
+
+    def _apply_schema(self, schema):
+        if not schema["title_property"]:
+            raise ValueError("タイトルプロパティが見つかりません")
+        if not schema["memo_property"]:
+            raise ValueError(f"「{self.memo_property_name}」プロパティが見つかりません")
+
+        if self.title_property != schema["title_property"]:
+            print(f"タイトルプロパティを検出: {schema['title_property']}")
+        self.title_property = schema["title_property"]
+
+    def _build_properties(self, title, memo_segments):
+        """ページのプロパティを構築（「メモ」は2000文字以下のセグメントのリスト）"""
+        return {
+            **self.extra_properties,
+            # タイトルプロパティ（日付列）に時刻を設定
+            self.title_property: {
+                "title": [
+                    {
+                        "text": {
+                            "content": title
+                        }
+                    }
+                ]
+            },
+            # 「メモ」プロパティに選択範囲のテキストを設定
+            self.memo_property_name: {
+                "rich_text": rich_text(memo_segments)
             }
+        }
+
+
+class NotionAPI(NotionAPIBase):
+    def __init__(self, schema_cache=None, client=None, **target):
+        super().__init__(schema_cache, **target)
+        # 接続はプロセス全体で共有するプールを使い回す
+        # レート制限（NOTION_RATE_LIMIT リクエスト/秒）と再送はクライアント側で行う
+        self.client = client or create_notion_client(self.api_key)
+        self._period_lock = threading.Lock()
+
+    def for_target(self, **target):
+        """同じクライアントで別の保存先に送る NotionAPI（振り分けルール用）
+
+        レート制限はインテグレーション単位なので、保存先が増えてもクライアントは共有する。
+        """
+        notion_api = NotionAPI(self.schema_cache, client=self.client, **target)
+        notion_api.period_pages = self.period_pages
+        return notion_api
+
+    def create_page(self, title, content, attachments=None):
+        """Notionデータベースに新しいページを作成（追記モードなら期間ページに追記）
+
+        attachments（画像・ファイル）はアップロードして本文の末尾に表示する。
+        """
+        if self.storage_mode != 'page':
+            return self.append_clips([(title or now_title(), content)], attachments)
+        try:
+            # 日付列に入れる時刻（キャプチャ時刻が渡されなければ現在時刻）
+            page_name_date = title or now_title()
+            # アップロードはページの作り直し（構造の不一致）でもやり直さない
+            attachment_blocks = self._upload_attachments(attachments)
+
+            def create():
+                # Notionにページを作成（本文が多い場合は追加リクエストで書き足す）
+                properties, blocks = self._page_content(page_name_date, content)
+                return self._create_page_with_blocks(properties, chain(blocks, attachment_blocks))
+
+            return page_result(self._create_with_schema_retry(create))
 
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e)
-            }
+            return error_result(e)
+
+    def create_batch_page(self, clips):
+        """複数のクリップを1ページにまとめて作成
+
+        clips: (タイトル, 本文) のリスト。ページのタイトルは最初のクリップの時刻、
+        本文には各クリップを「時刻の見出し + 段落」として並べる。
+        追記モードでは、まとめたクリップを期間ページに1回で追記する。
+        """
+        if self.storage_mode != 'page':
+            return self.append_clips(clips)
+        try:
+            def create():
+                return self._create_page_with_blocks(*self._batch_content(clips))
+
+            return page_result(self._create_with_schema_retry(create))
+
+        except Exception as e:
+            return error_result(e)
+
+    def append_clips(self, clips, attachments=None):
+        """クリップを「時刻の見出し + 本文」として期間ページに追記
+
+        期間ページのIDはキャッシュしておき、追記は blocks.children.append 1回で済ませる。
+        キャッシュになければデータベースから探し、それでもなければ作成する。
+        複数の期間にまたがる場合は最後の期間ページの結果を返す（添付ファイルもそのページに入れる）。
+        """
+        try:
+            self._ensure_schema()
+            attachment_blocks = self._upload_attachments(attachments)
+            result = None
+            groups = group_by_period(self.storage_mode, clips)
+            for index, (period, group) in enumerate(groups):
+                extra = attachment_blocks if index == len(groups) - 1 else []
+                result = self._append_to_period(period, group, extra)
+            return result
+        except Exception as e:
+            return error_result(e)
+
+    def touch_page(self, page_id, title):
+        """既存ページのタイトル（時刻）を更新（重複したクリップを保存し直す代わり）"""
+        if self.storage_mode != 'page':
+            return {"success": False, "error": "追記モードでは期間ページの時刻は更新しません", "retryable": False}
+        try:
+            self._ensure_schema()
+            self.client.pages.update(page_id=page_id, properties=self._title_properties(title))
+            return {"success": True, "page_id": page_id}
+        except Exception as e:
+            return error_result(e)
+
+    def _create_page_with_blocks(self, properties, blocks):
+        """ページを作成し、1回に入りきらない本文ブロックを追加で書き込む
+
+        書き込みの途中で失敗した場合は、再送で重複しないよう作成したページを
+        アーカイブしてから例外を送出する。
+        """
+        request, batches = self._first_request(properties, blocks)
+        response = self.client.pages.create(**request)
+
+        try:
+            for batch in batches:
+                self.client.blocks.children.append(block_id=response["id"], children=batch)
+        except Exception:
+            try:
+                self.client.pages.update(page_id=response["id"], archived=True)
+            except Exception as e:
+                print(f"✗ 書き込み途中のページをアーカイブできませんでした: {e}")
+            raise
+
+        return response
+
+    def _append_to_period(self, period, clips, extra_blocks=()):
+        # 同じ期間ページへの追記は1件ずつ（順番を保ち、ページを二重に作らない）
+        with self._period_lock:
+            entry = self.period_pages.get(self.database_id, period) or self._find_period_page(period)
+            if entry is not None:
+                try:
+                    self._append_blocks(entry["page_id"], chain(self._batch_blocks(clips), extra_blocks))
+                    return appended_result(entry, period)
+                except APIResponseError as e:
+                    if not is_missing_page_error(e):
+                        raise
+                    print(f"⚠️  {period} のページが見つからないため作り直します")
+                    self.period_pages.invalidate(self.database_id, period)
+
+            response = self._create_with_schema_retry(lambda: self._create_page_with_blocks(
+                self._period_properties(period), chain(self._batch_blocks(clips), extra_blocks)
+            ))
+            entry = {"page_id": response["id"], "url": response["url"]}
+            self.period_pages.put(self.database_id, period, entry["page_id"], entry["url"])
+            return appended_result(entry, period)
+
+    def _upload_attachments(self, attachments):
+        """添付ファイルをアップロードし、表示するブロックのリストを返す"""
+        return [attachment_block(attachment, self._upload_file(attachment)) for attachment in attachments or ()]
+
+    def _upload_file(self, attachment):
+        """ファイルをアップロードして file_upload の ID を返す
+
+        本文は FilePart で 64KB ずつ読みながら multipart で送るので、ファイル全体をメモリに載せない。
+        """
+        parts = upload_parts(os.path.getsize(attachment["path"]))
+        upload = self.client.file_uploads.create(**self._upload_request(attachment, parts))
+        with open(attachment["path"], 'rb') as file:
+            for number, (start, length) in enumerate(parts, 1):
+                self.client.file_uploads.send(
+                    file_upload_id=upload["id"],
+                    **self._send_fields(attachment, file, start, length, number, parts)
+                )
+        if len(parts) > 1:
+            self.client.file_uploads.complete(file_upload_id=upload["id"])
+        return upload["id"]
+
+    def _find_period_page(self, period):
+        """キャッシュにない期間ページをデータベースから探す（別の端末で作られた場合など）"""
+        response = self.client.databases.query(database_id=self.database_id, **self._period_query(period))
+        pages = response.get("results", [])
+        if not pages:
+            return None
+        entry = {"page_id": pages[0]["id"], "url": pages[0].get("url")}
+        self.period_pages.put(self.database_id, period, entry["page_id"], entry["url"])
+        return entry
+
+    def _append_blocks(self, page_id, blocks):
+        """ブロックを追記（100個・ペイロード上限ごとに分けて送る）
+
+        途中で失敗した場合は、再送で重複しないよう書き込んだ分を削除してから例外を送出する。
+        """
+        appended = []
+        try:
+            for batch in paginate_blocks(blocks, REQUEST_BYTES):
+                if not batch:
+                    continue
+                response = self.client.blocks.children.append(block_id=page_id, children=batch)
+                appended.extend(block["id"] for block in response.get("results", []) if "id" in block)
+        except Exception:
+            for block_id in appended:
+                try:
+                    self.client.blocks.delete(block_id=block_id)
+                except Exception as e:
+                    print(f"✗ 書き込み途中のブロックを削除できませんでした: {e}")
+                    break
+            raise
+
+    def _create_with_schema_retry(self, create):
+        """ページを作成し、プロパティの不一致で失敗したら構造を取り直して1回だけやり直す"""
+        self._ensure_schema()
+        try:
+            return create()
+        except APIResponseError as e:
+            if not is_schema_error(e):
+                raise
+            previous = (self.title_property, self.memo_property_name)
+            print("データベースの構造が変わったため取り直します")
+            self.schema_cache.invalidate(self.database_id)
+            self._ensure_schema(refresh=True)
+            if (self.title_property, self.memo_property_name) == previous:
+                raise
+            return create()
+
+    def _ensure_schema(self, refresh=False):
+        """プロパティ名を確定させる（メモリ → ディスクキャッシュ → databases.retrieve の順）"""
+        if self.title_property is not None and not refresh:
+            return
+
+        schema = None if refresh else self._cached_schema()
+        if schema is None:
+            database = self.client.databases.retrieve(database_id=self.database_id)
+            schema = self._store_schema(database)
+        self._apply_schema(schema)
 
     def test_connection(self):
         """Notion接続をテスト"""
         try:
-            # データベース情報を取得して接続を確認
+            # データベース情報を取得して接続を確認（構造もキャッシュして初回保存を速くする）
             database = self.client.databases.retrieve(database_id=self.database_id)
+            self._store_schema(database)
             return {
                 "success": True,
                 "database_name": database.get("title", [{}])[0].get("plain_text", "Unknown")
@@ -98,4 +398,79 @@ class NotionAPI:
             return {
                 "success": False,
                 "error": str(e)
-            }
\ No newline at end of file
+            }
+
+
+def create_notion_api(engine='sync', concurrency=4, **target):
+    """送信エンジンに応じた NotionAPI を作成（async なら同じメソッドを持つ AsyncNotionEngine）
+
+    target（database_id など）を渡すと、既定のデータベースの代わりにその保存先に送る。
+    """
+    if engine == 'async':
+        # 専用のイベントループで複数のリクエストを並行して送信する
+        from async_notion_api import AsyncNotionEngine
+        return AsyncNotionEngine(concurrency=concurrency, **target)
+    return NotionAPI(**target)
+
+
+def now_title():
+    """キャプチャ時刻が渡されなかったときのタイトル（現在時刻）"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def page_result(response):
+    """作成したページの結果 dict"""
+    return {
+        "success": True,
+        "page_id": response["id"],
+        "url": response["url"]
+    }
+
+
+def appended_result(entry, period):
+    """期間ページに追記したときの結果 dict（ローカルミラーでは追記として扱う）"""
+    return {
+        "success": True,
+        "page_id": entry["page_id"],
+        "url": entry.get("url"),
+        "title": period,
+        "appended": True
+    }
+
+
+def error_result(error):
+    """失敗したときの結果 dict"""
+    return {
+        "success": False,
+        "error": str(error),
+        "retryable": is_retryable_error(error)
+    }
+
+
+def is_schema_error(error):
+    """データベースのプロパティ構造が合わないことによるエラーかどうか"""
+    return (
+        isinstance(error, APIResponseError)
+        and error.code == "validation_error"
+        and "property" in str(error).lower()
+    )
+
+
+def is_missing_page_error(error):
+    """追記先のページが削除・アーカイブされていることによるエラーかどうか"""
+    if not isinstance(error, APIResponseError):
+        return False
+    if error.code == "object_not_found":
+        return True
+    return error.code == "validation_error" and "archived" in str(error).lower()
+
+
+def is_retryable_error(error):
+    """再送すれば成功する可能性のあるエラーかどうか"""
+    # リクエスト内容の不備（400, 413）は何度送っても失敗する
+    if isinstance(error, HTTPResponseError) and error.status in (400, 413):
+        return False
+    # 添付ファイルが消えていれば何度送っても失敗する
+    if isinstance(error, FileNotFoundError):
+        return False
+    return True
@@ -0,0 +1,208 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from capture_queue import CaptureItem
+
+# 送信箱のデータベースファイル
+OUTBOX_PATH = Path.home() / '.clip_to_notion' / 'outbox.db'
+
+# 送信済み・送信をあきらめたレコードを残しておく期間（重複排除用、秒）
+SENT_RETENTION = 7 * 24 * 60 * 60
+
+
+class Outbox:
+    """送信前のクリップを保存しておくSQLiteの送信箱
+
+    すべてのキャプチャは送信前にここへ書き込まれ、送信に成功した時点で
+    sent になる。クラッシュやオフライン中のクリップは pending のまま残り、
+    次回起動時や接続回復時に再送される。キーは内容とタイムスタンプから
+    作るため、同じクリップが二重に登録されることはない。
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else OUTBOX_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )"""
+        )
+        # 画像・ファイルのクリップ（添付ファイルの dict のリストを JSON で保存する）
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        if 'attachments' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN attachments TEXT")
+        # 振り分けルールの名前（再送するときも同じ保存先に送る）
+        if 'route' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN route TEXT")
+        self.prune()
+
+    def add_many(self, items):
+        """クリップをまとめて書き込む（1トランザクション = fsync 1回）
+
+        送信済みのキーと一致したクリップは重複として除外し、
+        送信すべきクリップのリストを返す。
+        """
+        to_send = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for item in items:
+                    row = self._conn.execute(
+                        "SELECT status FROM outbox WHERE key = ?", (item.key,)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute(
+                            "INSERT INTO outbox (key, title, content, created_at, attachments, route) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (item.key, item.title, item.content, time.time(),
+                             json.dumps(item.attachments, ensure_ascii=False) if item.attachments else None,
+                             item.route),
+                        )
+                    elif row[0] != 'pending':
+                        continue
+                    to_send.append(item)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return to_send
+
+    def add(self, item):
+        """クリップを1件書き込む"""
+        return bool(self.add_many([item]))
+
+    def mark_sent(self, key):
+        """送信済みにする"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'sent', content = '', last_error = NULL, "
+                "attempts = attempts + 1 WHERE key = ?",
+                (key,),
+            )
+
+    def discard(self, key):
+        """未送信のクリップを取り消す（キューに積めなかった場合）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE key = ? AND status = 'pending'", (key,))
+
+    def mark_failed(self, key, error, permanent=False):
+        """送信失敗を記録（permanent なら再送対象から外す）"""
+        status = 'failed' if permanent else 'pending'
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, last_error = ?, attempts = attempts + 1 "
+                "WHERE key = ?",
+                (status, error, key),
+            )
+
+    def pending(self, limit=None):
+        """未送信のクリップを古い順に取得"""
+        sql = (
+            "SELECT key, title, content, attachments, route FROM outbox "
+            "WHERE status = 'pending' ORDER BY created_at"
+        )
+        params = ()
+        if limit:
+            sql += " LIMIT ?"
+            params = (limit,)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            CaptureItem(
+                content, title, key=key,
+                attachments=json.loads(attachments) if attachments else None, route=route
+            )
+            for key, title, content, attachments, route in rows
+        ]
+
+    def count_pending(self):
+        """未送信の件数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def prune(self, retention=SENT_RETENTION):
+        """古い送信済み・送信をあきらめた（failed）レコードを削除"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND created_at < ?",
+                (time.time() - retention,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxReplayer:
+    """送信箱に残ったクリップを再送するスレッド
+
+    起動時に未送信分をすべてキューに戻し、その後は一定間隔で接続を確認して、
+    接続が回復していれば再送する。接続できない間は間隔を延ばしていく。
+    """
+
+    def __init__(self, outbox, capture_queue, probe, interval=30, max_interval=600):
+        self.outbox = outbox
+        self.capture_queue = capture_queue
+        self.probe = probe
+        self.interval = interval
+        self.max_interval = max_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """再送スレッドを起動（起動直後に1回再送する）"""
+        self._thread = threading.Thread(
+            target=self._run, name="OutboxReplayer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def replay_now(self):
+        """未送信のクリップをキューに戻す（キューに積まれている分は除く）"""
+        count = 0
+        for item in self.outbox.pending():
+            if self.capture_queue.resubmit(item):
+                count += 1
+        if count:
+            print(f"未送信のクリップを再送します: {count}件")
+        return count
+
+    def _run(self):
+        self.replay_now()
+
+        delay = self.interval
+        while not self._stop.wait(delay):
+            if not self.outbox.count_pending() or self.capture_queue.depth():
+                delay = self.interval
+                continue
+
+            try:
+                online = self.probe()
+            except Exception:
+                online = False
+
+            if online:
+                self.replay_now()
+                delay = self.interval
+            else:
+                delay = min(delay * 2, self.max_interval)
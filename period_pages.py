@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# 期間ページのIDのキャッシュファイル
+PERIOD_PAGES_PATH = Path.home() / '.clip_to_notion' / 'period_pages.json'
+
+# 保存の方式（STORAGE_MODE で変更）
+#   page:   クリップごとにデータベースの行（ページ）を作る
+#   daily:  1日1ページに追記する
+#   hourly: 1時間1ページに追記する
+STORAGE_MODES = ('page', 'daily', 'hourly')
+
+# 期間ページのタイトルの書式
+PERIOD_FORMATS = {
+    'daily': "%Y-%m-%d",
+    'hourly': "%Y-%m-%d %H:00",
+}
+
+# キャプチャ時刻（クリップのタイトル）の書式
+CAPTURE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# データベースごとに覚えておく期間の数
+MAX_PERIODS = 48
+
+
+def load_storage_mode():
+    """環境変数から保存の方式を読み込み"""
+    mode = os.environ.get('STORAGE_MODE', 'page').strip().lower()
+    if mode not in STORAGE_MODES:
+        print(f"⚠️  不明な STORAGE_MODE です: {mode}（page として扱います）")
+        mode = 'page'
+    return mode
+
+
+def period_title(mode, capture_title=None):
+    """クリップが入る期間ページのタイトル
+
+    キャプチャ時刻で決めるので、日付の変わる直前にコピーして送信が翌日になっても前日のページに入る。
+    """
+    try:
+        captured_at = datetime.strptime(capture_title, CAPTURE_TIME_FORMAT)
+    except (TypeError, ValueError):
+        captured_at = datetime.now()
+    return captured_at.strftime(PERIOD_FORMATS[mode])
+
+
+def group_by_period(mode, clips):
+    """(タイトル, 本文) のリストを期間ごとに分ける（期間・クリップとも元の順）"""
+    groups = {}
+    for clip in clips:
+        groups.setdefault(period_title(mode, clip[0]), []).append(clip)
+    return list(groups.items())
+
+
+class PeriodPageCache:
+    """期間（日・時間）→ 追記先のページ の対応をディスクにキャッシュする
+
+    追記のたびにページを探す問い合わせをしなくて済むようにするためのもので、
+    ページが削除・アーカイブされていたら invalidate して作り直す。
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else PERIOD_PAGES_PATH
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def get(self, database_id, period):
+        """{"page_id", "url"} またはキャッシュになければ None"""
+        with self._lock:
+            entry = self._load().get(database_id, {}).get(period)
+        return dict(entry) if entry else None
+
+    def put(self, database_id, period, page_id, url=None):
+        with self._lock:
+            periods = self._load().setdefault(database_id, {})
+            periods[period] = {"page_id": page_id, "url": url}
+            # 古い期間から捨てる（期間のタイトルは日時順に並ぶ）
+            for old in sorted(periods)[:-MAX_PERIODS]:
+                del periods[old]
+            self._save()
+
+    def invalidate(self, database_id, period):
+        with self._lock:
+            periods = self._load().get(database_id, {})
+            if periods.pop(period, None) is not None:
+                self._save()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_name(self.path.name + '.tmp')
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"⚠️  期間ページのキャッシュを保存できませんでした: {e}")
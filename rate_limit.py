@@ -0,0 +1,215 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from notion_client import AsyncClient, Client
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+# Notion API の平均レート上限（インテグレーションあたり約3リクエスト/秒）
+DEFAULT_RATE = 3.0
+
+# どのメソッドでも再送してよいステータス（サーバーがリクエストを処理していない）
+SAFE_RETRY_STATUSES = (429, 503)
+# 読み取り系のリクエストのみ再送するステータス
+IDEMPOTENT_RETRY_STATUSES = (500, 502, 504)
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（スレッドセーフ）"""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """トークンを1つ予約し、使えるようになるまでの待ち時間（秒）を返す"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            # 429 を受けた後は全リクエストを止める
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        """指定秒数のあいだトークンを払い出さない"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+
+class _Throttling:
+    """ThrottledClient / ThrottledAsyncClient に共通のレート制限と再送の判断"""
+
+    def __init__(self, *args, rate=DEFAULT_RATE, burst=None, bucket=None, max_retries=5,
+                 backoff_base=0.5, backoff_max=30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 同じインテグレーションのクライアントどうしでは bucket を共有する（transport.rate_bucket）
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+        self.retry_wait = 0.0
+
+    def _reserve(self):
+        """送信前に待つべき時間（秒）"""
+        wait = self.bucket.reserve()
+        with self._stats_lock:
+            self.requests += 1
+            if wait > 0:
+                self.throttled += 1
+                self.throttle_wait += wait
+        return wait
+
+    def _retry_delay(self, error, attempt, idempotent):
+        """再送するなら待ち時間（秒）を、再送しないなら None を返す"""
+        if attempt >= self.max_retries:
+            return None
+
+        if isinstance(error, HTTPResponseError):
+            if not self._should_retry(error.status, idempotent):
+                return None
+            delay = self._backoff(attempt)
+            if error.status == 429:
+                retry_after = parse_retry_after(error.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = retry_after
+                self.bucket.pause(delay)
+                with self._stats_lock:
+                    self.rate_limited += 1
+        elif isinstance(error, httpx.ConnectError):
+            # 接続できていない = サーバーには届いていない
+            delay = self._backoff(attempt)
+        elif isinstance(error, (RequestTimeoutError, httpx.TransportError)) and idempotent:
+            delay = self._backoff(attempt)
+        else:
+            return None
+
+        with self._stats_lock:
+            self.retries += 1
+            self.retry_wait += delay
+        return delay
+
+    def _should_retry(self, status, idempotent):
+        if status in SAFE_RETRY_STATUSES:
+            return True
+        return idempotent and status in IDEMPOTENT_RETRY_STATUSES
+
+    def _backoff(self, attempt):
+        """指数バックオフ（半分を固定、半分をランダムにして集中を避ける）"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def stats(self):
+        """レート制限・再送の統計情報を取得"""
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "throttle_wait": self.throttle_wait,
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "retry_wait": self.retry_wait,
+            }
+
+
+def _is_idempotent(path, method):
+    return method.upper() == "GET" or path.rstrip("/").endswith("/query")
+
+
+class ThrottledClient(_Throttling, Client):
+    """レート制限と再送を組み込んだ notion_client.Client
+
+    すべてのエンドポイントは Client.request を通るため、ここでトークンバケットによる
+    流量制御、429 の Retry-After への追従、指数バックオフ（ジッター付き）での
+    再送をまとめて行う。書き込み系のリクエストは、サーバーが処理していないことが
+    明らかな場合（429・503・接続失敗）だけ再送する。
+    """
+
+    def __init__(self, *args, sleep=time.sleep, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sleep = sleep
+
+    def request(self, path, method, *args, **kwargs):
+        idempotent = _is_idempotent(path, method)
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait > 0:
+                self._sleep(wait)
+
+            try:
+                return super().request(path, method, *args, **kwargs)
+            except (HTTPResponseError, RequestTimeoutError, httpx.TransportError) as e:
+                delay = self._retry_delay(e, attempt, idempotent)
+                if delay is None:
+                    raise
+
+            attempt += 1
+            self._sleep(delay)
+
+
+class ThrottledAsyncClient(_Throttling, AsyncClient):
+    """ThrottledClient の非同期版（notion_client.AsyncClient）
+
+    待ち時間は asyncio.sleep で待つので、イベントループ上の他のリクエストは止めない。
+    """
+
+    async def request(self, path, method, *args, **kwargs):
+        idempotent = _is_idempotent(path, method)
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                return await super().request(path, method, *args, **kwargs)
+            except (HTTPResponseError, RequestTimeoutError, httpx.TransportError) as e:
+                delay = self._retry_delay(e, attempt, idempotent)
+                if delay is None:
+                    raise
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+def parse_retry_after(value):
+    """Retry-After ヘッダー（秒数）を解釈"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def load_rate_limit():
+    """環境変数から1秒あたりのリクエスト数の上限を読み込み（0以下・数値でなければ既定値）"""
+    value = os.environ.get('NOTION_RATE_LIMIT', DEFAULT_RATE)
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = 0.0
+    if rate > 0:
+        return rate
+    print(f"⚠️  NOTION_RATE_LIMIT が正しくありません: {value}（{DEFAULT_RATE:g} として扱います）")
+    return DEFAULT_RATE
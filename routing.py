@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from blocks import detect_kind
+from metrics import metrics
+
+# 振り分けルールのファイル（ROUTING_FILE で変更）
+ROUTING_FILE_PATH = Path.home() / '.clip_to_notion' / 'routes.json'
+
+# ルールの判定に使う先頭部分の文字数（大きなクリップでも判定にかかる時間が変わらないように）
+DEFAULT_SCAN_CHARS = 2048
+
+# type に指定できるクリップの種類（blocks.detect_kind の判定結果）
+CONTENT_TYPES = ('text', 'url', 'code', 'markdown')
+
+
+def load_routing_config():
+    """環境変数から振り分けの設定を読み込み"""
+    return {
+        "path": Path(os.environ.get('ROUTING_FILE') or ROUTING_FILE_PATH).expanduser(),
+        "scan_chars": max(1, int(os.environ.get('ROUTING_SCAN_CHARS', DEFAULT_SCAN_CHARS))),
+    }
+
+
+class Route:
+    """振り分けルール1件（条件と保存先）
+
+    条件（pattern / types / min_length / max_length / apps）はすべて満たしたときに一致とし、
+    指定のない条件は判定しない。保存先の database_id を省略すると既定のデータベースに送る。
+    pattern は読み込み時にコンパイルしておく。
+    """
+
+    __slots__ = (
+        'name', 'database_id', 'memo_property', 'properties',
+        'pattern', 'types', 'min_length', 'max_length', 'apps'
+    )
+
+    def __init__(self, name, database_id=None, memo_property=None, properties=None,
+                 pattern=None, types=(), min_length=0, max_length=None, apps=()):
+        self.name = name
+        self.database_id = database_id
+        self.memo_property = memo_property
+        # ページに一緒に設定するプロパティ（Notion API の形式のまま、例: セレクトのタグ）
+        self.properties = properties or {}
+        self.pattern = pattern
+        self.types = tuple(types)
+        self.min_length = min_length
+        self.max_length = max_length
+        self.apps = tuple(app.lower() for app in apps)
+
+    @property
+    def target(self):
+        """保存先のキー（保存先が同じルールは NotionAPI を共有する）"""
+        return (self.database_id, self.memo_property, json.dumps(self.properties, sort_keys=True))
+
+    def matches(self, text, head, app, kind):
+        """条件を軽いものから順に判定（head は先頭部分、kind は種類が必要になったときに呼ぶ関数）"""
+        if len(text) < self.min_length:
+            return False
+        if self.max_length is not None and len(text) > self.max_length:
+            return False
+        if self.apps and (app or '').lower() not in self.apps:
+            return False
+        if self.pattern is not None and self.pattern.search(head) is None:
+            return False
+        if self.types and kind() not in self.types:
+            return False
+        return True
+
+
+def parse_route(index, raw):
+    """routes.json のルール1件を Route にする（不正な内容なら ValueError）"""
+    if not isinstance(raw, dict):
+        raise ValueError(f"{index + 1}番目のルールがオブジェクトではありません")
+    name = str(raw.get('name') or f"route{index + 1}")
+
+    pattern = raw.get('pattern')
+    if pattern is not None:
+        try:
+            pattern = re.compile(pattern, re.IGNORECASE if raw.get('ignore_case') else 0)
+        except re.error as e:
+            raise ValueError(f"ルール「{name}」: pattern が正しくありません（{e}）")
+
+    types = raw.get('type') or ()
+    if isinstance(types, str):
+        types = (types,)
+    for kind in types:
+        if kind not in CONTENT_TYPES:
+            raise ValueError(f"ルール「{name}」: 不明な type です: {kind}（{' / '.join(CONTENT_TYPES)}）")
+
+    apps = raw.get('app') or ()
+    if isinstance(apps, str):
+        apps = (apps,)
+
+    properties = raw.get('properties') or {}
+    if not isinstance(properties, dict):
+        raise ValueError(f"ルール「{name}」: properties がオブジェクトではありません")
+
+    max_length = raw.get('max_length')
+    return Route(
+        name,
+        database_id=raw.get('database_id') or None,
+        memo_property=raw.get('memo_property') or None,
+        properties=properties,
+        pattern=pattern,
+        types=types,
+        min_length=int(raw.get('min_length') or 0),
+        max_length=int(max_length) if max_length is not None else None,
+        apps=apps,
+    )
+
+
+class Router:
+    """クリップの内容から保存先のルールを決める（上から順に判定し、最初に一致したものを使う）
+
+    正規表現と種類（type）の判定はクリップの先頭 scan_chars 文字だけを見るので、数MBのクリップでも
+    判定時間は変わらない。種類の判定は重いので、ほかの条件を満たしたルールが type を
+    指定しているときだけ、1回のクリップにつき1回だけ行う。
+    """
+
+    def __init__(self, routes=(), scan_chars=DEFAULT_SCAN_CHARS, path=None, signature=None):
+        self.routes = list(routes)
+        self.scan_chars = scan_chars
+        self.path = path
+        self._signature = signature
+        # アプリの条件がなければ、ホットキーのたびに最前面のアプリを調べなくて済む
+        self.uses_app = any(route.apps for route in self.routes)
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.unmatched = 0
+        self.matched = {route.name: 0 for route in self.routes}
+
+    def route(self, text, app=None):
+        """最初に一致したルール（どれにも一致しなければ None = 既定の保存先）"""
+        if not self.routes:
+            return None
+        started = time.perf_counter()
+        head = text[:self.scan_chars]
+        kinds = []
+
+        def kind():
+            if not kinds:
+                kinds.append(detect_kind(head, self.scan_chars))
+            return kinds[0]
+
+        selected = None
+        for route in self.routes:
+            if route.matches(text, head, app, kind):
+                selected = route
+                break
+        metrics.observe("routing", time.perf_counter() - started)
+
+        with self._lock:
+            self.evaluated += 1
+            if selected is None:
+                self.unmatched += 1
+            else:
+                self.matched[selected.name] += 1
+        return selected
+
+    def changed(self):
+        """前回確認してからルールのファイルが変更されたか（stat のみ、変更ごとに1回だけ True）"""
+        if self.path is None:
+            return False
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def stats(self):
+        """振り分けの統計情報（metrics に登録する）"""
+        with self._lock:
+            return {
+                "routes": len(self.routes),
+                "evaluated": self.evaluated,
+                "unmatched": self.unmatched,
+                "matched": sum(self.matched.values()),
+            }
+
+    def __len__(self):
+        return len(self.routes)
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def load_router():
+    """routes.json から Router を作成（ファイルがなければルールなし、不正なら警告してルールなし）
+
+    routes.json の形式:
+        {"routes": [
+            {"name": "コード", "type": "code", "database_id": "...", "memo_property": "本文"},
+            {"name": "URL", "pattern": "^https?://", "database_id": "..."}
+        ]}
+    """
+    config = load_routing_config()
+    path = config['path']
+    signature = file_signature(path)
+    if signature is None:
+        return Router(scan_chars=config['scan_chars'], path=path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        raw_routes = data.get('routes') if isinstance(data, dict) else data
+        if not isinstance(raw_routes, list):
+            raise ValueError("routes がリストではありません")
+        routes = [parse_route(index, raw) for index, raw in enumerate(raw_routes)]
+        names = [route.name for route in routes]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ValueError(f"ルール名が重複しています: {', '.join(duplicated)}")
+        return Router(routes, config['scan_chars'], path, signature)
+    except (OSError, ValueError) as e:
+        print(f"✗ 振り分けルールを読み込めませんでした（すべて既定の保存先に送ります）: {e}")
+        return Router(scan_chars=config['scan_chars'], path=path, signature=signature)
+
+
+def frontmost_app():
+    """最前面のアプリの名前（macOS 以外・取得できなければ None）"""
+    try:
+        from AppKit import NSWorkspace
+    except ImportError:
+        return None
+    application = NSWorkspace.sharedWorkspace().frontmostApplication()
+    return str(application.localizedName()) if application is not None else None
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# データベース構造のキャッシュファイル
+SCHEMA_CACHE_PATH = Path.home() / '.clip_to_notion' / 'schema_cache.json'
+
+# キャッシュの有効期限（秒）
+DEFAULT_TTL = 24 * 60 * 60
+
+# 「メモ」として使うプロパティ名
+MEMO_PROPERTY_NAME = "メモ"
+
+
+def schema_from_database(database, memo_property_name=MEMO_PROPERTY_NAME):
+    """databases.retrieve の結果から保存に必要な構造を取り出す"""
+    properties = database.get("properties", {})
+
+    title_property = None
+    for prop_name, prop_info in properties.items():
+        if prop_info.get("type") == "title":
+            title_property = prop_name
+            break
+
+    memo_info = properties.get(memo_property_name) or {}
+    title = database.get("title") or [{}]
+
+    return {
+        "title_property": title_property,
+        "memo_property": memo_property_name if memo_info else None,
+        "memo_type": memo_info.get("type"),
+        "database_name": title[0].get("plain_text", "Unknown"),
+        # データベースの更新時刻を ETag 代わりに使う
+        "version": database.get("last_edited_time"),
+    }
+
+
+class SchemaCache:
+    """データベースIDごとのプロパティ構造をディスクにキャッシュする
+
+    起動のたびに databases.retrieve しなくて済むようにするためのもので、
+    有効期限（TTL）を過ぎたもの、またはページ作成がプロパティの不一致で
+    失敗したとき（invalidate）は取り直す。
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = Path(path) if path else SCHEMA_CACHE_PATH
+        if ttl is None:
+            ttl = float(os.environ.get('SCHEMA_CACHE_TTL', DEFAULT_TTL))
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def get(self, database_id):
+        """有効なキャッシュがあれば返す"""
+        with self._lock:
+            entry = self._load().get(database_id)
+        if not entry:
+            return None
+        if time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        return entry["schema"]
+
+    def put(self, database_id, schema):
+        """構造を保存"""
+        with self._lock:
+            entries = self._load()
+            entries[database_id] = {"schema": schema, "fetched_at": time.time()}
+            self._save(entries)
+
+    def invalidate(self, database_id):
+        """キャッシュを破棄"""
+        with self._lock:
+            entries = self._load()
+            if entries.pop(database_id, None) is not None:
+                self._save(entries)
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self, entries):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"✗ スキーマキャッシュの保存に失敗しました: {e}")
@@ -2,8 +2,62 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import os
+import threading
+import time
 from pathlib import Path
-from notion_client import Client
+from transport import create_notion_client
+from config import EnvConfig, DEFAULT_HOTKEY, ENV_FILE_PATH
+from schema_cache import SchemaCache, schema_from_database
+
+# 接続テストを打ち切るまでの時間（秒）
+CONNECTION_TEST_TIMEOUT = 15
+
+# 接続テストの結果を確認する間隔（ミリ秒）
+POLL_INTERVAL_MS = 100
+
+# 接続テスト中に表示するスピナー
+SPINNER_FRAMES = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+
+
+class ConnectionTest:
+    """databases.retrieve をワーカースレッドで実行する接続テスト
+
+    Tk のメインスレッドは通信を待たず、root.after で done() を確認する。
+    中止・タイムアウトした場合、ワーカーの結果は捨てられる（スレッドは daemon なので終了を待たない）。
+    """
+
+    def __init__(self, api_key, database_id, timeout=CONNECTION_TEST_TIMEOUT):
+        self.api_key = api_key
+        self.database_id = database_id
+        self.deadline = time.monotonic() + timeout
+        self.database = None
+        self.error = None
+        self.cancelled = False
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ConnectionTest")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def done(self):
+        return self._done.is_set()
+
+    def timed_out(self):
+        return not self.done() and time.monotonic() > self.deadline
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _run(self):
+        try:
+            # 1回のリクエストもタイムアウトさせ、ネットワークが不調でもスレッドが残り続けないようにする
+            client = create_notion_client(self.api_key, timeout_ms=CONNECTION_TEST_TIMEOUT * 1000)
+            self.database = client.databases.retrieve(database_id=self.database_id)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
 
 
 class SetupGUI:
@@ -11,7 +65,7 @@ class SetupGUI:
         """
         env_file_path: .envファイルの保存先パス（Pathオブジェクト）
         """
-        self.env_file_path = env_file_path or Path.home() / '.clip_to_notion' / '.env'
+        self.env_file_path = env_file_path or ENV_FILE_PATH
         
         self.root = tk.Tk()
         self.root.title("Clip to Notion - 初期設定")
@@ -34,21 +88,14 @@ class SetupGUI:
         
     def load_current_settings(self):
         """既存の.envファイルから設定を読み込み"""
-        self.current_api_key = ''
-        self.current_database_id = ''
-        self.current_hotkey = '⌘⇧V'  # デフォルト値
-        
-        # .envファイルが存在する場合、そこから読み込む
-        if self.env_file_path.exists():
-            with open(self.env_file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('NOTION_API_KEY='):
-                        self.current_api_key = line.split('=', 1)[1].strip('"\'')
-                    elif line.startswith('NOTION_DATABASE_ID='):
-                        self.current_database_id = line.split('=', 1)[1].strip('"\'')
-                    elif line.startswith('HOTKEY='):
-                        self.current_hotkey = line.split('=', 1)[1].strip('"\'')
+        self.env_config = EnvConfig(self.env_file_path)
+        self.current_api_key = self.env_config.get('NOTION_API_KEY', '')
+        self.current_database_id = self.env_config.get('NOTION_DATABASE_ID', '')
+        self.current_hotkey = self.env_config.get('HOTKEY', DEFAULT_HOTKEY)
+        # 実行中の接続テストと、成功したテストの (API Key, Database ID, 構造)
+        self.connection_test = None
+        self.verified = None
+        self.spinner_index = 0
     
     def create_widgets(self):
         # メインフレーム
@@ -165,7 +212,9 @@ class SetupGUI:
         self.status_label.grid(row=12, column=0, columnspan=2, pady=(20, 0))
         
     def test_connection(self):
-        """Notion接続をテスト"""
+        """Notion接続をテスト（ワーカースレッドで実行し、root.after で結果を待つ）"""
+        if self.connection_test is not None:
+            return
         api_key = self.api_key_entry.get().strip()
         db_id = self.db_id_entry.get().strip()
         
@@ -178,38 +227,79 @@ class SetupGUI:
             messagebox.showerror("エラー", "Database IDを入力してください")
             return
         
-        # 接続テスト
-        self.status_label.config(text="接続テスト中...", foreground="blue")
-        self.root.update()
+        # 接続テスト（テスト中は「中止」ボタンになる）
+        self.verified = None
+        self.save_button.config(state=tk.DISABLED)
+        self.test_button.config(text="中止", command=self.cancel_test)
+        self.connection_test = ConnectionTest(api_key, db_id).start()
+        self.spinner_index = 0
+        self.root.after(POLL_INTERVAL_MS, self._poll_connection_test)
+    
+    def cancel_test(self):
+        """実行中の接続テストを中止"""
+        if self.connection_test is None:
+            return
+        self.connection_test.cancel()
+        self._finish_test()
+        self.status_label.config(text="接続テストを中止しました", foreground="gray")
+    
+    def _poll_connection_test(self):
+        """接続テストの結果を確認（終わっていなければスピナーを進めて待ち直す）"""
+        test = self.connection_test
+        if test is None or test.cancelled:
+            return
         
-        try:
-            client = Client(auth=api_key)
-            database = client.databases.retrieve(database_id=db_id)
-            db_name = database.get("title", [{}])[0].get("plain_text", "Unknown")
-            
-            # 成功メッセージ
-            self.status_label.config(
-                text=f"✓ 接続成功: {db_name}",
-                foreground="green"
-            )
-            
-            # 保存ボタンを有効化
-            self.save_button.config(state=tk.NORMAL)
-            
-            messagebox.showinfo(
-                "接続成功",
-                f"Notionへの接続に成功しました！\n\nデータベース名: {db_name}\n\n「保存して起動」ボタンで設定を保存してアプリを起動できます。"
+        if test.timed_out():
+            test.cancel()
+            self._finish_test()
+            self.status_label.config(text="✗ 接続失敗（タイムアウト）", foreground="red")
+            messagebox.showerror(
+                "接続エラー",
+                f"{CONNECTION_TEST_TIMEOUT}秒以内にNotionから応答がありませんでした。\n\nネットワーク接続を確認してください。"
             )
-            
-        except Exception as e:
+            return
+        
+        if not test.done():
+            frame = SPINNER_FRAMES[self.spinner_index % len(SPINNER_FRAMES)]
+            self.spinner_index += 1
+            self.status_label.config(text=f"{frame} 接続テスト中...", foreground="blue")
+            self.root.after(POLL_INTERVAL_MS, self._poll_connection_test)
+            return
+        
+        self._finish_test()
+        if test.error is not None:
             self.status_label.config(
                 text="✗ 接続失敗",
                 foreground="red"
             )
             messagebox.showerror(
                 "接続エラー",
-                f"Notionへの接続に失敗しました。\n\n{str(e)}\n\n設定を確認してください。"
+                f"Notionへの接続に失敗しました。\n\n{str(test.error)}\n\n設定を確認してください。"
             )
+            return
+        
+        schema = schema_from_database(test.database)
+        self.verified = (test.api_key, test.database_id, schema)
+        db_name = schema["database_name"]
+        
+        # 成功メッセージ
+        self.status_label.config(
+            text=f"✓ 接続成功: {db_name}",
+            foreground="green"
+        )
+        
+        # 保存ボタンを有効化
+        self.save_button.config(state=tk.NORMAL)
+        
+        messagebox.showinfo(
+            "接続成功",
+            f"Notionへの接続に成功しました！\n\nデータベース名: {db_name}\n\n「保存して起動」ボタンで設定を保存してアプリを起動できます。"
+        )
+    
+    def _finish_test(self):
+        """接続テストの表示を元に戻す"""
+        self.connection_test = None
+        self.test_button.config(text="接続テスト", command=self.test_connection)
     
     def save_and_exit(self):
         """設定を保存して終了"""
@@ -217,22 +307,21 @@ class SetupGUI:
         db_id = self.db_id_entry.get().strip()
         hotkey = self.hotkey_var.get()
         
-        # .envファイルに保存
-        env_content = f"""NOTION_API_KEY={api_key}
-NOTION_DATABASE_ID={db_id}
-HOTKEY={hotkey}
-"""
-        
+        # .envファイルに保存（ほかの項目は残す）
         try:
-            # ディレクトリが存在しない場合は作成
-            self.env_file_path.parent.mkdir(parents=True, exist_ok=True)
+            self.env_config.save({
+                "NOTION_API_KEY": api_key,
+                "NOTION_DATABASE_ID": db_id,
+                "HOTKEY": hotkey,
+            })
             
-            with open(self.env_file_path, 'w', encoding='utf-8') as f:
-                f.write(env_content)
+            # 接続テストで確認した構造をキャッシュし、アプリの初回保存で取り直さずに済むようにする
+            if self.verified and self.verified[:2] == (api_key, db_id):
+                SchemaCache(Path(self.env_file_path).parent / 'schema_cache.json').put(db_id, self.verified[2])
             
             messagebox.showinfo(
                 "保存完了",
-                f"設定を保存しました！\n\n保存先: {self.env_file_path}\n\nメインアプリを再起動してください。"
+                f"設定を保存しました！\n\n保存先: {self.env_file_path}\n\n起動中のメインアプリには自動で反映されます。"
             )
             
             self.root.destroy()
@@ -245,6 +334,8 @@ HOTKEY={hotkey}
     
     def on_closing(self):
         """ウィンドウが閉じられた時の処理"""
+        if self.connection_test is not None:
+            self.connection_test.cancel()
         self.root.destroy()
 
 
@@ -5,13 +5,14 @@
 import sys
 from pathlib import Path
 from setup_gui import SetupGUI
+from config import ENV_FILE_PATH
 
 if __name__ == "__main__":
     # コマンドライン引数から .env ファイルのパスを取得
     if len(sys.argv) > 1:
         env_path = Path(sys.argv[1])
     else:
-        env_path = Path.home() / '.clip_to_notion' / '.env'
+        env_path = ENV_FILE_PATH
     
     app = SetupGUI(env_path)
     app.root.mainloop()
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+from capture_queue import CaptureItem
+
+# 終了時に送信中・送信待ちのクリップを送り終えるまで待つ最大時間（秒）
+DEFAULT_SHUTDOWN_DEADLINE = 10.0
+
+
+def load_shutdown_config():
+    """環境変数から終了処理の設定を読み込み"""
+    return {
+        "deadline": max(0.0, float(os.environ.get('SHUTDOWN_DEADLINE', DEFAULT_SHUTDOWN_DEADLINE))),
+    }
+
+
+class ShutdownCoordinator:
+    """終了時に、新しいクリップの受け付けを止めて送信待ちの分を期限まで送る
+
+    キューに積んだクリップは積む時点で送信箱（outbox.py）に書き込まれているので、期限までに
+    送れなかった分（キューで待っている分・送信中の分）は pending のまま残り、次回起動時に再送される。
+    終了処理中に届いたクリップはキューに積まずに送信箱に書き込む。deadline が None なら送り終えるまで待つ。
+    """
+
+    def __init__(self, capture_queue, outbox=None, deadline=DEFAULT_SHUTDOWN_DEADLINE):
+        self.capture_queue = capture_queue
+        self.outbox = outbox
+        self.deadline = deadline
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self._started_at = None
+        # 終了処理中に届き、送信箱に書き込んだクリップの数
+        self.deferred_captures = 0
+
+    @property
+    def accepting(self):
+        """新しいクリップを送信キューに積んでよいか（終了処理を始めたら False）"""
+        return not self._closing.is_set()
+
+    def begin(self):
+        """受け付けを止める（期限はここから数える）"""
+        with self._lock:
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+                self._closing.set()
+
+    def remaining(self):
+        """期限までの残り時間（秒、期限なしなら None）"""
+        if self.deadline is None:
+            return None
+        self.begin()
+        return max(0.0, self._started_at + self.deadline - time.monotonic())
+
+    def defer(self, content, title=None, attachments=None, route=None):
+        """終了処理中に届いたクリップを、送信せずに送信箱に書き込む"""
+        item = CaptureItem(content, title, attachments=attachments, route=route)
+        if self.spool([item]):
+            with self._lock:
+                self.deferred_captures += 1
+            print(f"終了処理中のため、次回起動時に送信します: {item.title} ({len(content)}文字)")
+        return item
+
+    def spool(self, items):
+        """クリップを送信箱に pending で書き込む（書き込めた件数）"""
+        if not items:
+            return 0
+        if self.outbox is None:
+            print(f"✗ 送信箱がないため、送信できなかったクリップを残せません: {len(items)}件")
+            return 0
+        try:
+            self.outbox.add_many(items)
+        except Exception as e:
+            print(f"✗ 送信箱への書き込みエラー: {e}")
+            return 0
+        return len(items)
+
+    def drain(self):
+        """期限まで送信キューの残りを送り、送れなかった分を送信箱に残して結果を返す"""
+        self.begin()
+        before = self.capture_queue.stats()
+        finished = self.capture_queue.stop(timeout=self.remaining())
+        if not finished:
+            # 送信中の呼び出しはそのままにして、まだ始めていない分の送信を打ち切る
+            # （送信箱には積んだ時点で書き込み済み。書き込みに失敗していた分はここで書き直す）
+            self.spool(self.capture_queue.abandon())
+        after = self.capture_queue.stats()
+
+        sent = (after["processed"] - after["failed"]) - (before["processed"] - before["failed"])
+        with self._lock:
+            deferred_captures = self.deferred_captures
+        report = {
+            "flushed": sent,
+            "failed": after["failed"] - before["failed"],
+            # この終了処理で送らずに残した分（打ち切った分・送信中の分・終了処理中に届いた分）
+            "deferred": self.capture_queue.outstanding() + deferred_captures,
+            "finished": finished,
+            "elapsed": time.monotonic() - self._started_at,
+        }
+        if not finished:
+            print(f"⚠️  {self.deadline:g}秒以内に送信が終わりませんでした（送信中の分は次回起動時に再送します）")
+        failed = f" / 失敗: {report['failed']}件" if report['failed'] else ""
+        print(
+            f"終了前に送信: {report['flushed']}件{failed} / 次回起動時に送信: {report['deferred']}件 "
+            f"({report['elapsed']:.1f}秒)"
+        )
+        return report
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（notion_api.py など）を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_notion import FakeNotionServer  # noqa: E402
+
+
+@pytest.fixture
+def fake_notion():
+    """Notion API のローカル代替サーバー（bench/fake_notion.py）"""
+    server = FakeNotionServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def notion_env(fake_notion, monkeypatch):
+    """NotionAPI を fake_notion に向ける環境変数"""
+    monkeypatch.setenv("NOTION_API_KEY", "secret_test")
+    monkeypatch.setenv("NOTION_DATABASE_ID", "test-db")
+    monkeypatch.setenv("NOTION_BASE_URL", fake_notion.base_url)
+    monkeypatch.setenv("NOTION_RATE_LIMIT", "1000")
+    return fake_notion
+
+
+@pytest.fixture
+def app_home(tmp_path, monkeypatch):
+    """送信箱・ミラーなどの保存先（~/.clip_to_notion）を tmp_path に向ける"""
+    import mirror
+    import outbox
+    import period_pages
+    import schema_cache
+    monkeypatch.setattr(outbox, "OUTBOX_PATH", tmp_path / "outbox.db")
+    monkeypatch.setattr(mirror, "MIRROR_PATH", tmp_path / "mirror.db")
+    monkeypatch.setattr(period_pages, "PERIOD_PAGES_PATH", tmp_path / "period_pages.json")
+    monkeypatch.setattr(schema_cache, "SCHEMA_CACHE_PATH", tmp_path / "schema_cache.json")
+    return tmp_path
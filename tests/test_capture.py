@@ -0,0 +1,156 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from attachments import AttachmentProcessor, discard_attachments
+from capture_queue import CaptureQueue
+from clipboard import create_clipboard
+from notion_api import NotionAPI
+from outbox import Outbox, OutboxReplayer
+from rate_limit import ThrottledClient
+from schema_cache import SchemaCache
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+@pytest.fixture
+def notion_api(notion_env, tmp_path, monkeypatch):
+    monkeypatch.delenv("STORAGE_MODE", raising=False)
+    monkeypatch.delenv("CLIP_FORMAT", raising=False)
+    client = ThrottledClient(
+        {"auth": "secret_test", "base_url": notion_env.base_url},
+        sleep=lambda seconds: None, max_retries=1
+    )
+    return NotionAPI(SchemaCache(tmp_path / "schema_cache.json"), client=client)
+
+
+@pytest.fixture
+def capture(notion_api, tmp_path):
+    """メモリ上のクリップボードから Notion までの取り込み（main.py の save_selection と同じ流れ）"""
+    outbox = Outbox(tmp_path / "outbox.db")
+
+    def send(item):
+        result = notion_api.create_page(item.title, item.content, item.attachments)
+        if result["success"] or not result.get("retryable", True):
+            discard_attachments(item.attachments)
+        return result
+
+    capture_queue = CaptureQueue(send, outbox=outbox)
+    capture_queue.start()
+    processor = AttachmentProcessor(
+        lambda text, title=None, attachments=None: capture_queue.submit(text, title=title, attachments=attachments),
+        directory=tmp_path / "attachments"
+    )
+    clipboard = create_clipboard('memory')
+
+    def copy_and_save(text="", **rich):
+        clipboard.set(text, **rich)
+        item = processor.submit(clipboard.read_rich(), clipboard.read_text(), "2026-01-01 10:00:00").result()
+        wait_until_sent(capture_queue)
+        return item
+
+    copy_and_save.outbox = outbox
+    copy_and_save.capture_queue = capture_queue
+    yield copy_and_save
+    processor.close()
+    capture_queue.stop(timeout=5)
+    outbox.close()
+
+
+def wait_until_sent(capture_queue, timeout=10):
+    deadline = time.monotonic() + timeout
+    while capture_queue.outstanding():
+        assert time.monotonic() < deadline, "送信が終わりません"
+        time.sleep(0.01)
+
+
+def block_types(page):
+    return [block["type"] for block in page["children"]]
+
+
+def memo(page):
+    return "".join(part["text"]["content"] for part in page["properties"]["メモ"]["rich_text"])
+
+
+def uploaded(fake_notion, block):
+    kind = block["type"]
+    return fake_notion.file_uploads[block[kind]["file_upload"]["id"]]
+
+
+def test_text_only_copy_has_no_rich_contents():
+    clipboard = create_clipboard('memory')
+    clipboard.write_text("plain text")
+    assert not clipboard.read_rich()
+
+
+def test_image_is_uploaded_and_spool_removed(notion_env, capture, tmp_path):
+    item = capture(images=[(PNG, 'image/png')])
+
+    (page,) = notion_env.pages
+    assert block_types(page) == ["image"]
+    upload = uploaded(notion_env, page["children"][0])
+    assert upload["status"] == "uploaded"
+    assert upload["content_type"] == "image/png"
+    assert upload["content_length"] == len(PNG)
+    assert upload["sha256"].digest() == hashlib.sha256(PNG).digest()
+    # 送信に成功したら書き出した画像は消す
+    assert not os.path.exists(item.attachments[0]["path"])
+
+
+def test_html_is_saved_as_blocks(notion_env, capture):
+    capture(
+        "Heading\nbold text\none",
+        html="<h1>Heading</h1><p><b>bold</b> text</p><ul><li>one</li></ul>",
+    )
+
+    (page,) = notion_env.pages
+    assert block_types(page) == ["heading_1", "paragraph", "bulleted_list_item"]
+    rich_text = page["children"][1]["paragraph"]["rich_text"]
+    assert rich_text[0]["text"]["content"] == "bold"
+    assert rich_text[0]["annotations"]["bold"]
+
+
+def test_html_is_kept_as_text_in_plain_format(notion_env, capture, monkeypatch):
+    monkeypatch.setenv("CLIP_FORMAT", "plain")
+    capture("copied text", html="<h1>Heading</h1>")
+
+    (page,) = notion_env.pages
+    assert block_types(page) == []
+    assert memo(page) == "copied text"
+
+
+def test_file_is_uploaded_and_kept(notion_env, capture, tmp_path):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(b"%PDF-1.4\n" + b"0" * 4096)
+
+    capture(files=[str(path)])
+
+    (page,) = notion_env.pages
+    assert block_types(page) == ["file"]
+    block = page["children"][0]
+    assert block["file"]["name"] == "report.pdf"
+    assert uploaded(notion_env, block)["content_length"] == path.stat().st_size
+    # コピーしたファイルそのものは消さない
+    assert path.exists()
+
+
+def test_image_is_replayed_from_outbox(notion_env, capture):
+    notion_env.set_offline()
+    item = capture("caption", images=[(PNG, 'image/png')])
+
+    assert notion_env.pages == []
+    (pending,) = capture.outbox.pending()
+    assert pending.attachments == item.attachments
+    # 送れなかった間は書き出した画像を残しておく
+    assert os.path.exists(item.attachments[0]["path"])
+
+    notion_env.set_offline(False)
+    OutboxReplayer(capture.outbox, capture.capture_queue, probe=lambda: True).replay_now()
+    wait_until_sent(capture.capture_queue)
+
+    (page,) = notion_env.pages
+    assert memo(page) == "caption"
+    assert block_types(page) == ["image"]
+    assert not os.path.exists(item.attachments[0]["path"])
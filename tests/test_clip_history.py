@@ -0,0 +1,45 @@
+import time
+
+from clip_history import READ_WATCH_INTERVAL, ClipHistory, ClipboardWatcher, parse_selection
+from clipboard import create_clipboard
+
+
+def test_parse_selection():
+    assert parse_selection("1 3 5-7", 10) == [0, 2, 4, 5, 6]
+    # 逆順の範囲・重複・範囲外・数値でない指定
+    assert parse_selection("3, 1 5-2 9 x 0", 5) == [2, 0, 1, 3, 4]
+    assert parse_selection("7-9", 5) == []
+
+
+def test_parse_selection_clamps_huge_range():
+    started = time.perf_counter()
+    assert parse_selection("1-999999999", 3) == [0, 1, 2]
+    assert time.perf_counter() - started < 0.1
+
+
+def test_watcher_without_change_count_polls_slowly():
+    history = ClipHistory()
+    clipboard = create_clipboard('memory')
+
+    watcher = ClipboardWatcher(history, clipboard.read_text, interval=0.5)
+    assert watcher.interval == READ_WATCH_INTERVAL
+
+    watcher = ClipboardWatcher(history, clipboard.read_text, change_count=clipboard.change_count, interval=0.5)
+    assert watcher.interval == 0.5
+    history.close()
+
+
+def test_watcher_reads_only_on_change():
+    history = ClipHistory()
+    clipboard = create_clipboard('memory')
+    watcher = ClipboardWatcher(history, clipboard.read_text, change_count=clipboard.change_count)
+
+    watcher.start()
+    watcher.stop()
+    assert not watcher.poll()
+    clipboard.write_text("copied")
+    assert watcher.poll()
+    assert not watcher.poll()
+    assert watcher.reads == 1
+    assert len(history) == 1
+    history.close()
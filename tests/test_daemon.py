@@ -0,0 +1,47 @@
+import io
+import time
+
+import pytest
+
+from daemon import ClipDaemon, encode_clip
+
+
+@pytest.fixture
+def clip_daemon(notion_env, app_home, monkeypatch):
+    for name in ("STORAGE_MODE", "BATCH_MODE", "METRICS_PORT"):
+        monkeypatch.delenv(name, raising=False)
+    clip_daemon = ClipDaemon()
+    clip_daemon.start()
+    yield clip_daemon
+    clip_daemon.stop(timeout=None)
+
+
+def wait_until_sent(capture_queue, timeout=10):
+    deadline = time.monotonic() + timeout
+    while capture_queue.outstanding():
+        assert time.monotonic() < deadline, "送信が終わりません"
+        time.sleep(0.01)
+
+
+def test_identical_lines_are_saved_separately(notion_env, clip_daemon):
+    # 同じ秒に同じ内容の行が続いても、それぞれ1件として保存する
+    stream = io.BytesIO(encode_clip("same line") * 2 + encode_clip("other"))
+
+    assert clip_daemon.ingest(stream) == (3, None)
+    wait_until_sent(clip_daemon.capture_queue)
+
+    assert len(notion_env.pages) == 3
+    stats = clip_daemon.stats()
+    assert stats["received"] == 3
+    assert stats["skipped"] == 0
+    # 送信箱にもそれぞれ別のクリップとして残る
+    sent = clip_daemon.outbox._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'sent'").fetchone()[0]
+    assert sent == 3
+
+
+def test_skipped_clip_is_not_counted(clip_daemon, monkeypatch):
+    monkeypatch.setattr(clip_daemon.capture_queue, "submit", lambda *args, **kwargs: None)
+
+    assert clip_daemon.ingest(io.BytesIO(encode_clip("sent"))) == (0, None)
+    assert clip_daemon.stats()["received"] == 0
+    assert clip_daemon.stats()["skipped"] == 1
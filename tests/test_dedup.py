@@ -0,0 +1,17 @@
+from dedup import DedupIndex
+
+
+def test_forget_allows_resaving(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.json")
+    index.record("rejected")
+    index.record("saved")
+    index.set_page("saved", "page-1")
+
+    index.forget("rejected")
+
+    assert index.lookup("rejected") is None
+    assert index.lookup("saved")["page_id"] == "page-1"
+    # 再起動後も取り消したままになる
+    reloaded = DedupIndex(tmp_path / "dedup.json")
+    assert reloaded.lookup("rejected") is None
+    assert reloaded.lookup("saved")["page_id"] == "page-1"
@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+from capture_queue import CaptureItem, CaptureQueue
+from notion_api import NotionAPI
+from outbox import Outbox, OutboxReplayer
+from rate_limit import ThrottledClient
+from schema_cache import SchemaCache
+
+
+@pytest.fixture
+def notion_api(notion_env, tmp_path, monkeypatch):
+    monkeypatch.delenv("STORAGE_MODE", raising=False)
+    # 再送の待ち時間は実際には待たない
+    client = ThrottledClient(
+        {"auth": "secret_test", "base_url": notion_env.base_url},
+        sleep=lambda seconds: None, max_retries=1
+    )
+    return NotionAPI(SchemaCache(tmp_path / "schema_cache.json"), client=client)
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db")
+    yield outbox
+    outbox.close()
+
+
+def start_queue(notion_api, outbox):
+    capture_queue = CaptureQueue(
+        lambda item: notion_api.create_page(item.title, item.content), outbox=outbox
+    )
+    capture_queue.start()
+    return capture_queue
+
+
+def wait_until_sent(capture_queue, timeout=10):
+    """積んだクリップの送信（成功・失敗）が終わるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while capture_queue.outstanding():
+        assert time.monotonic() < deadline, "送信が終わりません"
+        time.sleep(0.01)
+
+
+def replayer(outbox, capture_queue):
+    return OutboxReplayer(outbox, capture_queue, probe=lambda: True)
+
+
+def test_offline_clips_are_replayed(notion_env, notion_api, outbox):
+    capture_queue = start_queue(notion_api, outbox)
+    notion_env.set_offline()
+
+    capture_queue.submit("first", "2026-01-01 10:00:00")
+    capture_queue.submit("second", "2026-01-01 10:00:01")
+    wait_until_sent(capture_queue)
+
+    assert notion_env.pages == []
+    assert capture_queue.stats()["failed"] == 2
+    assert outbox.count_pending() == 2
+
+    notion_env.set_offline(False)
+    assert replayer(outbox, capture_queue).replay_now() == 2
+    wait_until_sent(capture_queue)
+
+    assert len(notion_env.pages) == 2
+    assert outbox.count_pending() == 0
+    capture_queue.stop(timeout=5)
+
+
+def test_failed_clip_is_replayed_once(notion_env, notion_api, outbox):
+    capture_queue = start_queue(notion_api, outbox)
+    notion_api.test_connection()
+    notion_env.fail_next(count=2)
+
+    capture_queue.submit("flaky", "2026-01-01 10:00:00")
+    wait_until_sent(capture_queue)
+    assert outbox.count_pending() == 1
+
+    outbox_replayer = replayer(outbox, capture_queue)
+    assert outbox_replayer.replay_now() == 1
+    wait_until_sent(capture_queue)
+    # 送信済みになったクリップはもう再送しない
+    assert outbox_replayer.replay_now() == 0
+
+    assert len(notion_env.pages) == 1
+    capture_queue.stop(timeout=5)
+
+
+def test_permanent_failure_is_not_replayed(notion_env, notion_api, outbox):
+    capture_queue = start_queue(notion_api, outbox)
+    notion_api.test_connection()
+    notion_env.fail_next(status=400, code='validation_error')
+
+    capture_queue.submit("invalid", "2026-01-01 10:00:00")
+    wait_until_sent(capture_queue)
+
+    assert outbox.count_pending() == 0
+    assert replayer(outbox, capture_queue).replay_now() == 0
+    assert notion_env.pages == []
+    capture_queue.stop(timeout=5)
+
+
+def test_pending_clips_survive_restart(notion_env, notion_api, tmp_path):
+    # 送信前にプロセスが終了しても、次回起動時に送信箱から再送される
+    outbox = Outbox(tmp_path / "outbox.db")
+    capture_queue = CaptureQueue(lambda item: notion_api.create_page(item.title, item.content), outbox=outbox)
+    capture_queue.submit("unsent", "2026-01-01 10:00:00")
+    outbox.close()
+
+    outbox = Outbox(tmp_path / "outbox.db")
+    capture_queue = start_queue(notion_api, outbox)
+    assert replayer(outbox, capture_queue).replay_now() == 1
+    wait_until_sent(capture_queue)
+
+    assert len(notion_env.pages) == 1
+    # 送信済みのクリップをもう一度積んでも送らない
+    assert capture_queue.submit("unsent", "2026-01-01 10:00:00") is None
+    capture_queue.stop(timeout=5)
+    outbox.close()
+
+
+def test_queued_clip_is_not_queued_twice(notion_env, notion_api, outbox):
+    # 同じ時刻・同じ内容のクリップがまだ送信待ちなら、もう一度は積まない
+    capture_queue = CaptureQueue(lambda item: notion_api.create_page(item.title, item.content), outbox=outbox)
+
+    assert capture_queue.submit("same", "2026-01-01 10:00:00") is not None
+    assert capture_queue.submit("same", "2026-01-01 10:00:00") is None
+    assert capture_queue.depth() == 1
+
+    capture_queue.start()
+    wait_until_sent(capture_queue)
+    assert len(notion_env.pages) == 1
+    assert outbox.count_pending() == 0
+    capture_queue.stop(timeout=5)
+
+
+def test_prune_removes_old_failed_clips(outbox):
+    for content in ("sent", "failed", "pending"):
+        outbox.add(CaptureItem(content, "2026-01-01 10:00:00"))
+    outbox.mark_sent(CaptureItem("sent", "2026-01-01 10:00:00").key)
+    outbox.mark_failed(CaptureItem("failed", "2026-01-01 10:00:00").key, "validation_error", permanent=True)
+
+    outbox.prune(retention=-1)
+
+    rows = outbox._conn.execute("SELECT content FROM outbox").fetchall()
+    assert rows == [("pending",)]
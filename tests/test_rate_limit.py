@@ -0,0 +1,112 @@
+import pytest
+from notion_client.errors import APIResponseError
+
+from rate_limit import ThrottledClient, TokenBucket, load_rate_limit
+
+
+class FakeClock:
+    """sleep で進む時計（待ち時間を実際には待たずに記録する）"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.waits = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+
+
+def make_client(fake_notion, clock=None, bucket=None, **options):
+    clock = clock or FakeClock()
+    client = ThrottledClient(
+        {"auth": "secret_test", "base_url": fake_notion.base_url},
+        bucket=bucket or TokenBucket(1000, clock=clock), sleep=clock.sleep, **options
+    )
+    return client, clock.waits
+
+
+def create_page(client):
+    return client.pages.create(
+        parent={"database_id": "test-db"},
+        properties={"日付": {"title": [{"text": {"content": "clip"}}]}},
+    )
+
+
+def test_429_waits_for_retry_after(fake_notion):
+    client, waits = make_client(fake_notion)
+    fake_notion.rate_limit_next(count=2, retry_after=3)
+
+    create_page(client)
+
+    assert waits == [3.0, 3.0]
+    assert len(fake_notion.pages) == 1
+    stats = client.stats()
+    assert stats["requests"] == 3
+    assert stats["rate_limited"] == 2
+    assert stats["retries"] == 2
+    assert stats["retry_wait"] == 6.0
+
+
+def test_429_pauses_shared_bucket(fake_notion):
+    # 429 を受けたら、同じバケットを使うほかのクライアントも Retry-After まで待つ
+    # （client の待ちでは時計を進めないので、other の送信時にはまだ止まっている）
+    clock = FakeClock()
+    bucket = TokenBucket(1000, clock=clock)
+    client, _ = make_client(fake_notion, bucket=bucket)
+    other, other_waits = make_client(fake_notion, clock=clock, bucket=bucket)
+    fake_notion.rate_limit_next(retry_after=5)
+
+    create_page(client)
+    create_page(other)
+
+    assert other_waits == [5.0]
+    assert bucket.reserve() == 0
+
+
+def test_429_without_retry_after_uses_backoff(fake_notion):
+    client, waits = make_client(fake_notion, backoff_base=0.5)
+    fake_notion.fail_next(status=429, code='rate_limited')
+
+    create_page(client)
+
+    assert len(waits) == 1
+    assert 0.25 <= waits[0] <= 0.5
+    assert client.stats()["rate_limited"] == 1
+
+
+def test_429_gives_up_after_max_retries(fake_notion):
+    client, waits = make_client(fake_notion, max_retries=2)
+    fake_notion.rate_limit_next(count=3, retry_after=1)
+
+    with pytest.raises(APIResponseError) as error:
+        create_page(client)
+
+    assert error.value.status == 429
+    assert waits == [1.0, 1.0]
+    assert fake_notion.pages == []
+
+
+def test_500_is_not_resent_for_writes(fake_notion):
+    # 書き込みは処理済みかもしれないので、500 では再送しない
+    client, waits = make_client(fake_notion)
+    fake_notion.fail_next(status=500, code='internal_server_error')
+
+    with pytest.raises(APIResponseError):
+        create_page(client)
+
+    assert waits == []
+    assert client.stats()["retries"] == 0
+
+
+@pytest.mark.parametrize("value", ["0", "-2", "abc"])
+def test_load_rate_limit_rejects_invalid_values(monkeypatch, value):
+    monkeypatch.setenv("NOTION_RATE_LIMIT", value)
+    assert load_rate_limit() == 3.0
+
+
+def test_load_rate_limit(monkeypatch):
+    monkeypatch.setenv("NOTION_RATE_LIMIT", "2.5")
+    assert load_rate_limit() == 2.5
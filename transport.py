@@ -0,0 +1,254 @@
+import os
+import threading
+import time
+
+import httpx
+
+from metrics import metrics
+from rate_limit import ThrottledAsyncClient, ThrottledClient, TokenBucket, load_rate_limit
+
+DEFAULT_BASE_URL = "https://api.notion.com"
+
+# 接続を使い回すため、アイドル中の接続も長めに残しておく
+POOL_LIMITS = httpx.Limits(
+    max_connections=10,
+    max_keepalive_connections=5,
+    keepalive_expiry=300,
+)
+
+# アイドル中に接続を温めておく間隔（秒）
+DEFAULT_WARMUP_INTERVAL = 45
+
+_transport = None
+_transport_lock = threading.Lock()
+
+# API キー（インテグレーション）ごとのトークンバケット
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def http2_enabled():
+    """NOTION_HTTP2=1 かつ h2 パッケージがあれば HTTP/2 を使う"""
+    if os.environ.get('NOTION_HTTP2', '').strip().lower() not in ('1', 'true', 'yes'):
+        return False
+    try:
+        import h2
+    except ImportError:
+        print("⚠️  HTTP/2 には h2 パッケージが必要です（HTTP/1.1 で接続します）")
+        return False
+    return True
+
+
+def get_transport():
+    """プロセス全体で共有する HTTP トランスポート（コネクションプール）"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = httpx.HTTPTransport(limits=POOL_LIMITS, http2=http2_enabled())
+        return _transport
+
+
+def rate_bucket(api_key):
+    """API キーごとに共有するトークンバケット
+
+    Notion のレート上限はインテグレーション単位なので、同じキーのクライアント
+    （同期版・非同期版・設定画面の接続テスト・インポートなど）はすべて同じ上限の中で送る。
+    NOTION_RATE_LIMIT を変更した場合は新しいバケットを作る。
+    """
+    rate = load_rate_limit()
+    with _buckets_lock:
+        bucket = _buckets.get(api_key)
+        if bucket is None or bucket.rate != rate:
+            bucket = _buckets[api_key] = TokenBucket(rate)
+        return bucket
+
+
+def create_http_client():
+    """共有プールを使う httpx.Client を作成
+
+    Notion クライアントはヘッダー（認証）を httpx.Client に直接設定するため、
+    httpx.Client 自体は API キーごとに分け、接続を持つトランスポートだけを共有する。
+    """
+    return httpx.Client(
+        transport=get_transport(),
+        event_hooks={"request": [_attach_trace]},
+    )
+
+
+def create_notion_client(api_key, **options):
+    """共有プール・レート制限付きの Notion クライアントを作成
+
+    NOTION_BASE_URL はローカルの検証用サーバーに向ける場合のみ指定する。
+    """
+    options = dict(options, auth=api_key)
+    base_url = os.environ.get('NOTION_BASE_URL')
+    if base_url:
+        options.setdefault("base_url", base_url)
+    return ThrottledClient(options, client=create_http_client(), bucket=rate_bucket(api_key))
+
+
+def create_async_transport(max_connections=None):
+    """非同期クライアント用のコネクションプール
+
+    接続は作成したイベントループに結び付くため、プロセス全体ではなく
+    ループ（AsyncNotionEngine）ごとに1つ作って共有する。
+    """
+    limits = POOL_LIMITS
+    if max_connections and max_connections > POOL_LIMITS.max_connections:
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=POOL_LIMITS.keepalive_expiry,
+        )
+    return httpx.AsyncHTTPTransport(limits=limits, http2=http2_enabled())
+
+
+def create_async_notion_client(api_key, transport=None, **options):
+    """create_notion_client の非同期版（notion_client.AsyncClient）"""
+    options = dict(options, auth=api_key)
+    base_url = os.environ.get('NOTION_BASE_URL')
+    if base_url:
+        options.setdefault("base_url", base_url)
+    http_client = httpx.AsyncClient(
+        transport=transport or create_async_transport(),
+        event_hooks={"request": [_attach_async_trace]},
+    )
+    return ThrottledAsyncClient(options, client=http_client, bucket=rate_bucket(api_key))
+
+
+class TransportStats:
+    """接続の確立（DNS+TCP+TLS）とリクエスト（送信〜応答ヘッダー受信）の時間を集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.connect_time = 0.0
+        self.tls_time = 0.0
+        self.requests = 0
+        self.request_time = 0.0
+        self.last_connect = None
+        self.last_request = None
+        self.last_activity = 0.0
+
+    def record(self, connect=None, tls=None, request=None):
+        metrics.observe("connect", connect)
+        metrics.observe("http_request", request)
+        with self._lock:
+            if connect is not None:
+                self.connects += 1
+                self.connect_time += connect
+                self.last_connect = connect
+            if tls is not None:
+                self.tls_time += tls
+            if request is not None:
+                self.requests += 1
+                self.request_time += request
+                self.last_request = request
+            self.last_activity = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "connect_time": self.connect_time,
+                "tls_time": self.tls_time,
+                "avg_connect": self.connect_time / self.connects if self.connects else None,
+                "last_connect": self.last_connect,
+                "requests": self.requests,
+                "request_time": self.request_time,
+                "avg_request": self.request_time / self.requests if self.requests else None,
+                "last_request": self.last_request,
+                # 新しい接続を張らずに済んだ割合
+                "reuse_ratio": 1 - self.connects / self.requests if self.requests else None,
+            }
+
+
+transport_stats = TransportStats()
+
+
+class _RequestTrace:
+    """httpcore の trace 拡張でリクエストごとの時刻を記録する"""
+
+    def __init__(self):
+        self.started = {}
+        self._tcp = None
+
+    def __call__(self, event_name, info):
+        now = time.perf_counter()
+        stage, _, state = event_name.rpartition(".")
+        if state == "started":
+            self.started[stage] = now
+            return
+        if state != "complete":
+            return
+
+        if stage == "connection.connect_tcp":
+            self._tcp = now - self.started.get(stage, now)
+        elif stage == "connection.start_tls":
+            tls = now - self.started.get(stage, now)
+            transport_stats.record(connect=(self._tcp or 0.0) + tls, tls=tls)
+            self._tcp = None
+        elif stage.endswith("send_request_headers"):
+            # TLS なし（ローカルの検証用サーバーなど）の接続はここで確定する
+            if self._tcp is not None:
+                transport_stats.record(connect=self._tcp)
+                self._tcp = None
+        elif stage.endswith("receive_response_headers"):
+            sent = self.started.get(stage.replace("receive_response_headers", "send_request_headers"))
+            if sent is not None:
+                transport_stats.record(request=now - sent)
+
+
+class _AsyncRequestTrace(_RequestTrace):
+    """非同期トランスポートでは trace 拡張も async 関数である必要がある"""
+
+    async def __call__(self, event_name, info):
+        super().__call__(event_name, info)
+
+
+def _attach_trace(request):
+    request.extensions["trace"] = _RequestTrace()
+
+
+async def _attach_async_trace(request):
+    request.extensions["trace"] = _AsyncRequestTrace()
+
+
+class ConnectionWarmer:
+    """アイドル中も定期的に軽いリクエストを送り、接続（DNS+TCP+TLS）を温めておく
+
+    長時間アイドルの後のホットキーでも接続確立の時間がかからないようにする。
+    認証不要の HEAD リクエストなのでレート制限の対象にはならない。
+    """
+
+    def __init__(self, base_url=None, interval=None):
+        self.base_url = base_url or os.environ.get('NOTION_BASE_URL') or DEFAULT_BASE_URL
+        if interval is None:
+            interval = float(os.environ.get('NOTION_WARMUP_INTERVAL', DEFAULT_WARMUP_INTERVAL))
+        self.interval = interval
+        self._client = create_http_client()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="ConnectionWarmer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def warm(self):
+        """接続を1本確立（または維持）する"""
+        try:
+            self._client.head(f"{self.base_url}/v1/", timeout=10)
+        except httpx.HTTPError:
+            pass
+
+    def _run(self):
+        self.warm()
+        while not self._stop.wait(self.interval):
+            # 直前に通信していれば接続は生きているので何もしない
+            if time.monotonic() - transport_stats.last_activity >= self.interval:
+                self.warm()
@@ -0,0 +1,533 @@
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dedup import hash_text
+from period_pages import load_storage_mode
+
+# 子プロセスで同時に実行する呼び出しの数
+WORKER_THREADS = 4
+
+# 1回の呼び出しを待つ最大時間（秒）。過ぎたら子プロセスが止まっているとみなして再起動する
+DEFAULT_CALL_TIMEOUT = 600
+
+# 統計情報の取得を待つ最大時間（秒）
+STATS_TIMEOUT = 5
+
+# 作成済みのページを探すときに比べる本文の先頭の文字数
+MATCH_CHARS = 200
+
+# 同じクリップの送信中に子プロセスが落ちた回数の上限（超えたら再送しない失敗として返す）
+MAX_CALL_ATTEMPTS = 2
+
+# 結果を受け取る前に子プロセスが落ちても、そのまま送り直してよいメソッド（Notion 側に重複を作らない）
+IDEMPOTENT_METHODS = ('test_connection', 'touch_page')
+
+# 子プロセスを再起動するまでの待ち時間（秒）。起動直後に落ち続ける場合は倍にしていく
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+# これより長く動いていた子プロセスが落ちた場合は、待ち時間を初期値に戻す
+STABLE_SECONDS = 60
+
+
+def load_uploader_config():
+    """環境変数からアップロード用プロセスの設定を読み込み（UPLOADER_PROCESS=1 で有効）"""
+    return {
+        "enabled": os.environ.get('UPLOADER_PROCESS', '').strip().lower() in ('1', 'true', 'yes', 'on'),
+        "call_timeout": float(os.environ.get('UPLOADER_CALL_TIMEOUT', DEFAULT_CALL_TIMEOUT)),
+    }
+
+
+class UploaderError(Exception):
+    """子プロセスへの呼び出しの失敗（retryable なら送信箱から再送してよい）"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class _Call:
+    """結果を待っている呼び出し（子プロセスが落ちたら message を送り直す）"""
+
+    __slots__ = ('message', 'future', 'attempts', 'key')
+
+    def __init__(self, message, key=None):
+        self.message = message
+        self.future = Future()
+        self.attempts = 0
+        # ページを作る・追記する呼び出しの送信内容のキー（_call_key、送り直さない呼び出しを見分ける）
+        self.key = key
+
+
+def _call_key(target, method, args):
+    """ページを作る・追記する呼び出しの送信内容のキー（それ以外は None）
+
+    大きなクリップでもコピーしないよう、タイトルと本文を順にハッシュに流し込む。
+    """
+    if method in IDEMPOTENT_METHODS:
+        return None
+    digest = hash_text(repr((sorted((target or {}).items()), method)) + '\0')
+    clips = args[0] if method in ('create_batch_page', 'append_clips') else [args[:2]]
+    for title, content in clips:
+        digest = hash_text(content, hash_text(f"{title}\0", digest))
+    return digest.hexdigest()
+
+
+class UploaderProcess:
+    """Notion への送信を行う子プロセス
+
+    notion_client・httpx とコネクションプールは子プロセスだけが持ち、メニューバーのプロセスは
+    呼び出しをパイプで送って結果を待つだけにする。大きなクリップの送信やネットワークの待ちで
+    子プロセスが止まっても、メニューバーとホットキーには影響しない。
+
+    子プロセスが異常終了したら作り直し、結果を受け取っていない呼び出しのうち、接続確認などの
+    重複しない呼び出しだけを送り直す。ページを作る・追記する呼び出しは Notion 側で完了していた
+    かもしれないので送り直さず、retryable の失敗として返して送信箱からの再送に任せる。
+    再送のときは、子プロセスが同じタイトル・本文のページがすでにあるか確認してから作る。
+    同じクリップの送信中に MAX_CALL_ATTEMPTS 回落ちた場合は、そのクリップが原因とみなして
+    retryable=False の失敗として返す（送信箱には失敗として残り、自動では再送しない）。
+    """
+
+    def __init__(self, engine='sync', concurrency=4, call_timeout=DEFAULT_CALL_TIMEOUT, threads=WORKER_THREADS):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.call_timeout = call_timeout
+        self.threads = threads
+        # macOS では fork した子プロセスで Cocoa が使えないため、常に spawn で起動する
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._conn = None
+        self._process = None
+        self._started_at = 0.0
+        self._restart_delay = RESTART_DELAY
+        self._closing = False
+        # 呼び出しのタイムアウトで子プロセスを止めた（落ちたのはほかの呼び出しのせいではない）
+        self._killed_for_timeout = False
+        # 結果を受け取れなかった（Notion 側で完了したか分からない）送信内容のキーと、落ちた回数
+        self._uncertain = {}
+        # 子プロセスで動かすバックグラウンド処理（再起動したら起動し直す）
+        self._services = None
+
+        # 統計情報
+        self.calls = 0
+        self.restarts = 0
+        self.resent = 0
+        self.deferred = 0
+        self.abandoned = 0
+
+    def start(self):
+        with self._lock:
+            self._spawn()
+        return self
+
+    def call(self, target, method, *args):
+        """子プロセスの NotionAPI（target の保存先）のメソッドを呼んで結果を返す"""
+        with self._lock:
+            uncertain = bool(self._uncertain)
+        # 結果を受け取れなかった送信の再送なら、子プロセスで作成済みでないか確かめてから送る
+        key = _call_key(target, method, args) if uncertain else None
+        with self._lock:
+            reconcile = key in self._uncertain
+        return self._request('call', (target, method, args, reconcile), self.call_timeout, key=key)
+
+    def start_services(self, mirror=False):
+        """子プロセスで接続の維持（とローカルミラーの同期）を始める"""
+        services = {"mirror": mirror}
+        with self._lock:
+            self._services = services
+        self._request('services', services, STATS_TIMEOUT, restart_on_timeout=False)
+
+    def remote_stats(self):
+        """子プロセスの統計情報（レート制限・接続・並行送信）"""
+        return self._request('stats', (), STATS_TIMEOUT, restart_on_timeout=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": self._process.pid if self._process else None,
+                "in_flight": len(self._pending),
+                "calls": self.calls,
+                "restarts": self.restarts,
+                "resent": self.resent,
+                "deferred": self.deferred,
+                "abandoned": self.abandoned,
+            }
+
+    def close(self, timeout=10):
+        """実行中の呼び出しが終わるのを待ってから子プロセスを終了する"""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            process = self._process
+            self._send(('stop', 0, ()))
+        if process is not None:
+            process.join(timeout)
+            if process.is_alive():
+                print("⚠️  アップロード用のプロセスが終了しないため停止します")
+                process.terminate()
+                process.join(1)
+        self._fail_pending(UploaderError("アップロード用のプロセスを終了しました"))
+
+    def _request(self, kind, payload, timeout, restart_on_timeout=True, key=None):
+        with self._lock:
+            if self._closing:
+                raise UploaderError("アップロード用のプロセスを終了しました")
+            call_id = next(self._ids)
+            call = self._pending[call_id] = _Call((kind, call_id, payload), key)
+            self.calls += 1
+            # 送れなかった（子プロセスが落ちていた）場合は、再起動したときに送り直される
+            self._send(call.message)
+
+        try:
+            return call.future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(call_id, None)
+                process = self._process
+            retryable = True
+            if restart_on_timeout and process is not None:
+                print(f"✗ 送信が{timeout:.0f}秒を超えたため、アップロード用のプロセスを再起動します")
+                with self._lock:
+                    if process is self._process:
+                        self._killed_for_timeout = True
+                    retryable = self._mark_uncertain(call)
+                process.kill()
+            raise UploaderError(
+                f"アップロード用のプロセスが{timeout:.0f}秒以内に応答しませんでした", retryable=retryable
+            )
+
+    def _spawn(self):
+        """子プロセスを起動（_lock を持って呼ぶ）"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.engine, self.concurrency, self.threads),
+            name="NotionUploader",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._process = process
+        self._started_at = time.monotonic()
+        threading.Thread(
+            target=self._receive, args=(parent_conn, process), name="UploaderReceiver", daemon=True
+        ).start()
+
+    def _send(self, message):
+        try:
+            self._conn.send(message)
+        except (OSError, ValueError):
+            # 子プロセスが落ちている（受信スレッドが再起動する）
+            pass
+
+    def _receive(self, conn, process):
+        """子プロセスからの結果を受け取り、待っている呼び出しに渡す"""
+        while True:
+            try:
+                kind, call_id, value = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                call = self._pending.pop(call_id, None)
+                if call is not None and call.key is not None:
+                    # 子プロセスで最後まで実行された（成功・失敗が分かった）
+                    self._uncertain.pop(call.key, None)
+            if call is None:
+                # タイムアウトで諦めた呼び出し・結果を待たない呼び出し
+                continue
+            if kind == 'result':
+                call.future.set_result(value)
+            else:
+                call.future.set_exception(UploaderError(value))
+        conn.close()
+        self._restart(process)
+
+    def _restart(self, process):
+        """子プロセスが終了したら作り直し、結果を受け取っていない呼び出しを送り直す"""
+        process.join(1)
+        with self._lock:
+            if self._closing or process is not self._process:
+                return
+            if time.monotonic() - self._started_at < STABLE_SECONDS:
+                delay = self._restart_delay
+                self._restart_delay = min(self._restart_delay * 2, MAX_RESTART_DELAY)
+            else:
+                delay = self._restart_delay = RESTART_DELAY
+        print(f"✗ アップロード用のプロセスが終了しました（終了コード: {process.exitcode}）。"
+              f"{delay:g}秒後に再起動します")
+        time.sleep(delay)
+
+        failed = []
+        with self._lock:
+            if self._closing:
+                return
+            self._spawn()
+            self.restarts += 1
+            # タイムアウトで止めた場合、原因はタイムアウトした呼び出し（すでに失敗として返した）なので
+            # 巻き込まれたほかの呼び出しは落ちた回数に数えない
+            killed_for_timeout, self._killed_for_timeout = self._killed_for_timeout, False
+            for call_id, call in list(self._pending.items()):
+                if call.message[0] == 'call' and call.message[2][1] not in IDEMPOTENT_METHODS:
+                    # Notion 側で完了していたかもしれないので送り直さず、送信箱からの再送に任せる
+                    del self._pending[call_id]
+                    failed.append((call, self._mark_uncertain(call, counted=not killed_for_timeout)))
+                    continue
+                if not killed_for_timeout:
+                    call.attempts += 1
+                if call.attempts >= MAX_CALL_ATTEMPTS:
+                    del self._pending[call_id]
+                    failed.append((call, False))
+                    continue
+                self._send(call.message)
+                self.resent += 1
+            self.deferred += sum(1 for _, retryable in failed if retryable)
+            self.abandoned += sum(1 for _, retryable in failed if not retryable)
+            if self._services is not None:
+                # 結果は待たない（受信スレッドは知らない番号の結果を読み捨てる）
+                self._send(('services', next(self._ids), self._services))
+            resent = len(self._pending)
+        for call, retryable in failed:
+            if retryable:
+                message = "送信中にアップロード用のプロセスが終了しました（送信箱から再送します）"
+            else:
+                message = f"送信中にアップロード用のプロセスが{MAX_CALL_ATTEMPTS}回続けて終了したため、送信を中止しました"
+            call.future.set_exception(UploaderError(message, retryable=retryable))
+        print(f"✓ アップロード用のプロセスを再起動しました（送り直し: {resent}件 / 送信箱から再送: {len(failed)}件）")
+
+    def _mark_uncertain(self, call, counted=True):
+        """結果の分からないページ作成・追記を記録し、まだ再送してよいかを返す（_lock を持って呼ぶ）
+
+        counted なら、この呼び出しの途中で子プロセスが落ちたものとして回数に数える。
+        """
+        if call.message[0] != 'call':
+            return True
+        target, method, args, _ = call.message[2]
+        if call.key is None:
+            call.key = _call_key(target, method, args)
+        if call.key is None:
+            return True
+        crashes = self._uncertain.get(call.key, 0) + (1 if counted else 0)
+        self._uncertain[call.key] = crashes
+        return crashes < MAX_CALL_ATTEMPTS
+
+    def _fail_pending(self, error):
+        with self._lock:
+            calls = list(self._pending.values())
+            self._pending.clear()
+        for call in calls:
+            if not call.future.done():
+                call.future.set_exception(error)
+
+
+class RemoteNotionAPI:
+    """UploaderProcess の子プロセスで動く NotionAPI の代わり（同じメソッド・同じ形式の結果）
+
+    保存先の情報（database_id・storage_mode）はこのプロセスの設定から決め、通信はすべて
+    子プロセスで行う。owner の RemoteNotionAPI を閉じると子プロセスも終了する。
+    """
+
+    def __init__(self, process, target=None, owner=False):
+        self.process = process
+        self.target = target or {}
+        self._owner = owner
+        self.database_id = self.target.get('database_id') or os.environ.get('NOTION_DATABASE_ID')
+        self.storage_mode = load_storage_mode()
+
+    def create_page(self, title, content, attachments=None):
+        return self._result('create_page', title, content, attachments)
+
+    def create_batch_page(self, clips):
+        return self._result('create_batch_page', clips)
+
+    def append_clips(self, clips, attachments=None):
+        return self._result('append_clips', clips, attachments)
+
+    def touch_page(self, page_id, title):
+        return self._result('touch_page', page_id, title)
+
+    def test_connection(self):
+        return self._result('test_connection')
+
+    def for_target(self, **target):
+        """同じ子プロセスで別の保存先に送る RemoteNotionAPI（振り分けルール用）"""
+        return RemoteNotionAPI(self.process, target)
+
+    def start_services(self, mirror=False):
+        self.process.start_services(mirror)
+
+    def stats(self):
+        return self.process.stats()
+
+    def remote_stats(self):
+        return self.process.remote_stats()
+
+    def close(self):
+        if self._owner:
+            self.process.close()
+
+    def _result(self, method, *args):
+        try:
+            return self.process.call(self.target, method, *args)
+        except UploaderError as e:
+            return {"success": False, "error": str(e), "retryable": e.retryable}
+
+
+def create_uploader_api(engine='sync', concurrency=4, call_timeout=DEFAULT_CALL_TIMEOUT):
+    """アップロード用のプロセスを起動し、既定の保存先の RemoteNotionAPI を返す"""
+    process = UploaderProcess(engine, concurrency, call_timeout).start()
+    return RemoteNotionAPI(process, owner=True)
+
+
+class _Worker:
+    """子プロセス側: 親から届いた呼び出しをスレッドプールで実行し、結果を返す"""
+
+    def __init__(self, conn, engine, concurrency, threads):
+        self.conn = conn
+        self.engine = engine
+        self.concurrency = concurrency
+        self._send_lock = threading.Lock()
+        self._apis_lock = threading.Lock()
+        self._apis = {}
+        self._services = []
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="UploaderCall")
+
+    def run(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                # 親プロセスが終了した
+                break
+            if message[0] == 'stop':
+                break
+            self._executor.submit(self._handle, message)
+        self._executor.shutdown(wait=True)
+        for service in self._services:
+            service.stop()
+        for notion_api in self._apis.values():
+            if hasattr(notion_api, 'close'):
+                notion_api.close()
+
+    def _handle(self, message):
+        kind, call_id, payload = message
+        try:
+            if kind == 'call':
+                target, method, args, reconcile = payload
+                notion_api = self._api(target)
+                value = reconcile and self._find_created(notion_api, method, args)
+                if not value:
+                    value = getattr(notion_api, method)(*args)
+            elif kind == 'services':
+                value = self._start_services(**payload)
+            elif kind == 'stats':
+                value = self._stats()
+            else:
+                raise ValueError(f"不明な呼び出しです: {kind}")
+            response = ('result', call_id, value)
+        except Exception as e:
+            response = ('error', call_id, f"{type(e).__name__}: {e}")
+        with self._send_lock:
+            try:
+                self.conn.send(response)
+            except (OSError, ValueError):
+                pass
+
+    def _find_created(self, notion_api, method, args):
+        """前回の子プロセスが結果を返す前に作成していたページ（見つからなければ None）
+
+        確かめられるのはページ単位で保存する create_page だけ。追記・まとめページはそのまま送る。
+        タイトル（キャプチャ時刻）が同じページのうち、「メモ」が本文の先頭と一致するものを探す。
+        """
+        if method != 'create_page' or notion_api.storage_mode != 'page':
+            return None
+        api = getattr(notion_api, 'api', notion_api)
+        title_property = api.title_property
+        if title_property is None:
+            # 起動し直したばかりの子プロセスでは、キャッシュ（なければ接続確認）から構造を取る
+            schema = api._cached_schema()
+            if schema is None and notion_api.test_connection()['success']:
+                schema = api._cached_schema()
+            title_property = (schema or {}).get("title_property")
+        if title_property is None:
+            return None
+        title, content = args[:2]
+        from mirror import sync_client_for
+        try:
+            response = sync_client_for(notion_api).databases.query(
+                database_id=notion_api.database_id,
+                filter={"property": title_property, "title": {"equals": title}},
+                page_size=10,
+            )
+        except Exception as e:
+            print(f"⚠️  作成済みのページを確認できませんでした（そのまま送信します）: {e}")
+            return None
+        head = content[:MATCH_CHARS]
+        for page in response.get("results", []):
+            memo = page.get("properties", {}).get(api.memo_property_name, {}).get("rich_text", [])
+            if "".join(item.get("plain_text", "") for item in memo)[:MATCH_CHARS] == head:
+                print(f"✓ 前回の送信で作成済みのページを使います: {title}")
+                return {"success": True, "page_id": page["id"], "url": page.get("url")}
+        return None
+
+    def _api(self, target):
+        """保存先ごとの NotionAPI（振り分け先は既定の保存先とクライアントを共有する）"""
+        key = tuple(sorted((name, repr(value)) for name, value in (target or {}).items()))
+        with self._apis_lock:
+            notion_api = self._apis.get(key)
+            if notion_api is None:
+                if key:
+                    notion_api = self._default_api().for_target(**target)
+                else:
+                    notion_api = self._default_api()
+                self._apis[key] = notion_api
+            return notion_api
+
+    def _default_api(self):
+        # _apis_lock を持って呼ぶ
+        notion_api = self._apis.get(())
+        if notion_api is None:
+            from notion_api import create_notion_api
+            notion_api = self._apis[()] = create_notion_api(self.engine, self.concurrency)
+        return notion_api
+
+    def _start_services(self, mirror=False):
+        if self._services:
+            return True
+        from transport import ConnectionWarmer
+        warmer = ConnectionWarmer()
+        warmer.start()
+        self._services.append(warmer)
+        if mirror:
+            from mirror import Mirror, MirrorSync, MirrorSyncer, sync_client_for
+            notion_api = self._api(None)
+            syncer = MirrorSyncer(MirrorSync(sync_client_for(notion_api), notion_api.database_id, Mirror()))
+            syncer.start()
+            self._services.append(syncer)
+        return True
+
+    def _stats(self):
+        from transport import transport_stats
+        notion_api = self._api(None)
+        stats = {
+            "rate_limit": notion_api.client.stats(),
+            "transport": transport_stats.snapshot(),
+        }
+        if hasattr(notion_api, 'stats'):
+            stats["engine"] = notion_api.stats()
+        return stats
+
+
+def _worker_main(conn, engine, concurrency, threads):
+    """子プロセスの入口（終了は親が決めるので、Ctrl+C は無視する）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _Worker(conn, engine, concurrency, threads).run()